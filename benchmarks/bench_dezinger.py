@@ -0,0 +1,56 @@
+"""Outliers removal with the local mean detector against the median filter used before
+
+EXAMPLE
+    python bench_dezinger.py 2048 2048 64 2  -  n, nz, nproj, radius
+"""
+
+import sys
+import time
+import numpy as np
+from tomostream import backend
+
+
+def median_dezinger(bk, data, r):
+    """Previous implementation: median filter of the whole chunk and replacement with fancy indexing"""
+
+    fdata = bk.ndimage.median_filter(data, [1, r, r])
+    ids = bk.xp.where(bk.xp.abs(fdata-data) > 0.5*bk.xp.abs(fdata))
+    data[ids] = fdata[ids]
+
+
+def run(bk, func, data, r, nrep=3):
+    """Best time of removing outliers, each repetition works with a fresh copy of the data"""
+
+    times = []
+    for _ in range(nrep):
+        d = bk.to_device(data)
+        bk.synchronize()
+        t = time.perf_counter()
+        func(d, r)
+        bk.synchronize()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+if __name__ == "__main__":
+    n, nz, nproj, r = [int(v) for v in sys.argv[1:5]] if len(sys.argv) > 4 else [1024, 1024, 32, 2]
+
+    rng = np.random.default_rng(0)
+    data = (100 + rng.random([nproj, nz, n])).astype('float32')
+    # outliers in 0.1% of pixels
+    data.flat[rng.integers(0, data.size, data.size // 1000)] = 1000
+    print(f'{n=}, {nz=}, {nproj=}, {r=}, data size {data.nbytes/1024**3:.2f} GB')
+
+    names = ['numpy', 'numba'] + (['cupy'] if backend.gpu_available() else [])
+    for name in names:
+        try:
+            bk = backend.get_backend(name)
+        except ImportError as e:
+            print(f'{name}: skipped ({e})')
+            continue
+        # compile (or load from cache) before timing
+        bk.kernels.dezinger(bk.to_device(data[:1]), r)
+        t_median = run(bk, lambda d, r: median_dezinger(bk, d, r), data, r, nrep=1)
+        t = run(bk, bk.kernels.dezinger, data, r)
+        print(f'{name}: median {t_median:.3f}s, {nproj/t_median:.1f} proj/s; '
+              f'local mean {t:.3f}s, {nproj/t:.1f} proj/s, speedup {t_median/t:.1f}')
@@ -0,0 +1,74 @@
+"""Scaling of the multi-core Numba back-projection kernels with the number of threads,
+and the fused kernel computing the three ortho-slices in one pass over projections
+
+EXAMPLE
+    python bench_kernels.py 1024 1024 512 1,2,4,8,16,32,64  -  n, nz, ntheta, thread counts
+"""
+
+import sys
+import time
+import numpy as np
+import numba
+from tomostream import kernels_cpu
+from tomostream import kernels_numba
+from tomostream import planes
+
+
+def run(kernels, data, theta, center, ids, nrep=3):
+    """Best time of computing all three ortho-slices"""
+
+    times = []
+    for _ in range(nrep):
+        t = time.perf_counter()
+        kernels.orthoz(data, theta, center, ids[2], 0)
+        kernels.orthoy(data, theta, center, ids[1], 0)
+        kernels.orthox(data, theta, center, ids[0], 0)
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def run_fused(kernels, data, theta, center, ids, nrep=3):
+    """Best time of computing all three ortho-slices by the fused kernel"""
+
+    [ntheta, nz, n] = data.shape
+    geometry = np.array([planes.ortho('orthoz', n, nz, ids[2], 0), planes.ortho('orthoy', n, nz, ids[1], 0),
+                         planes.ortho('orthox', n, nz, ids[0], 0)])
+    times = []
+    for _ in range(nrep):
+        t = time.perf_counter()
+        kernels.planes(data, theta, center, geometry, n, n)
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+if __name__ == "__main__":
+    n, nz, ntheta = [int(v) for v in sys.argv[1:4]] if len(sys.argv) > 3 else [512, 512, 256]
+    threads = [int(v) for v in sys.argv[4].split(',')] if len(sys.argv) > 4 else [1, 2, 4, 8, 16, 32, 64]
+    threads = [t for t in threads if t <= numba.config.NUMBA_NUM_THREADS]
+
+    data = np.random.random([ntheta, nz, n]).astype('float32')
+    theta = np.linspace(0, np.pi, ntheta, endpoint=False).astype('float32')
+    center = np.float32(n/2)
+    ids = [n//2, n//2, nz//2]
+    print(f'{n=}, {nz=}, {ntheta=}, data size {data.nbytes/1024**3:.2f} GB')
+
+    # compile (or load from cache) before timing
+    run(kernels_numba, data[:2], theta[:2], center, ids, nrep=1)
+    run_fused(kernels_numba, data[:2], theta[:2], center, ids, nrep=1)
+
+    t = run(kernels_cpu, data, theta, center, ids, nrep=1)
+    print(f'numpy: {t:.3f}s, {ntheta/t:.1f} proj/s')
+    t = run_fused(kernels_cpu, data, theta, center, ids, nrep=1)
+    print(f'numpy fused: {t:.3f}s, {ntheta/t:.1f} proj/s')
+    t = run_fused(kernels_numba, data, theta, center, ids)
+    print(f'numba fused, {numba.get_num_threads()} threads: {t:.3f}s, {ntheta/t:.1f} proj/s')
+    # speedup and parallel efficiency are computed with respect to the first thread count
+    tbase = None
+    for nthreads in threads:
+        numba.set_num_threads(nthreads)
+        t = run(kernels_numba, data, theta, center, ids)
+        if tbase is None:
+            tbase, nbase = t, nthreads
+        speedup = tbase/t
+        print(f'numba {nthreads} threads: {t:.3f}s, {ntheta/t:.1f} proj/s, '
+              f'speedup {speedup:.2f}, efficiency {speedup*nbase/nthreads:.2f}')
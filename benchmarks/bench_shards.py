@@ -0,0 +1,57 @@
+"""Scaling of angle-sharded backprojection with the number of worker processes
+
+EXAMPLE
+    python bench_shards.py 512 512 720 1,2,4,8 numpy  -  n, nz, ntheta, worker counts, backend
+"""
+
+import sys
+import time
+import numpy as np
+from tomostream import solver
+
+pars = {'center': np.float32(0), 'idx': np.int32(0), 'idy': np.int32(0), 'idz': np.int32(0),
+        'rotx': np.float32(0), 'roty': np.float32(0), 'rotz': np.float32(0),
+        'fbpfilter': 'Parzen', 'dezinger': 0,
+        'energy': np.float32(20), 'dist': np.float32(100), 'alpha': np.float32(0), 'pixelsize': np.float32(3)}
+
+
+def run(slv, data, theta, nrep=3):
+    """Best time of the full reconstruction of the buffer, and of an incremental update of 1/8 of it"""
+
+    ids = np.arange(slv.ntheta)
+    part = ids[:max(slv.ntheta//8, 1)]
+    tfull, tpart = [], []
+    for k in range(nrep):
+        # changing the center invalidates backprojection of all slices
+        pars_full = {**pars, 'center': pars['center']+k}
+        t = time.perf_counter()
+        slv.recon_optimized(data, theta, ids, pars_full)
+        tfull.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        slv.recon_optimized(data[part], theta[part], part, pars_full)
+        tpart.append(time.perf_counter() - t)
+    return min(tfull), min(tpart)
+
+
+if __name__ == "__main__":
+    n, nz, ntheta = [int(v) for v in sys.argv[1:4]] if len(sys.argv) > 3 else [512, 512, 720]
+    workers = [int(v) for v in sys.argv[4].split(',')] if len(sys.argv) > 4 else [1, 2, 4, 8]
+    backend = sys.argv[5] if len(sys.argv) > 5 else 'numpy'
+
+    data = np.random.randint(100, 1000, [ntheta, nz, n]).astype('uint16')
+    theta = np.linspace(0, 180, ntheta, endpoint=False).astype('float32')
+    pars.update(center=np.float32(n/2), idx=np.int32(n//2), idy=np.int32(n//2), idz=np.int32(nz//2))
+    print(f'{n=}, {nz=}, {ntheta=}, {backend=}')
+
+    tbase = None
+    for nworkers in workers:
+        slv = solver.Solver(ntheta, n, nz, pars, 'uint16', backend, workers=nworkers)
+        slv.set_flat(np.full([nz, n], 1100, dtype='float32'))
+        # warm up (compilation of kernels, start of workers)
+        slv.recon_optimized(data, theta, np.arange(ntheta), pars)
+        tfull, tpart = run(slv, data, theta)
+        slv.close()
+        if tbase is None:
+            tbase = tfull
+        print(f'{nworkers} workers: full {tfull:.3f}s ({ntheta/tfull:.1f} proj/s, speedup {tbase/tfull:.2f}), '
+              f'update of {max(ntheta//8, 1)} slots {tpart:.3f}s')
@@ -0,0 +1,155 @@
+"""Stages of the Solver on projections of the synthetic 3-D Shepp-Logan phantom,
+results are reported in projections/s and GB/s of float32 projections passing through the stage,
+and saved as JSON for comparing commits
+
+EXAMPLE
+    python bench_solver.py 512 512 720 uint16 numpy,numba bench.json  -  n, nz, ntheta, dtype, backends, output
+    python bench_solver.py 256,512 256 360,720 uint8,uint16 numpy  -  comma-separated values are combined
+    python bench_solver.py compare old.json new.json  -  speedup of stages between two runs
+"""
+
+import sys
+import time
+import json
+import itertools
+import platform
+import subprocess
+import numpy as np
+from tomostream import solver
+from tomostream import phantom
+
+pars = {'center': np.float32(0), 'idx': np.int32(0), 'idy': np.int32(0), 'idz': np.int32(0),
+        'rotx': np.float32(0), 'roty': np.float32(0), 'rotz': np.float32(0),
+        'fbpfilter': 'Parzen', 'dezinger': 0,
+        'energy': np.float32(20), 'dist': np.float32(100), 'alpha': np.float32(0), 'pixelsize': np.float32(3)}
+
+# parameters of stages that are skipped with default parameters
+stage_options = {'remove_outliers': {'dezinger': 2}, 'phase': {'alpha': np.float32(0.001)}}
+
+
+def best_time(slv, func, input=None, nrep=3):
+    """Best time of func() or func(copy of input), synchronized with the device.
+    Stages work in-place, so every repetition takes a fresh copy of the input made before timing"""
+
+    times = []
+    for _ in range(nrep):
+        args = [] if input is None else [input.copy()]
+        slv.bk.synchronize()
+        t = time.perf_counter()
+        func(*args)
+        slv.bk.synchronize()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def stage_times(slv, data, theta, nproj):
+    """Times of preprocessing stages and backprojection applied to nproj projections on the device"""
+
+    raw = slv.bk.to_device(data[:nproj].reshape(nproj, slv.nz, slv.n))
+    theta_gpu = slv.bk.to_device(theta[:nproj]*np.pi/180)
+    # inputs of stages: raw data for the dark-flat field correction, normalized data for the others
+    norm = raw.copy()
+    slv.darkflat_correction(norm)
+    filtered = norm.copy()
+    slv.minus_log(filtered)
+    slv.fbp_filter(filtered)
+    inputs = {'darkflat_correction': raw, 'remove_outliers': norm, 'phase': norm, 'minus_log': norm,
+              'fbp_filter': filtered}
+    times = {}
+    for stage, input in inputs.items():
+        slv.pars = {**pars, **stage_options.get(stage, {})}
+        times[stage] = best_time(slv, getattr(slv, stage), input)
+    slv.pars = pars
+    times['backprojection'] = best_time(slv, lambda: slv.backprojection(filtered, theta_gpu))
+    return times
+
+
+def recon_times(slv, data, theta):
+    """Times of reconstructing the whole buffer with preprocessing, and of the incremental update of 1/8 of it"""
+
+    ntheta = slv.ntheta
+    ids = np.arange(ntheta)
+    part = ids[:max(ntheta//8, 1)]
+    times = {'recon_full': [], 'recon_incremental': []}
+    for k in range(3):
+        # changing the filter invalidates preprocessing and backprojection of the whole buffer
+        pars_full = {**pars, 'fbpfilter': ['Parzen', 'Shepp-logan'][k % 2]}
+        slv.bk.synchronize()
+        t = time.perf_counter()
+        slv.recon_optimized(data, theta, ids, pars_full)
+        times['recon_full'].append(time.perf_counter() - t)
+        t = time.perf_counter()
+        slv.recon_optimized(data[part], theta[part], part, pars_full)
+        times['recon_incremental'].append(time.perf_counter() - t)
+    return {stage: min(t) for stage, t in times.items()}, {'recon_full': ntheta, 'recon_incremental': len(part)}
+
+
+def run(n, nz, ntheta, dtype, backend, nproj=64):
+    """Results for all stages with the given sizes, data type and backend"""
+
+    theta = np.linspace(0, 180, ntheta, endpoint=False).astype('float32')
+    data, dark, flat = phantom.projections(theta, n, nz, dtype, noise=0.01)
+    pars.update(center=np.float32(n/2), idx=np.int32(n//2), idy=np.int32(n//2), idz=np.int32(nz//2))
+    slv = solver.Solver(ntheta, n, nz, pars, dtype, backend)
+    slv.set_dark(dark)
+    slv.set_flat(flat)
+    # warm up (compilation of kernels, FFT plans, filters)
+    slv.recon_optimized(data, theta, np.arange(ntheta), pars)
+    nproj = min(nproj, ntheta)
+    times = stage_times(slv, data, theta, nproj)
+    counts = dict.fromkeys(times, nproj)
+    rtimes, rcounts = recon_times(slv, data, theta)
+    times.update(rtimes)
+    counts.update(rcounts)
+    slv.close()
+    results = []
+    for stage, t in times.items():
+        results.append({'n': n, 'nz': nz, 'ntheta': ntheta, 'dtype': dtype, 'backend': backend, 'stage': stage,
+                        'time': t, 'proj_per_s': counts[stage]/t, 'gb_per_s': counts[stage]*nz*n*4/t/1e9})
+    return results
+
+
+def commit():
+    """Current commit of the repository, if any"""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """Print speedups of stages measured in both files"""
+
+    key = lambda res: tuple(res[k] for k in ['n', 'nz', 'ntheta', 'dtype', 'backend', 'stage'])
+    with open(old) as f:
+        old = json.load(f)
+    with open(new) as f:
+        new = json.load(f)
+    times = {key(res): res['time'] for res in old['results']}
+    print(f'{old["commit"]} -> {new["commit"]}')
+    for res in new['results']:
+        if key(res) in times:
+            print(f'  {key(res)}: {times[key(res)]/res["time"]:.2f}x')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        compare(*sys.argv[2:4])
+        sys.exit()
+    args = sys.argv[1:] + ['512', '512', '720', 'uint16', 'numpy', 'bench_solver.json'][len(sys.argv)-1:]
+    sizes = [[int(v) for v in arg.split(',')] for arg in args[:3]]
+    dtypes, backends = args[3].split(','), args[4].split(',')
+    output = args[5]
+
+    results = []
+    for n, nz, ntheta, dtype, backend in itertools.product(*sizes, dtypes, backends):
+        print(f'{n=}, {nz=}, {ntheta=}, {dtype=}, {backend=}')
+        for res in run(n, nz, ntheta, dtype, backend):
+            print(f'  {res["stage"]:20s} {res["time"]:9.4f}s {res["proj_per_s"]:10.1f} proj/s {res["gb_per_s"]:8.3f} GB/s')
+            results.append(res)
+    with open(output, 'w') as f:
+        json.dump({'commit': commit(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'host': platform.node(),
+                   'results': results}, f, indent=1)
+    print(f'saved to {output}')
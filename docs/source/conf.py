@@ -328,6 +328,7 @@ autodoc_mock_imports = [
     'numpy',
     'os',
     'pvaccess',
+    'scipy',
     'signal',
     'threading',
     'time',
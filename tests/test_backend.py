@@ -0,0 +1,253 @@
+import numpy as np
+import pytest
+from tomostream import backend
+from tomostream import kernels_cpu
+from tomostream import planes
+from tomostream import solver
+
+# tolerance for comparing CPU and GPU results (fast math intrinsics are used in CUDA kernels)
+rtol = 1e-3
+atol = 1e-3
+
+[ntheta, nz, n] = [24, 16, 32]
+
+pars = {'center': np.float32(n/2+1.3), 'idx': np.int32(n//2+3), 'idy': np.int32(n//2-2), 'idz': np.int32(nz//2),
+        'rotx': np.float32(0), 'roty': np.float32(0.2), 'rotz': np.float32(0.1),
+        'fbpfilter': 'Parzen', 'dezinger': 2,
+        'energy': np.float32(20), 'dist': np.float32(100), 'alpha': np.float32(0.001), 'pixelsize': np.float32(3)}
+
+gpu = pytest.mark.skipif(not backend.gpu_available(), reason='no GPU')
+
+
+def _close(a, b):
+    """Compare results allowing rare pixels with a different rounding of the detector coordinate
+    in the nearest neighbour step of the kernels"""
+    ok = np.isclose(a, b, rtol=rtol, atol=atol*np.abs(b).max())
+    return np.mean(ok) > 0.99
+
+
+def _projections():
+    rng = np.random.default_rng(0)
+    data = rng.integers(100, 1000, [ntheta, nz, n]).astype('uint16')
+    theta = np.linspace(0, 180, ntheta, endpoint=False).astype('float32')
+    dark = rng.integers(0, 50, [nz, n]).astype('float32')
+    flat = rng.integers(1000, 1100, [nz, n]).astype('float32')
+    return data, theta, dark, flat
+
+
+def _orthoz_reference(g, theta, center, iz, rot):
+    """Direct transcription of the orthoz CUDA kernel"""
+    [ntheta, nz, n] = g.shape
+    f = np.zeros([n, n], dtype='float32')
+    for tx in range(n):
+        for ty in range(n):
+            f0 = 0
+            xr = (tx - n//2)*np.cos(rot) + (iz - nz//2)*np.sin(rot)
+            zr = -(tx - n//2)*np.sin(rot) + (iz - nz//2)*np.cos(rot) + nz//2
+            if zr < 0 or zr > nz-1:
+                continue
+            for k in range(ntheta):
+                sp = xr*np.cos(theta[k]) - (ty - n//2)*np.sin(theta[k]) + center
+                s0 = int(kernels_cpu._round(sp))
+                if 0 <= s0 < n-1:
+                    z0 = int(kernels_cpu._round(zr))
+                    f0 += g[k, z0, s0] + (g[k, z0, s0+1]-g[k, z0, s0])*(sp-s0)/n
+            f[ty, tx] = f0*n
+    return f
+
+
+def _orthox_reference(g, theta, center, ix, rot):
+    """Direct transcription of the orthox CUDA kernel"""
+    [ntheta, nz, n] = g.shape
+    f = np.zeros([nz, n], dtype='float32')
+    for ty in range(n):
+        for tz in range(nz):
+            f0 = 0
+            for k in range(ntheta):
+                xr = (ix - n//2)*np.cos(rot) + (ty - n//2)*np.sin(rot)
+                yr = -(ix - n//2)*np.sin(rot) + (ty - n//2)*np.cos(rot)
+                sp = xr*np.cos(theta[k]) - yr*np.sin(theta[k]) + center
+                s0 = int(kernels_cpu._round(sp))
+                if 0 <= s0 < n-1:
+                    f0 += g[k, tz, s0] + (g[k, tz, s0+1]-g[k, tz, s0])*(sp-s0)/n
+            f[tz, ty] = f0*n
+    return f
+
+
+def test_kernels_cpu_reference():
+    data, theta, _, _ = _projections()
+    g = data.astype('float32')
+    th = theta*np.pi/180
+    objz = kernels_cpu.orthoz(g, th, pars['center'], pars['idz'], pars['rotz'])
+    objx = kernels_cpu.orthox(g, th, pars['center'], pars['idx'], pars['rotx'])
+    assert np.allclose(objz, _orthoz_reference(g, th, pars['center'], pars['idz'], pars['rotz']), rtol=rtol, atol=atol)
+    assert np.allclose(objx, _orthox_reference(g, th, pars['center'], pars['idx'], pars['rotx']), rtol=rtol, atol=atol)
+
+
+@pytest.mark.parametrize('kernel', ['orthox', 'orthoy', 'orthoz'])
+def test_kernels_numba(kernel):
+    kernels_numba = pytest.importorskip('tomostream.kernels_numba')
+    data, theta, _, _ = _projections()
+    g = data.astype('float32')
+    th = (theta*np.pi/180).astype('float32')
+    ids = {'orthox': pars['idx'], 'orthoy': pars['idy'], 'orthoz': pars['idz']}[kernel]
+    rot = np.float32(0.3)
+    res_numpy = getattr(kernels_cpu, kernel)(g, th, pars['center'], ids, rot)
+    res_numba = getattr(kernels_numba, kernel)(g, th, pars['center'], ids, rot)
+    assert _close(res_numba, res_numpy)
+
+
+def _geometry():
+    """Ortho-slices, a slab of x slices and an oblique plane"""
+    return np.concatenate([planes.ortho('orthoz', n, nz, pars['idz'], pars['rotz'])[None],
+                           planes.ortho('orthoy', n, nz, pars['idy'], pars['roty'])[None],
+                           planes.slab(planes.ortho('orthox', n, nz, pars['idx'], np.float32(0.3)), 3),
+                           planes.oblique([1, 1, 1], 2, nz, n, n)[None]])
+
+
+def test_planes_cpu():
+    data, theta, _, _ = _projections()
+    g = data.astype('float32')
+    th = (theta*np.pi/180).astype('float32')
+    res = kernels_cpu.planes(g, th, pars['center'], _geometry(), n, n)
+    # the fused kernel reproduces ortho kernels
+    assert _close(res[0], kernels_cpu.orthoz(g, th, pars['center'], pars['idz'], pars['rotz']))
+    assert _close(res[1, :nz], kernels_cpu.orthoy(g, th, pars['center'], pars['idy'], pars['roty']))
+    assert _close(res[3, :nz], kernels_cpu.orthox(g, th, pars['center'], pars['idx'], np.float32(0.3)))
+    # rows outside the detector are zero
+    assert np.all(res[1, nz:] == 0)
+
+
+def test_planes_numba():
+    kernels_numba = pytest.importorskip('tomostream.kernels_numba')
+    data, theta, _, _ = _projections()
+    g = data.astype('float32')
+    th = (theta*np.pi/180).astype('float32')
+    res_numpy = kernels_cpu.planes(g, th, pars['center'], _geometry(), n, n)
+    res_numba = kernels_numba.planes(g, th, pars['center'], _geometry(), n, n)
+    assert _close(res_numba, res_numpy)
+
+
+@pytest.mark.parametrize('name', ['numpy', 'numba'])
+def test_normalize(name):
+    if name == 'numba':
+        pytest.importorskip('numba')
+    kernels = backend.get_backend(name).kernels
+    data, _, dark, flat = _projections()
+    rflat = 1/np.maximum(flat-dark, 1e-6)
+    res_ref = (data-dark)/np.maximum(flat-dark, 1e-6)
+    res = data.astype('float32')
+    kernels.normalize(res, dark, rflat)
+    assert np.allclose(res, res_ref, rtol=1e-5)
+    kernels.minus_log(res)
+    assert np.allclose(res, -np.log(np.maximum(res_ref, 1e-6)), rtol=1e-5, atol=1e-6)
+    res = data.astype('float32')
+    kernels.normalize(res, dark, rflat, log=True)
+    assert np.allclose(res, -np.log(np.maximum(res_ref, 1e-6)), rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('name', ['numpy', 'numba'])
+def test_dezinger(name):
+    if name == 'numba':
+        pytest.importorskip('numba')
+    kernels = backend.get_backend(name).kernels
+    rng = np.random.default_rng(0)
+    data = (100+rng.random([ntheta, nz, n])).astype('float32')
+    # isolated outliers
+    zingers = np.s_[:, ::6, 3::7]
+    res = data.copy()
+    res[zingers] = 1000
+    kernels.dezinger(res, 2)
+    assert np.all(np.abs(res[zingers]-100.5) < 1)
+    # pixels without outliers in the neighbourhood are kept
+    assert np.mean(res == data) > 0.5
+
+
+def test_dezinger_numba_numpy():
+    pytest.importorskip('numba')
+    rng = np.random.default_rng(0)
+    data = (100+100*rng.random([ntheta, nz, n])**8).astype('float32')
+    res_numpy = data.copy()
+    res_numba = data.copy()
+    backend.get_backend('numpy').kernels.dezinger(res_numpy, 3)
+    backend.get_backend('numba').kernels.dezinger(res_numba, 3)
+    assert _close(res_numba, res_numpy)
+
+
+@pytest.mark.parametrize('shape', [[3, 2, 5], [2, 1, 3], [2, 4, 1]])
+def test_dezinger_small_images(shape):
+    # windows of radius 3 are larger than images and reflected several times
+    pytest.importorskip('numba')
+    rng = np.random.default_rng(0)
+    data = (100+100*rng.random(shape)**8).astype('float32')
+    res_numpy = data.copy()
+    res_numba = data.copy()
+    backend.get_backend('numpy').kernels.dezinger(res_numpy, 3)
+    backend.get_backend('numba').kernels.dezinger(res_numba, 3)
+    assert np.allclose(res_numba, res_numpy, rtol=1e-5)
+
+
+def test_solver_numpy():
+    data, theta, dark, flat = _projections()
+    slv = solver.Solver(ntheta, n, nz, pars, data.dtype, backend='numpy')
+    slv.set_dark(dark)
+    slv.set_flat(flat)
+    rec = slv.recon_optimized(data, theta, np.arange(ntheta), pars)
+    assert rec.shape == (n, 3*n)
+    assert np.all(np.isfinite(rec))
+
+
+@gpu
+@pytest.mark.parametrize('kernel', ['orthox', 'orthoy', 'orthoz'])
+def test_kernels_gpu(kernel):
+    import cupy as cp
+    from tomostream import kernels
+    data, theta, _, _ = _projections()
+    g = data.astype('float32')
+    th = (theta*np.pi/180).astype('float32')
+    ids = {'orthox': pars['idx'], 'orthoy': pars['idy'], 'orthoz': pars['idz']}[kernel]
+    rot = np.float32(0.3)
+    res_cpu = getattr(kernels_cpu, kernel)(g, th, pars['center'], ids, rot)
+    res_gpu = getattr(kernels, kernel)(cp.array(g), cp.array(th), pars['center'], ids, rot).get()
+    assert _close(res_cpu, res_gpu)
+
+
+@gpu
+def test_planes_gpu():
+    import cupy as cp
+    from tomostream import kernels
+    data, theta, _, _ = _projections()
+    g = data.astype('float32')
+    th = (theta*np.pi/180).astype('float32')
+    res_cpu = kernels_cpu.planes(g, th, pars['center'], _geometry(), n, n)
+    res_gpu = kernels.planes(cp.array(g), cp.array(th), pars['center'], _geometry(), n, n).get()
+    assert _close(res_cpu, res_gpu)
+
+
+@gpu
+@pytest.mark.parametrize('stage', ['darkflat_correction', 'remove_outliers', 'phase', 'minus_log', 'fbp_filter'])
+def test_stages_gpu(stage):
+    data, theta, dark, flat = _projections()
+    res = []
+    for name in ['numpy', 'cupy']:
+        slv = solver.Solver(ntheta, n, nz, pars, data.dtype, backend=name)
+        slv.set_dark(dark)
+        slv.set_flat(flat)
+        d = slv.bk.to_device(data)
+        if stage != 'darkflat_correction':
+            slv.darkflat_correction(d)
+        getattr(slv, stage)(d)
+        res.append(slv.bk.to_host(d))
+    assert np.allclose(res[0], res[1], rtol=rtol, atol=atol*np.abs(res[1]).max())
+
+
+@gpu
+def test_recon_gpu():
+    data, theta, dark, flat = _projections()
+    res = []
+    for name in ['numpy', 'cupy']:
+        slv = solver.Solver(ntheta, n, nz, pars, data.dtype, backend=name)
+        slv.set_dark(dark)
+        slv.set_flat(flat)
+        res.append(slv.recon_optimized(data, theta, np.arange(ntheta), pars))
+    assert _close(res[0], res[1])
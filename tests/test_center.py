@@ -0,0 +1,53 @@
+import numpy as np
+from tomostream.center import CenterEstimator, mirrored_shift
+
+n, nz, ntheta = 128, 8, 90
+center = 67.3
+
+
+def _projections(theta, seed=0):
+    """Flat field 1000 attenuated by Gaussian blobs rotating about the center, with noise"""
+
+    rng = np.random.default_rng(seed)
+    blobs = rng.uniform(-30, 30, [8, 2])
+    amp = rng.uniform(0.1, 0.5, 8)
+    t = np.deg2rad(theta)[:, None, None]
+    s = np.arange(n)
+    p = sum(a*np.exp(-(s - center - (x*np.cos(t) - y*np.sin(t)))**2/8) for (x, y), a in zip(blobs, amp))
+    data = 1000*np.exp(-np.repeat(p, nz, axis=1)) + rng.normal(0, 3, [len(theta), nz, n])
+    return data.astype('uint16').reshape(len(theta), nz*n)
+
+
+def test_mirrored_shift_subpixel():
+    s = np.arange(n, dtype='float32')
+    p = np.exp(-(s - 40)**2/20)[None]
+    # q[s] = p[n-1-s+d]
+    q = np.exp(-(n-1-s+7.4 - 40)**2/20)[None]
+    d, corr = mirrored_shift(p, q)
+    assert abs(d - 7.4) < 0.1 and corr > 0.95
+
+
+def test_continuous_scan():
+    est = CenterEstimator(ntheta, n, nz)
+    est.set_flat(np.full([nz, n], 1000, dtype='float32'))
+    theta = np.arange(2*ntheta, dtype='float32')*2
+    data = _projections(theta)
+    # the first half turn fills the buffer without pairs
+    assert est.update(data[:ntheta], theta[:ntheta], np.arange(ntheta)) == 0
+    assert est.estimate is None and est.confidence == 0
+    # projections of the second half turn replace opposing ones in the same slots
+    assert est.update(data[ntheta:ntheta+10], theta[ntheta:ntheta+10], np.arange(10)) == 10
+    assert abs(est.estimate - center) < 0.2
+    assert est.confidence > 0.9
+
+
+def test_back_and_forth_scan():
+    est = CenterEstimator(ntheta, n, nz)
+    theta = np.arange(ntheta, dtype='float32')*2
+    data = _projections(theta)
+    est.update(data, theta, np.arange(ntheta))
+    # the same angles in the opposite direction are not opposing
+    assert est.update(data[::-1], theta[::-1], np.arange(ntheta)[::-1]) == 0
+    # the last angle of the next turn is opposing the first one
+    assert est.update(_projections(np.float32([180])), np.float32([180]), [0]) == 1
+    assert abs(est.estimate - center) < 0.5
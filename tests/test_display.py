@@ -0,0 +1,39 @@
+import numpy as np
+from tomostream import backend
+from tomostream import display
+
+bk = backend.get_backend('numpy')
+n = 32
+
+
+def _obj():
+    rng = np.random.default_rng(0)
+    return rng.random([n, 3*n]).astype('float32')
+
+
+def test_float_unchanged():
+    obj = _obj()
+    res = display.reduce(obj, {}, bk)
+    assert res.dtype == 'float32' and np.all(res == obj)
+
+
+def test_crop_and_binning():
+    obj = _obj()
+    pars = {'crop': 3, 'binning': 2}
+    res = display.reduce(obj, pars, bk)
+    assert res.shape == display.shape(n, pars) == (13, 39)
+    # every slice is cropped and binned separately
+    for k in range(3):
+        s = obj[3:29, k*n+3:k*n+29]
+        assert np.allclose(res[:, k*13:(k+1)*13], s.reshape(13, 2, 13, 2).mean(axis=(1, 3)))
+
+
+def test_quantization():
+    obj = _obj()
+    for publishtype, vmax in [('UInt8', 255), ('UInt16', 65535)]:
+        pars = {'publishtype': publishtype, 'percentile': 1, 'binning': 4}
+        res = display.reduce(obj, pars, bk)
+        assert res.dtype == display.dtype(pars)
+        assert res.min() == 0 and res.max() == vmax
+        rec = display.ortholines(res.copy(), {**pars, 'idx': 8, 'idy': 9, 'idz': 10}, n)
+        assert np.all(rec[:, 2:5] == vmax)
@@ -0,0 +1,43 @@
+import numpy as np
+from tomostream import backend
+from tomostream import filters
+
+
+def test_next_fast_len():
+    for n in range(1, 200):
+        m = filters.next_fast_len(n)
+        assert m >= n
+        k = m
+        for p in [2, 3, 5]:
+            while k % p == 0:
+                k //= p
+        assert k == 1
+        # no smaller 5-smooth number in between
+        assert all(filters.next_fast_len(j) == m for j in range(n, m+1))
+
+
+def test_filter_bank():
+    bk = backend.get_backend('numpy')
+    bank = filters.FilterBank()
+    n = 100
+    ne = bank.padded_size(n)
+    assert ne >= 2*n and filters.next_fast_len(ne) == ne
+    assert bank.get(n, ne, 'Hann', bk) is bank.get(n, ne, 'Hann', bk)
+    # batched filtering gives the same result as filtering projections one by one
+    data = np.random.default_rng(0).random([4, 3, n]).astype('float32')
+    res = data.copy()
+    bank.apply(res, 'Parzen', bk)
+    for k in range(4):
+        res_k = data[k:k+1].copy()
+        bank.apply(res_k, 'Parzen', bk)
+        assert np.allclose(res[k], res_k[0], atol=1e-6)
+
+
+def test_no_wrap_around():
+    # a constant projection is not changed by filters vanishing at zero frequency when padded with edge values
+    bk = backend.get_backend('numpy')
+    data = np.ones([1, 2, 64], dtype='float32')
+    for name in filters.windows:
+        res = data.copy()
+        filters.filter_bank.apply(res, name, bk)
+        assert np.allclose(res, 0, atol=1e-5)
@@ -0,0 +1,44 @@
+import numpy as np
+from tomostream.ingest import FrameWriter
+from tomostream.ringbuffer import RingBuffer
+
+
+def frame(k, size=6):
+    return {'uniqueId': k+1, 'value': ({'ushortValue': np.full(size, k, dtype='uint16')},)}
+
+
+def test_continuous_ids():
+    ring = RingBuffer(8, 6, 'uint16')
+    writer = FrameWriter(ring, 'uint16', np.arange(12, dtype='float32')*30, 0, 6, 'continuous', 0)
+    for k in range(8):
+        writer.write(frame(k))
+    proj, theta, ids = ring.get()
+    assert np.all(ids == [0, 1, 2, 3, 4, 5, 0, 1])
+    assert np.all(theta == np.arange(8)*30) and np.all(proj[:, 0] == np.arange(8))
+    assert np.all(ring.unique_ids(8) == np.arange(1, 9))
+
+
+def test_backforth_ids():
+    ring = RingBuffer(8, 6, 'uint16')
+    theta = np.float32([0, 60, 120, 120, 60, 0])
+    writer = FrameWriter(ring, 'uint16', theta, 0, 3, 'backforth', 3)
+    for k in range(6):
+        writer.write(frame(k))
+    # the second span fills the buffer in the opposite direction
+    assert np.all(ring.get()[2] == [0, 1, 2, 2, 1, 0])
+
+
+def test_sizes_changed():
+    ring = RingBuffer(8, 6, 'uint16')
+    writer = FrameWriter(ring, 'uint16', np.zeros(4, dtype='float32'), 0, 4, 'continuous', 0)
+    writer.write(frame(0, size=4))
+    assert writer.sizes_changed and ring.pending() == 0
+
+
+def test_frame_counters():
+    ring = RingBuffer(8, 6, 'uint16')
+    writer = FrameWriter(ring, 'uint16', np.zeros(16, dtype='float32'), 0, 8, 'continuous', 0)
+    for k in [0, 1, 4, 3, 5]:
+        writer.write(frame(k))
+    # frames 2 and 3 are missing when 4 comes, 3 comes after 4
+    assert ring.received == 5 and ring.lost == 2 and ring.out_of_order == 1
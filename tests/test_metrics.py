@@ -0,0 +1,52 @@
+import numpy as np
+from tomostream import metrics
+from tomostream.backend import get_backend
+
+
+def test_text_format(tmp_path):
+    m = metrics.Metrics()
+    m.inc('frames_received_total', 5)
+    m.inc('frames_received_total')
+    m.set('queue_depth', 3, queue='ring')
+    m.observe('stage_seconds', 0.004, stage='publish')
+    m.observe('stage_seconds', 0.3, stage='publish')
+    text = m.text()
+    assert 'tomostream_frames_received_total 6\n' in text
+    assert '# TYPE tomostream_stage_seconds histogram' in text
+    assert 'tomostream_queue_depth{queue="ring"} 3' in text
+    assert 'tomostream_stage_seconds_bucket{stage="publish",le="0.005"} 1' in text
+    assert 'tomostream_stage_seconds_bucket{stage="publish",le="+Inf"} 2' in text
+    assert 'tomostream_stage_seconds_count{stage="publish"} 2' in text
+    m.write(tmp_path/'tomostream.prom')
+    assert (tmp_path/'tomostream.prom').read_text() == text
+
+
+def test_interval_mean():
+    m = metrics.Metrics()
+    assert m.interval_mean('stage_seconds', stage='copy') == 0
+    m.observe('stage_seconds', 1, stage='copy')
+    m.observe('stage_seconds', 3, stage='copy')
+    assert m.interval_mean('stage_seconds', stage='copy') == 2
+    assert m.interval_mean('stage_seconds', stage='copy') == 0
+    m.observe('stage_seconds', 5, stage='copy')
+    assert m.interval_mean('stage_seconds', stage='copy') == 5
+
+
+def test_solver_timings():
+    from tomostream import solver, phantom
+    n, nz, ntheta = 32, 16, 24
+    theta = np.linspace(0, 180, ntheta, endpoint=False).astype('float32')
+    data, dark, flat = phantom.projections(theta, n, nz)
+    pars = {'center': np.float32(n/2), 'idx': np.int32(n//2), 'idy': np.int32(n//2), 'idz': np.int32(nz//2),
+            'rotx': np.float32(0), 'roty': np.float32(0), 'rotz': np.float32(0), 'fbpfilter': 'Parzen',
+            'dezinger': 0, 'energy': np.float32(20), 'dist': np.float32(100), 'alpha': np.float32(0),
+            'pixelsize': np.float32(3)}
+    slv = solver.Solver(ntheta, n, nz, pars, 'uint16', 'numpy')
+    slv.set_dark(dark)
+    slv.set_flat(flat)
+    slv.recon_optimized(data, theta, np.arange(ntheta), pars)
+    assert slv.update_kind == 'full'
+    assert set(slv.timings) == {'preprocessing', 'backprojection', 'copy'}
+    slv.recon_optimized(data[:2], theta[:2], np.arange(2), pars)
+    assert slv.update_kind == 'incremental'
+    assert get_backend('numpy').mem_used() > 0
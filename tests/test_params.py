@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from tomostream import params
+from tomostream import solver
+
+
+class FakePV():
+    """PV with a value and callbacks as in pyepics"""
+
+    def __init__(self, value, char_value=None):
+        self.value = value
+        self.char_value = char_value if char_value is not None else str(value)
+        self.callbacks = []
+
+    def get(self, as_string=False):
+        return self.char_value if as_string else self.value
+
+    def add_callback(self, callback, **kw):
+        self.callbacks.append((callback, kw))
+
+    def put(self, value, char_value=None):
+        self.value = value
+        self.char_value = char_value if char_value is not None else str(value)
+        for callback, kw in self.callbacks:
+            callback(pvname='', value=self.value, char_value=self.char_value, **kw)
+
+
+def _pvs():
+    pvs = {name: FakePV(0) for name, _, _ in params.pars_pvs.values()}
+    pvs['Center'] = FakePV(16.0)
+    pvs['FilterType'] = FakePV(0, 'Parzen')
+    pvs['Dezinger'] = FakePV(0, 'None')
+    pvs['OrthoSlices'] = FakePV(0, 'XYZ')
+    pvs['ZEnd'] = FakePV(16)
+    pvs['PublishType'] = FakePV(0, 'Float32')
+    pvs['PublishBinning'] = FakePV(0, '1x')
+    pvs['VolumeMode'] = FakePV(0, 'Off')
+    pvs['VolumeBinning'] = FakePV(1, '4x')
+    return pvs
+
+
+def test_snapshot_versions():
+    pvs = _pvs()
+    pars = params.Parameters(pvs)
+    snapshot = pars.get()
+    assert snapshot.version == 0
+    assert snapshot['fbpfilter'] == 'Parzen' and snapshot['slices'] == 'xyz' and snapshot['dezinger'] == 0
+    pvs['Dezinger'].put(2, 'Radius 3')
+    pvs['RotX'].put(90)
+    assert pars.get().version == 2
+    assert pars.get()['dezinger'] == 3
+    assert np.isclose(pars.get()['rotx'], np.pi/2)
+    # old snapshots are not changed
+    assert snapshot['dezinger'] == 0
+    with pytest.raises(TypeError):
+        snapshot['center'] = 0
+
+
+def test_solver_compares_versions():
+    pvs = _pvs()
+    pars = params.Parameters(pvs)
+    slv = solver.Solver(4, 32, 16, pars.get(), 'uint16', backend='numpy')
+    slv.recon_optimized(np.zeros([4, 16, 32], 'uint16'), np.zeros(4, 'float32'), np.arange(4), pars.get())
+    assert slv.invalidated_stages(pars.get()) == set()
+    pvs['OrthoX'].put(3)
+    assert slv.invalidated_stages(pars.get()) == {'orthox'}
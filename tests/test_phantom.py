@@ -0,0 +1,27 @@
+import numpy as np
+from tomostream import phantom
+
+
+def test_projections_deterministic():
+    theta = np.float32([0, 45, 90])
+    data, dark, flat = phantom.projections(theta, 64, 32, 'uint16', noise=0.01)
+    data2, _, _ = phantom.projections(theta, 64, 32, 'uint16', noise=0.01)
+    assert data.dtype == 'uint16' and data.shape == (3, 32, 64)
+    assert np.array_equal(data, data2)
+    assert np.all(data <= flat.max()*1.1) and dark.shape == flat.shape == (32, 64)
+
+
+def test_opposing_projections_mirrored():
+    # the projection at theta+180 is the projection at theta mirrored about the center
+    n, center = 64, 33.5
+    p = phantom.line_integrals([30, 210], n, 16, center)
+    s = np.arange(n)
+    mirrored = np.interp(2*center - s, s, p[0, 8])
+    assert np.allclose(p[1, 8, 8:-8], mirrored[8:-8], atol=1e-2*p.max())
+
+
+def test_line_integral_of_sphere():
+    # chord of the unit sphere through its center is 2
+    sphere = np.float32([[1, 1, 1, 1, 0, 0, 0, 0]])
+    p = phantom.line_integrals([0], 64, 64, ellipsoids=sphere)
+    assert abs(p.max() - 2) < 1e-3
@@ -0,0 +1,67 @@
+import time
+import numpy as np
+from tomostream.pipeline import BufferPool, Stage, StageStats
+
+
+def test_double_buffered_stage():
+    published = []
+    pool = BufferPool(2, [4], 'float32')
+
+    def publish(item):
+        buffer, k = item
+        time.sleep(0.01)
+        # the buffer is not overwritten while it is published
+        assert np.all(buffer == k)
+        published.append(k)
+        pool.release(buffer)
+
+    stage = Stage('publish', publish)
+    stage.start()
+    stats = StageStats('compute')
+    for k in range(6):
+        buffer = pool.get(stats)
+        buffer[:] = k
+        stage.put((buffer, k), stats)
+    stage.stop()
+    assert published == list(range(6))
+    assert stage.stats.items == 6
+    # computing is faster than publishing, so it waits for buffers
+    assert stats.stall > 0
+    assert 0 < stage.stats.occupancy() <= 1
+
+
+def test_next_stage():
+    results = []
+    last = Stage('last', results.append)
+    first = Stage('first', lambda x: 2*x, next_stage=last)
+    last.start()
+    first.start()
+    for k in range(5):
+        first.put(k)
+    first.stop()
+    last.stop()
+    assert results == [0, 2, 4, 6, 8]
+
+
+def test_failing_item_dropped():
+    published = []
+    pool = BufferPool(2, [4], 'float32')
+
+    def publish(item):
+        buffer, k = item
+        try:
+            if k == 1:
+                raise ValueError('shape mismatch')
+            published.append(k)
+        finally:
+            pool.release(buffer)
+
+    stage = Stage('publish', publish)
+    stage.start()
+    # more items than buffers, so a buffer lost by the failing item would block
+    for k in range(5):
+        stage.put((pool.get(), k))
+    stage.stop()
+    assert published == [0, 2, 3, 4]
+    assert stage.stats.items == 4 and stage.stats.errors == 1
+    assert 'errors 1' in str(stage.stats)
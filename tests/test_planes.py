@@ -0,0 +1,27 @@
+import numpy as np
+from tomostream import planes
+
+[nz, n] = [16, 32]
+
+
+def test_ortho_normals():
+    assert np.allclose(planes.normal(planes.ortho('orthoz', n, nz, 8, 0)), [0, 0, 1])
+    assert np.allclose(np.abs(planes.normal(planes.ortho('orthox', n, nz, 8, 0))), [1, 0, 0])
+    assert np.allclose(np.abs(planes.normal(planes.ortho('orthoy', n, nz, 8, 0))), [0, 1, 0])
+
+
+def test_oblique_plane():
+    plane = planes.oblique([1, 2, 2], 3, nz, 10, 20)
+    nrm = np.array([1, 2, 2])/3
+    assert np.allclose(planes.normal(plane), nrm, atol=1e-6)
+    assert np.allclose(plane[1]@plane[2], 0, atol=1e-6)
+    # the center of the plane is at the distance offset from the center of the volume
+    center = plane[0] + 10*plane[1] + 5*plane[2]
+    assert np.allclose(center, [0, 0, nz//2] + 3*nrm, atol=1e-5)
+
+
+def test_slab():
+    plane = planes.ortho('orthoz', n, nz, 8, 0)
+    slab = planes.slab(plane, 3, step=2)
+    assert np.allclose(slab[:, 0, 2], [6, 8, 10])
+    assert np.all(slab[:, 1:] == plane[1:])
@@ -0,0 +1,250 @@
+import numpy as np
+from tomostream import solver
+
+[ntheta, nz, n] = [20, 16, 32]
+
+pars = {'center': np.float32(n/2), 'idx': np.int32(n//2+3), 'idy': np.int32(n//2-2), 'idz': np.int32(nz//2),
+        'rotx': np.float32(0), 'roty': np.float32(0), 'rotz': np.float32(0),
+        'fbpfilter': 'Parzen', 'dezinger': 0,
+        'energy': np.float32(20), 'dist': np.float32(100), 'alpha': np.float32(0), 'pixelsize': np.float32(3)}
+
+
+def _projections(seed=0):
+    rng = np.random.default_rng(seed)
+    data = rng.integers(100, 1000, [ntheta, nz, n]).astype('uint16')
+    theta = np.linspace(0, 180, ntheta, endpoint=False).astype('float32')
+    dark = np.zeros([nz, n], dtype='float32')
+    flat = np.full([nz, n], 1100, dtype='float32')
+    return data, theta, dark, flat
+
+
+def _solver(data, theta, dark, flat, pars):
+    slv = solver.Solver(ntheta, n, nz, pars, data.dtype, backend='numpy')
+    slv.set_dark(dark)
+    slv.set_flat(flat)
+    rec = slv.recon_optimized(data, theta, np.arange(ntheta), pars)
+    return slv, rec
+
+
+def _close(a, b):
+    return np.allclose(a, b, rtol=1e-4, atol=1e-4*np.abs(b).max())
+
+
+def test_incremental_update():
+    data, theta, dark, flat = _projections()
+    slv, _ = _solver(data, theta, dark, flat, pars)
+    new, _, _, _ = _projections(1)
+    ids = np.array([3, 4, 5, 11])
+    rec = slv.recon_optimized(new[ids], theta[ids], ids, pars)
+    data[ids] = new[ids]
+    _, rec_full = _solver(data, theta, dark, flat, pars)
+    assert _close(rec, rec_full)
+
+
+def test_backprojection_pars_use_cache():
+    data, theta, dark, flat = _projections()
+    slv, _ = _solver(data, theta, dark, flat, pars)
+    pars_new = pars.copy()
+    pars_new['idx'] += 2
+    pars_new['center'] += np.float32(0.5)
+    assert slv.invalidated_stages(pars_new) == {'orthox', 'orthoy', 'orthoz', 'volume'}
+    calls = []
+    preprocess = slv.preprocess
+    slv.preprocess = lambda data, rows: (calls.append(data.shape[0]), preprocess(data, rows))
+    ids = np.array([7])
+    rec = slv.recon_optimized(data[ids], theta[ids], ids, pars_new)
+    assert calls == [1]  # only the new projection is filtered
+    _, rec_full = _solver(data, theta, dark, flat, pars_new)
+    assert _close(rec, rec_full)
+
+
+def test_preprocessing_pars_refilter():
+    data, theta, dark, flat = _projections()
+    slv, _ = _solver(data, theta, dark, flat, pars)
+    pars_new = pars.copy()
+    pars_new['fbpfilter'] = 'Ramp'
+    assert slv.invalidated_stages(pars_new) == {'preprocessing'}
+    rec = slv.recon_optimized(data[:1], theta[:1], np.arange(1), pars_new)
+    _, rec_full = _solver(data, theta, dark, flat, pars_new)
+    assert _close(rec, rec_full)
+
+
+def test_one_slice_recomputed():
+    data, theta, dark, flat = _projections()
+    slv, _ = _solver(data, theta, dark, flat, pars)
+    pars_new = pars.copy()
+    pars_new['idx'] += 2
+    pars_new['rotx'] = np.float32(0.2)
+    assert slv.invalidated_stages(pars_new) == {'orthox'}
+    calls = []
+    backprojection = slv.backprojection
+    slv.backprojection = lambda data, theta, slices: (calls.append((data.shape[0], list(slices))), 
+                                                      backprojection(data, theta, slices))[1]
+    ids = np.array([7, 8])
+    rec = slv.recon_optimized(data[ids], theta[ids], ids, pars_new)
+    # y and z slices are updated with new projections only, x slice is recomputed with the whole buffer
+    assert calls == [(2, ['orthoz', 'orthoy']), (2, ['orthoz', 'orthoy']), (ntheta, ['orthox'])]
+    _, rec_full = _solver(data, theta, dark, flat, pars_new)
+    assert _close(rec, rec_full)
+
+
+def test_z_slice_band():
+    data, theta, dark, flat = _projections()
+    _, rec_full = _solver(data, theta, dark, flat, pars)
+    pars_z = pars.copy()
+    pars_z['slices'] = 'z'
+    slv, rec = _solver(data, theta, dark, flat, pars_z)
+    assert slv.band == (pars['idz'], pars['idz']+1)
+    assert _close(rec[:, :n], rec_full[:, :n])
+    assert np.all(rec[:, n:] == 0)
+    # moving the z slice out of the band refilters the buffer for the new band
+    pars_z['idz'] += 3
+    rec = slv.recon_optimized(data[:1], theta[:1], np.arange(1), pars_z)
+    pars_full = pars.copy()
+    pars_full['idz'] += 3
+    _, rec_full = _solver(data, theta, dark, flat, pars_full)
+    assert _close(rec[:, :n], rec_full[:, :n])
+
+
+def test_cropped_rows():
+    data, theta, dark, flat = _projections()
+    _, rec_full = _solver(data, theta, dark, flat, pars)
+    pars_crop = pars.copy()
+    pars_crop['zstart'] = 5
+    pars_crop['zend'] = 11
+    slv, rec = _solver(data, theta, dark, flat, pars_crop)
+    assert slv.band == (5, 11)
+    assert _close(rec[5:11], rec_full[5:11])
+    assert np.all(rec[:5, n:] == 0) and np.all(rec[11:, n:] == 0)
+
+
+def test_ring_removal_running_stats():
+    data, theta, dark, flat = _projections()
+    pars_ring = pars.copy()
+    pars_ring['ringremoval'] = 1
+    slv, _ = _solver(data, theta, dark, flat, pars_ring)
+    new, _, _, _ = _projections(1)
+    ids = np.array([3, 4, 5, 11])
+    slv.recon_optimized(new[ids], theta[ids], ids, pars_ring)
+    data[ids] = new[ids]
+    slv_full, _ = _solver(data, theta, dark, flat, pars_ring)
+    assert slv.column_stats.count == ntheta
+    assert np.allclose(slv.column_stats.sums, slv_full.column_stats.sums)
+
+
+def test_ring_removal_band_shrinks():
+    data, theta, dark, flat = _projections()
+    pars_ring = pars.copy()
+    pars_ring['ringremoval'] = 1
+    slv, _ = _solver(data, theta, dark, flat, pars_ring)
+    new, _, _, _ = _projections(1)
+    ids = np.array([3, 4, 5, 11])
+    data[ids] = new[ids]
+    # the z slice only, then rows cropped to a half of the detector
+    for change in [{'slices': 'z'}, {'slices': 'xyz', 'zend': nz//2}]:
+        pars_band = {**pars_ring, **change}
+        rec = slv.recon_optimized(new[ids], theta[ids], ids, pars_band)
+        slv_full, rec_full = _solver(data, theta, dark, flat, pars_band)
+        assert slv.band == slv_full.band
+        assert np.allclose(slv.column_stats.sums, slv_full.column_stats.sums)
+        assert _close(rec, rec_full)
+
+
+def test_ring_removal_suppresses_stripes():
+    data, theta, dark, flat = _projections()
+    data[:] = 800
+    _, rec_clean = _solver(data, theta, dark, flat, pars)
+    # detector pixels with a different response
+    data[:, :, [9, 20]] = 700
+    _, rec = _solver(data, theta, dark, flat, pars)
+    pars_ring = pars.copy()
+    pars_ring['ringremoval'] = 1
+    _, rec_ring = _solver(data, theta, dark, flat, pars_ring)
+    err = np.linalg.norm(rec[:, :n]-rec_clean[:, :n])
+    err_ring = np.linalg.norm(rec_ring[:, :n]-rec_clean[:, :n])
+    assert err_ring < 0.1*err
+
+
+def test_wrapped_and_reversed_ids():
+    data, theta, dark, flat = _projections()
+    slv, _ = _solver(data, theta, dark, flat, pars)
+    new, _, _, _ = _projections(1)
+    ids = np.array([18, 19, 0, 1, 9, 8, 7])
+    rec = slv.recon_optimized(new[ids], theta[ids], ids, pars)
+    data[ids] = new[ids]
+    _, rec_full = _solver(data, theta, dark, flat, pars)
+    assert np.all(slv.data == data)
+    assert _close(rec, rec_full)
+
+
+def test_publish_options():
+    data, theta, dark, flat = _projections()
+    slv, rec_full = _solver(data, theta, dark, flat, pars)
+    pars_publish = pars.copy()
+    pars_publish.update({'publishtype': 'UInt8', 'binning': 2, 'crop': 0, 'percentile': 0})
+    # publishing options do not recompute reconstructions
+    assert slv.invalidated_stages(pars_publish) == {'publish'}
+    ids = np.array([7])
+    out = np.empty([n//2, 3*n//2], dtype='uint8')
+    rec = slv.recon_optimized(data[ids], theta[ids], ids, pars_publish, out)
+    assert rec is out
+    assert rec.max() == 255
+
+
+def test_sharded_backprojection():
+    data, theta, dark, flat = _projections()
+    _, rec_full = _solver(data, theta, dark, flat, pars)
+    slv = solver.Solver(ntheta, n, nz, pars, data.dtype, backend='numpy', workers=3)
+    try:
+        slv.set_dark(dark)
+        slv.set_flat(flat)
+        rec = slv.recon_optimized(data, theta, np.arange(ntheta), pars)
+        assert _close(rec, rec_full)
+        # incremental update of slots owned by two workers, and a change of one slice
+        new, _, _, _ = _projections(1)
+        ids = np.array([5, 6, 7])
+        pars_new = pars.copy()
+        pars_new['idz'] += 1
+        rec = slv.recon_optimized(new[ids], theta[ids], ids, pars_new)
+        data[ids] = new[ids]
+        _, rec_full = _solver(data, theta, dark, flat, pars_new)
+        assert _close(rec, rec_full)
+    finally:
+        slv.close()
+
+
+def test_volume_incremental_update():
+    pars_vol = {**pars, 'volume': 'volume', 'volbinning': 2, 'volmemory': 256.0}
+    data, theta, dark, flat = _projections()
+    slv, _ = _solver(data, theta, dark, flat, pars_vol)
+    assert slv.rec_vol.shape == (nz//2, n//2, n//2)
+    new, _, _, _ = _projections(1)
+    ids = np.array([2, 3, 9])
+    slv.recon_optimized(new[ids], theta[ids], ids, pars_vol)
+    data[ids] = new[ids]
+    slv_full, _ = _solver(data, theta, dark, flat, pars_vol)
+    assert _close(slv.rec_vol, slv_full.rec_vol)
+    # switching to maximum intensity projections does not recompute the volume
+    pars_mip = {**pars_vol, 'volume': 'mip'}
+    assert 'volume' not in slv.invalidated_stages(pars_mip)
+    slv.recon_optimized(new[ids], theta[ids], ids, pars_mip)
+    mip = slv.volume_output()
+    assert mip.shape == (n//2, 3*n//2) and _close(mip[:n//2, :n//2], slv.rec_vol.max(axis=0))
+
+
+def test_slab_averages_slices():
+    data, theta, dark, flat = _projections()
+    pars_slab = {**pars, 'slab': 3}
+    _, rec = _solver(data, theta, dark, flat, pars_slab)
+    recs = [_solver(data, theta, dark, flat, {**pars, 'idz': pars['idz']+d})[1][:n, :n] for d in [-1, 0, 1]]
+    assert _close(rec[:n, :n], np.mean(recs, axis=0))
+
+
+def test_slab_band():
+    data, theta, dark, flat = _projections()
+    _, rec_full = _solver(data, theta, dark, flat, {**pars, 'slab': 3})
+    # the z slice only, and rows cropped below the z slice
+    for change in [{'slices': 'z'}, {'zstart': 4, 'zend': 8}]:
+        slv, rec = _solver(data, theta, dark, flat, {**pars, 'slab': 3, **change})
+        assert slv.band[0] <= pars['idz']-1 and slv.band[1] >= pars['idz']+2
+        assert _close(rec[:n, :n], rec_full[:n, :n])
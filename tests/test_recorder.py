@@ -0,0 +1,75 @@
+import threading
+import numpy as np
+import pytest
+from tomostream import recorder
+from tomostream.recorder import Recorder
+
+nz, n = 4, 6
+
+
+def frames(start, count):
+    return np.arange(start, start+count, dtype='uint16')[:, None].repeat(nz*n, axis=1)
+
+
+@pytest.mark.parametrize('format', recorder.formats)
+def test_round_trip(tmp_path, format):
+    if format == 'HDF5':
+        pytest.importorskip('h5py')
+    file_name = str(tmp_path/'scan')
+    rec = Recorder(file_name, 20, nz, n, 'uint16', format, slots=16)
+    rec.set_dark(np.full([nz, n], 5))
+    rec.set_flat(np.full([nz, n], 900))
+    for k in range(0, 12, 4):
+        assert rec.put(frames(k, 4), np.arange(k, k+4)*1.5, np.arange(k, k+4)+100) == 4
+    rec.stop()
+    assert rec.recorded == 12 and rec.skipped == 0
+    proj, dark, dark_start, flat, flat_start, theta, uids = recorder.load(file_name)
+    assert proj.shape == (12, nz, n) and np.all(proj[:, 0, 0] == np.arange(12))
+    assert np.all(theta == np.arange(12)*1.5) and np.all(uids == np.arange(12)+100)
+    assert dark.shape == flat.shape == (1, nz, n) and np.all(dark == 5) and np.all(flat == 900)
+    assert np.all(dark_start == [0]) and np.all(flat_start == [0])
+    assert recorder.is_recording(file_name)
+
+
+@pytest.mark.parametrize('format', recorder.formats)
+def test_fields_changed(tmp_path, format):
+    if format == 'HDF5':
+        pytest.importorskip('h5py')
+    file_name = str(tmp_path/'scan')
+    rec = Recorder(file_name, 20, nz, n, 'uint16', format, slots=16)
+    rec.set_dark(np.full([nz, n], 10))
+    rec.set_flat(np.full([nz, n], 810))
+    # the same object measured with the flat field 810, then 410 after the beam dropped
+    rec.put(np.full([4, nz*n], 410), np.zeros(4), np.arange(1, 5))
+    rec.set_flat(np.full([nz, n], 410))
+    rec.put(np.full([4, nz*n], 210), np.zeros(4), np.arange(5, 9))
+    rec.stop()
+    proj, dark, dark_start, flat, flat_start, _, _ = recorder.load(file_name)
+    assert np.all(dark_start == [0]) and np.all(flat_start == [0, 4])
+    assert np.all(flat[:, 0, 0] == [810, 410])
+    # frames are converted to the fields of the first frame
+    proj = recorder.to_first_fields(proj, dark, dark_start, flat, flat_start)
+    assert proj.dtype == 'uint16' and np.all(proj == 410)
+
+
+def test_skipped_frames(tmp_path):
+    rec = Recorder(str(tmp_path/'scan'), 100, nz, n, 'uint16', 'Memmap', slots=4)
+    # the disk falling behind: writing is held, so the queue is not drained
+    disk = threading.Event()
+    write = rec.file.write
+    rec.file.write = lambda *args: (disk.wait(), write(*args))
+    assert rec.put(frames(0, 10), np.zeros(10), np.arange(1, 11)) == 4
+    assert rec.put(frames(10, 2), np.zeros(2), np.arange(11, 13)) == 0
+    assert rec.skipped == 8 and rec.queue.overruns == 1 and rec.max_depth == 4
+    disk.set()
+    rec.stop()
+    assert rec.recorded == 4
+    assert np.all(recorder.load(str(tmp_path/'scan'))[6] == [1, 2, 3, 4])
+
+
+def test_file_full(tmp_path):
+    rec = Recorder(str(tmp_path/'scan'), 5, nz, n, 'uint16', 'Memmap', slots=8)
+    assert rec.put(frames(0, 8), np.zeros(8), np.arange(1, 9)) == 5
+    assert rec.full and rec.truncated == 3 and rec.skipped == 0
+    rec.stop()
+    assert len(recorder.load(str(tmp_path/'scan'))[0]) == 5
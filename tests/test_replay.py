@@ -0,0 +1,56 @@
+import time
+import numpy as np
+import pytest
+from tomostream import replay
+
+
+def test_scan_order():
+    theta = np.float32([0, 60, 120])
+    ids, angles, mirrored = replay.scan_order(3, theta, 'continuous', 2)
+    assert np.array_equal(ids, [0, 1, 2, 0, 1, 2])
+    assert np.array_equal(angles, [0, 60, 120, 180, 240, 300])
+    assert np.array_equal(mirrored, [0, 0, 0, 1, 1, 1])
+    ids, angles, mirrored = replay.scan_order(3, theta, 'backforth', 3)
+    assert np.array_equal(ids, [0, 1, 2, 2, 1, 0, 0, 1, 2])
+    assert np.array_equal(angles, theta[ids]) and not mirrored.any()
+
+
+@pytest.mark.parametrize('center', [64, 62.5, 67.25])
+def test_mirror_opposite_angle(center):
+    theta = np.float32([30, 210])
+    proj, _, _ = replay.phantom.projections(theta, 128, 8, 'float32', center=center)
+    # the edges of the shifted frame are repeated pixels
+    mirrored, opposite = replay.mirror(proj[0], center)[:, 8:-8], proj[1][:, 8:-8]
+    err = np.linalg.norm(mirrored - opposite)/np.linalg.norm(opposite - opposite.mean())
+    # shifts by whole pixels are exact, others are interpolated across sharp edges of the phantom
+    assert err < (1e-5 if center % 0.5 == 0 else 0.1)
+
+
+def test_first_sweep():
+    proj = np.arange(8)
+    # continuous, and back and forth
+    for theta, count in [([0, 60, 120, 180, 240, 0], 3), ([0, 60, 120, 120, 60, 0, 0, 60], 3), ([0, 60], 2)]:
+        data, angles = replay.first_sweep(proj[:len(theta)], np.float32(theta))
+        assert np.array_equal(data, np.arange(count)) and np.array_equal(angles, theta[:count])
+
+
+def test_bin_frames():
+    data = np.arange(2*4*6, dtype='uint16').reshape(2, 4, 6)
+    binned = replay.bin_frames(data, 2)
+    assert binned.shape == (2, 2, 3) and binned.dtype == 'uint16'
+    assert binned[0, 0, 0] == np.mean(data[0, :2, :2]).astype('uint16')
+
+
+def test_replay_rate():
+    pytest.importorskip('pvaccess')
+    proj, dark, flat, theta = replay.synthetic(32, 16, 30)
+    server = replay.ReplayServer('testReplay:', proj, dark, flat, theta, rate=0.002,
+                                 dark_name='testReplay:Dark', flat_name='testReplay:Flat',
+                                 theta_name='testReplay:Theta')
+    server.start()
+    try:
+        fps, gbps, lost, dropped = replay.measure('testReplay:', 2, 'testReplay:Theta')
+    finally:
+        server.stop()
+    # 1 KB frames at 2 MB/s
+    assert abs(fps - 2000) < 400 and lost == 0 and dropped == 0
@@ -0,0 +1,55 @@
+import numpy as np
+from tomostream import backend
+from tomostream import retrieve_phase
+
+pars = {'pixel_size': 3e-4, 'dist': 10, 'energy': 20, 'alpha': 1e-3}
+
+
+def _reference(data, pixel_size, dist, energy, alpha):
+    """Phase retrieval projection by projection as in tomopy"""
+    [ntheta, dy, dz] = data.shape
+    wavelength = retrieve_phase._wavelength(energy)
+    py = retrieve_phase._calc_pad_width(dy, pixel_size, wavelength, dist)
+    pz = retrieve_phase._calc_pad_width(dz, pixel_size, wavelength, dist)
+    w2 = np.add.outer(retrieve_phase._reciprocal_coord(pixel_size, dy+2*py)**2,
+                      retrieve_phase._reciprocal_coord(pixel_size, dz+2*pz)**2)
+    phase_filter = np.fft.fftshift(retrieve_phase._paganin_filter_factor(energy, dist, alpha, w2))
+    phase_filter /= phase_filter.max()
+    res = np.zeros_like(data)
+    for m in range(ntheta):
+        prj = np.pad(data[m], ((py, py), (pz, pz)), mode='edge')
+        res[m] = np.real(np.fft.ifft2(np.fft.fft2(prj)*phase_filter))[py:py+dy, pz:pz+dz]
+    return res
+
+
+def test_paganin_plan():
+    bk = backend.get_backend('numpy')
+    data = np.random.default_rng(0).random([5, 24, 40]).astype('float32')
+    res_ref = _reference(data, **pars)
+    # small batches to check processing by batches
+    batch_bytes = retrieve_phase.batch_bytes
+    retrieve_phase.batch_bytes = 1
+    retrieve_phase._plans.clear()
+    try:
+        res = retrieve_phase.paganin_filter(data.copy(), **pars, backend=bk)
+    finally:
+        retrieve_phase.batch_bytes = batch_bytes
+    assert np.allclose(res, res_ref, atol=1e-5)
+
+
+def test_plan_cache():
+    bk = backend.get_backend('numpy')
+    plan = retrieve_phase.get_plan((24, 40), **pars, backend=bk)
+    assert retrieve_phase.get_plan((24, 40), **pars, backend=bk) is plan
+    assert retrieve_phase.get_plan((24, 41), **pars, backend=bk) is not plan
+    for k in range(retrieve_phase.plan_cache_size+1):
+        retrieve_phase.get_plan((24, 42+k), **pars, backend=bk)
+    assert len(retrieve_phase._plans) == retrieve_phase.plan_cache_size
+    # the plan used with every new shape is not evicted, the least recently used one is
+    plan = retrieve_phase.get_plan((24, 40), **pars, backend=bk)
+    for k in range(2*retrieve_phase.plan_cache_size):
+        assert retrieve_phase.get_plan((24, 40), **pars, backend=bk) is plan
+        retrieve_phase.get_plan((24, 100+k), **pars, backend=bk)
+    assert retrieve_phase.get_plan((24, 40), **pars, backend=bk) is plan
+    assert (24, 100) not in [key[0] for key in retrieve_phase._plans]
+    assert len(retrieve_phase._plans) == retrieve_phase.plan_cache_size
@@ -0,0 +1,102 @@
+import multiprocessing as mp
+import threading
+import time
+import numpy as np
+from tomostream.ringbuffer import RingBuffer, SharedRingBuffer
+from tomostream.scheduler import Scheduler
+
+
+def test_put_get_release():
+    ring = RingBuffer(4, 6, 'uint16')
+    for k in range(3):
+        assert ring.put(np.full(6, k), 10*k, k)
+    proj, theta, ids = ring.get()
+    assert np.all(proj[:, 0] == [0, 1, 2]) and np.all(theta == [0, 10, 20]) and np.all(ids == [0, 1, 2])
+    # views of slots in the ring, not copies
+    assert np.shares_memory(proj, ring.data)
+    ring.release(2)
+    assert ring.pending() == 1
+
+
+def test_wrap_around():
+    ring = RingBuffer(4, 6, 'uint16')
+    for k in range(3):
+        ring.put(np.full(6, k), k, k)
+    ring.release(len(ring.get()[2]))
+    for k in range(3, 6):
+        ring.put(np.full(6, k), k, k)
+    # contiguous slots up to the end of the ring, then from the start
+    ids = ring.get()[2]
+    assert np.all(ids == [3])
+    ring.release(len(ids))
+    ids = ring.get()[2]
+    assert np.all(ids == [4, 5])
+    assert np.all(ring.get(1)[2] == [4])
+
+
+def test_dropped_frames():
+    ring = RingBuffer(2, 6, 'uint16')
+    for k in range(5):
+        ring.put(np.full(6, k), k, k)
+    assert ring.dropped == 3 and ring.overruns == 1
+    ring.release(1)
+    ring.put(np.full(6, 5), 5, 5)
+    ring.put(np.full(6, 6), 6, 6)
+    assert ring.dropped == 4 and ring.overruns == 2
+    assert np.all(ring.get()[2] == [1])
+
+
+def test_scheduler_modes():
+    ring = RingBuffer(8, 6, 'uint16')
+    sched = Scheduler(ring, poll=0.01)
+    # no frames during the poll interval
+    assert sched.wait() == 0
+    ring.put(np.zeros(6), 0, 0)
+    assert sched.wait('Latency') == 1
+    # frames are coalesced until min_batch frames come or max_wait expires
+    writer = threading.Thread(target=lambda: [(time.sleep(0.01), ring.put(np.zeros(6), k, k)) for k in range(1, 4)])
+    writer.start()
+    assert sched.wait('Throughput', min_batch=4, max_wait=5) == 4
+    writer.join()
+    assert sched.wait('Throughput', min_batch=8, max_wait=0.01) == 4
+
+
+def write_frames(ring, n):
+    for k in range(n):
+        while not ring.put(np.full(6, k), k, k):
+            time.sleep(0.001)
+    ring.close()
+
+
+def test_shared_ring():
+    ctx = mp.get_context('spawn')
+    ring = SharedRingBuffer(4, 6, 'uint16', ctx=ctx)
+    writer = ctx.Process(target=write_frames, args=(ring, 10))
+    writer.start()
+    ids = []
+    while len(ids) < 10:
+        assert ring.wait(1, 5) > 0
+        proj, theta, batch = ring.get()
+        assert np.all(proj[:, 0] == batch) and np.all(theta == batch)
+        ids += list(batch)
+        ring.release(len(batch))
+    writer.join()
+    assert ids == list(range(10))
+    # counters written by the other process
+    assert ring.head == ring.tail == 10
+    ring.close()
+    ring.unlink()
+
+
+def test_shared_ring_attach():
+    ring = SharedRingBuffer(4, 6, 'float32')
+    ring.put(np.arange(6), 1.5, 3, 70000)
+    # attached to the same memory, as in the ingest process
+    other = SharedRingBuffer(**ring.__getstate__())
+    assert other.pending() == 1 and other.ids[0] == 3 and other.theta[0] == 1.5
+    assert other.unique_ids(1)[0] == 70000 and np.all(other.get()[0][0] == np.arange(6))
+    other.release(1)
+    assert ring.pending() == 0
+    other.close()
+    ring.close()
+    ring.unlink()
@@ -0,0 +1,21 @@
+import numpy as np
+from tomostream import util
+
+
+def _check(ids):
+    ids = np.array(ids)
+    runs = util.contiguous_runs(ids)
+    for slots, index in runs:
+        assert np.all(ids[index] == np.arange(slots.start, slots.stop))
+    assert sum(slots.stop-slots.start for slots, _ in runs) == len(ids)
+    return [(slots.start, slots.stop) for slots, _ in runs]
+
+
+def test_contiguous_runs():
+    assert _check(np.arange(5, 12)) == [(5, 12)]
+    # wrap-around the end of the buffer
+    assert _check([6, 7, 0, 1, 2]) == [(6, 8), (0, 3)]
+    # back-and-forth scans fill the buffer in the opposite direction
+    assert _check([4, 3, 2, 7, 8]) == [(2, 5), (7, 9)]
+    assert _check([3, 9, 1]) == [(3, 4), (9, 10), (1, 2)]
+    assert _check([]) == []
@@ -0,0 +1,18 @@
+import numpy as np
+from tomostream import volume
+
+
+def test_binning_fits_memory_budget():
+    # 2048^3 float32 volume binned by 4 takes 512 MB
+    assert volume.binning(2048, 2048, {'volbinning': 4, 'volmemory': 1024}) == 4
+    assert volume.binning(2048, 2048, {'volbinning': 4, 'volmemory': 100}) == 8
+    assert volume.shape(2048, 1024, 8) == (128, 256, 256)
+
+
+def test_mip():
+    vol = np.random.random([4, 8, 8]).astype('float32')
+    mip = volume.output(vol, 'mip', np)
+    assert mip.shape == (8, 24)
+    assert np.all(mip[:8, :8] == vol.max(axis=0))
+    assert np.all(mip[:4, 8:16] == vol.max(axis=1)) and np.all(mip[:4, 16:] == vol.max(axis=2))
+    assert volume.output(vol, 'volume', np) is vol
@@ -0,0 +1,208 @@
+'''
+    Array backends for the reconstruction pipeline
+
+    A backend bundles the array module (CuPy or NumPy), FFT routines, ndimage filters
+    and back-projection kernels used by the Solver class, so the same pipeline runs
+    either on GPU or on CPU.
+'''
+
+import os
+import numpy as np
+
+try:
+    import cupy as cp
+except ImportError:
+    cp = None
+
+
+class CupyBackend():
+    """GPU backend based on CuPy and CUDA raw kernels"""
+
+    name = 'cupy'
+
+    def __init__(self):
+        if cp is None:
+            raise ImportError('CuPy is not installed, use the numpy backend instead')
+        from cupyx.scipy import fft
+        from cupyx.scipy import ndimage
+        from tomostream import kernels
+
+        self.xp = cp
+        self.fft = fft
+        self.ndimage = ndimage
+        self.kernels = kernels
+
+    def to_device(self, data, dtype='float32'):
+        """Copy array to GPU and convert it to the given type"""
+
+        return cp.array(data).astype(dtype, copy=False)
+
+    def to_host(self, data, out=None):
+        """Copy array to CPU, to the preallocated array out if given"""
+
+        return data.get(out=out)
+
+    def rfft(self, data, n=None, axis=-1):
+        return self.fft.rfft(data, n=n, axis=axis, overwrite_x=True)
+
+    def irfft(self, data, n=None, axis=-1):
+        return self.fft.irfft(data, n=n, axis=axis, overwrite_x=True)
+
+    def fft2(self, data, axes=(-2, -1)):
+        return self.fft.fft2(data, axes=axes, overwrite_x=True)
+
+    def ifft2(self, data, axes=(-2, -1)):
+        return self.fft.ifft2(data, axes=axes, overwrite_x=True)
+
+    def mem_total(self):
+        """Total memory of the device in bytes"""
+
+        return cp.cuda.Device().mem_info[1]
+
+    def mem_used(self):
+        """Device memory in use by arrays in bytes"""
+
+        return cp.get_default_memory_pool().used_bytes()
+
+    def free(self):
+        """Free GPU memory"""
+
+        cp.get_default_memory_pool().free_all_blocks()
+
+    def synchronize(self):
+        """Wait for kernels running on the device, e.g. for timing"""
+
+        cp.cuda.Device().synchronize()
+
+
+class NumpyBackend():
+    """CPU backend based on NumPy, scipy.fft with several workers, and vectorized kernels
+
+    Parameters
+    ----------
+    workers : int
+        Number of threads used by scipy.fft, all cores by default
+    """
+
+    name = 'numpy'
+
+    def __init__(self, workers=None):
+        from scipy import fft
+        from scipy import ndimage
+        from tomostream import kernels_cpu
+
+        self.xp = np
+        self.fft = fft
+        self.ndimage = ndimage
+        self.kernels = kernels_cpu
+        self.workers = workers if workers else os.cpu_count()
+
+    def to_device(self, data, dtype='float32'):
+        """Copy array and convert it to the given type, the copy is always done
+        since processing is in-place"""
+
+        return np.array(data, dtype=dtype)
+
+    def to_host(self, data, out=None):
+        """Copy array, so the result is not modified by further processing, to the preallocated array out if given"""
+
+        if out is None:
+            return np.array(data)
+        np.copyto(out, data)
+        return out
+
+    def rfft(self, data, n=None, axis=-1):
+        return self.fft.rfft(data, n=n, axis=axis, overwrite_x=True, workers=self.workers)
+
+    def irfft(self, data, n=None, axis=-1):
+        return self.fft.irfft(data, n=n, axis=axis, overwrite_x=True, workers=self.workers)
+
+    def fft2(self, data, axes=(-2, -1)):
+        return self.fft.fft2(data, axes=axes, overwrite_x=True, workers=self.workers)
+
+    def ifft2(self, data, axes=(-2, -1)):
+        return self.fft.ifft2(data, axes=axes, overwrite_x=True, workers=self.workers)
+
+    def mem_total(self):
+        """Total host memory in bytes"""
+
+        return os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')
+
+    def mem_used(self):
+        """Resident memory of the process in bytes"""
+
+        return host_mem_used()
+
+    def free(self):
+        """Nothing to free, memory is handled by NumPy"""
+
+        pass
+
+    def synchronize(self):
+        """Nothing to wait for, computations are synchronous"""
+
+        pass
+
+
+class NumbaBackend(NumpyBackend):
+    """CPU backend with multi-core Numba back-projection kernels, other stages are the same as
+    in the NumPy backend. Numba is an optional dependency.
+
+    Parameters
+    ----------
+    workers : int
+        Number of threads used by Numba kernels and scipy.fft, all cores by default
+    """
+
+    name = 'numba'
+
+    def __init__(self, workers=None):
+        super().__init__(workers)
+        import numba
+        from tomostream import kernels_numba
+
+        self.kernels = kernels_numba
+        numba.set_num_threads(min(self.workers, numba.config.NUMBA_NUM_THREADS))
+
+
+backends = {
+    'cupy': CupyBackend,
+    'numpy': NumpyBackend,
+    'numba': NumbaBackend,
+}
+
+
+def host_mem_used():
+    """Resident memory of the process in bytes"""
+
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+
+
+def gpu_available():
+    """Check if CuPy is installed and there is at least one GPU"""
+
+    if cp is None:
+        return False
+    try:
+        return cp.cuda.runtime.getDeviceCount() > 0
+    except cp.cuda.runtime.CUDARuntimeError:
+        return False
+
+
+def get_backend(name='auto', **kwargs):
+    """Create backend by name: 'cupy', 'numpy', 'numba', or 'auto' for choosing CuPy when a GPU is available"""
+
+    if name == 'auto':
+        name = 'cupy' if gpu_available() else 'numpy'
+    if name not in backends:
+        raise ValueError(f'unknown backend {name}, choose from {list(backends)}')
+    return backends[name](**kwargs)
+
+
+def from_array(data):
+    """Backend matching the array type"""
+
+    if cp is not None and isinstance(data, cp.ndarray):
+        return CupyBackend()
+    return NumpyBackend()
@@ -0,0 +1,133 @@
+'''
+    Streaming estimation of the rotation center from opposing projections
+
+    A projection at the angle theta+180 is the projection at theta mirrored about the rotation center,
+    so the center is found from the shift maximizing the cross-correlation of gradients of one projection
+    and the mirrored other one. Incoming projections are reduced to a few profiles averaged over bands of detector rows,
+    and kept for every slot of the solver buffer. Every incoming projection is paired with the stored one closest
+    to the opposite angle (for continuous scans, the projection it replaces in the buffer). The shift of a pair
+    is refined to sub-pixel precision by a parabola through the correlation peak, and the estimate is the median
+    over a window of recent pairs, so it is updated only when new opposing pairs arrive.
+'''
+
+import collections
+import numpy as np
+
+
+def mirrored_shift(p, q, maxshift=None):
+    """Shift d of q with respect to mirrored p, q[s] = p[n-1-s+d], for profiles [nbands, n] correlated
+    over all bands. Returns the sub-pixel shift and the normalized correlation at the peak"""
+
+    n = p.shape[-1]
+    maxshift = n//2 if maxshift is None else maxshift
+    # gradients are correlated, so offsets of profiles do not bias the shift towards zero,
+    # profiles are zero padded for linear correlation
+    p = np.gradient(p[..., ::-1], axis=-1)
+    q = np.gradient(q, axis=-1)
+    corr = np.fft.irfft(np.fft.rfft(q, 2*n)*np.conj(np.fft.rfft(p, 2*n)), 2*n).sum(axis=0)
+    norm = np.sqrt(np.sum(p**2)*np.sum(q**2))
+    if norm == 0:
+        return 0.0, 0.0
+    # shifts -maxshift..maxshift
+    corr = np.roll(corr, maxshift)[:2*maxshift+1]
+    k = int(np.argmax(corr))
+    d = float(k - maxshift)
+    if 0 < k < len(corr)-1:
+        # vertex of the parabola through the peak and its neighbours
+        denom = corr[k-1] - 2*corr[k] + corr[k+1]
+        if denom < 0:
+            d += 0.5*(corr[k-1] - corr[k+1])/denom
+    return d, float(max(corr[k]/norm, 0))
+
+
+class CenterEstimator():
+    """Running estimate of the rotation center from pairs of projections 180 degrees apart
+
+    Parameters
+    ----------
+    ntheta : int
+        Number of projections in the solver buffer.
+    n, nz : int
+        The pixel width and height of projections.
+    nbands : int
+        Number of bands of detector rows averaged to profiles.
+    window : int
+        Number of recent pairs the estimate is taken over.
+    """
+
+    def __init__(self, ntheta, n, nz, nbands=4, window=64):
+        self.ntheta = ntheta
+        self.n = n
+        self.nz = nz
+        self.nbands = min(nbands, nz)
+        self.rows = nz//self.nbands*self.nbands
+        self.dark = np.zeros([self.nbands, n], dtype='float32')
+        self.flat = np.ones([self.nbands, n], dtype='float32')
+        # profiles and angles of projections in buffer slots, nan for empty slots
+        self.profiles = np.zeros([ntheta, self.nbands, n], dtype='float32')
+        self.theta = np.full([ntheta], np.nan, dtype='float32')
+        # pairs are accepted with angles differing from 180 by less than a half of the angular step
+        self.tolerance = 90/ntheta
+        self.pairs = collections.deque(maxlen=window)
+
+    def reduce(self, data):
+        """Averages of detector rows [..., nz, n] over bands"""
+
+        data = data[..., :self.rows, :].reshape(*data.shape[:-2], self.nbands, self.rows//self.nbands, self.n)
+        return np.add.reduce(data, axis=-2, dtype='float32')/np.float32(self.rows//self.nbands)
+
+    def set_dark(self, data):
+        """Dark field [nz, n] (already averaged)"""
+
+        self.dark = self.reduce(data)
+
+    def set_flat(self, data):
+        """Flat field [nz, n] (already averaged)"""
+
+        self.flat = self.reduce(data)
+
+    def reset(self):
+        """Forget stored projections and pairs, e.g. after moving the sample"""
+
+        self.theta[:] = np.nan
+        self.pairs.clear()
+
+    def update(self, data, theta, ids):
+        """Pair incoming projections [nproj, nz*n] with stored opposing ones and store them in the slots ids,
+        returns the number of new pairs"""
+
+        data = data.reshape(len(ids), self.nz, self.n)
+        profiles = (self.reduce(data) - self.dark)/np.maximum(self.flat - self.dark, 1e-6)
+        profiles = -np.log(np.maximum(profiles, 1e-6))
+        npairs = 0
+        for k in range(len(ids)):
+            diff = np.abs((self.theta - theta[k]) % 360 - 180)
+            diff[np.isnan(diff)] = np.inf
+            m = int(np.argmin(diff))
+            if diff[m] < self.tolerance:
+                # the stored projection p and the opposing q can be taken in any order
+                d, corr = mirrored_shift(self.profiles[m], profiles[k])
+                self.pairs.append(((d + self.n - 1)/2, corr))
+                npairs += 1
+            self.profiles[ids[k]] = profiles[k]
+            self.theta[ids[k]] = theta[k]
+        return npairs
+
+    @property
+    def estimate(self):
+        """Median of centers over recent pairs, None before the first pair"""
+
+        if len(self.pairs) == 0:
+            return None
+        return float(np.median([center for center, _ in self.pairs]))
+
+    @property
+    def confidence(self):
+        """Mean correlation of recent pairs, times the fraction of pairs agreeing with the estimate within 1 pixel,
+        from 0 to 1"""
+
+        if len(self.pairs) == 0:
+            return 0.0
+        centers, corrs = np.array(list(self.pairs)).T
+        agree = np.abs(centers - self.estimate) <= 1
+        return float(np.mean(corrs)*np.mean(agree))
@@ -0,0 +1,82 @@
+'''
+    Reducing reconstructions for publishing
+
+    Concatenated ortho-slices are cropped, binned and quantized on the device before copying them
+    to the host, so both the device-to-host copy and the published pv shrink. Quantization maps the window
+    between lower and upper percentiles of the reconstruction to the full range of the integer type.
+'''
+
+import numpy as np
+from tomostream import util
+
+# data types of published reconstructions, as names in util.type_dict
+types = {'Float32': 'float32', 'UInt16': 'uint16', 'UInt8': 'uint8'}
+# every k-th pixel in each direction is used for computing percentiles
+percentile_step = 4
+
+
+def slice_size(n, pars):
+    """Size of one published ortho-slice of size n, after cropping and binning"""
+
+    crop = min(max(int(pars.get('crop', 0)), 0), (n-1)//2)
+    binning = max(int(pars.get('binning', 1)), 1)
+    return (n-2*crop)//binning
+
+
+def shape(n, pars):
+    """Shape of published concatenated ortho-slices"""
+
+    m = slice_size(n, pars)
+    return (m, 3*m)
+
+
+def dtype(pars):
+    """Data type of published reconstructions"""
+
+    return types[pars.get('publishtype', 'Float32')]
+
+
+def reduce(obj, pars, bk):
+    """Crop and bin every ortho-slice in concatenated ortho-slices [n, 3n], and quantize the result
+    to the integer type with the window between percentiles, on the device of the backend"""
+
+    xp = bk.xp
+    n = obj.shape[0]
+    crop = min(max(int(pars.get('crop', 0)), 0), (n-1)//2)
+    binning = max(int(pars.get('binning', 1)), 1)
+    m = slice_size(n, pars)
+    res = obj
+    if crop > 0 or binning > 1:
+        res = xp.empty([m, 3*m], dtype='float32')
+        for k in range(3):
+            s = obj[crop:crop+m*binning, k*n+crop:k*n+crop+m*binning]
+            res[:, k*m:(k+1)*m] = s.reshape(m, binning, m, binning).mean(axis=(1, 3))
+    out_type = dtype(pars)
+    if out_type == 'float32':
+        return res
+    # window from percentiles of a subsampled reconstruction, empty regions (zeros) are skipped
+    sample = res[::percentile_step, ::percentile_step]
+    sample = sample[sample != 0]
+    if sample.size == 0:
+        return xp.zeros(res.shape, dtype=out_type)
+    p = float(pars.get('percentile', 0))
+    lo, hi = [float(v) for v in xp.percentile(sample, [p, 100-p])]
+    vmax = np.iinfo(out_type).max
+    scale = np.float32(vmax/max(hi-lo, 1e-12))
+    res = (res-np.float32(lo))*scale
+    xp.clip(res, 0, vmax, out=res)
+    return xp.rint(res).astype(out_type)
+
+
+def ortholines(rec, pars, n):
+    """Draw lines of ortho-slices (NaN for float data, the maximal value for integer types)
+    in reduced ortho-slices of size n"""
+
+    crop = min(max(int(pars.get('crop', 0)), 0), (n-1)//2)
+    binning = max(int(pars.get('binning', 1)), 1)
+    m = rec.shape[0]
+    lines = {}
+    for key in ['idx', 'idy', 'idz']:
+        lines[key] = min(max((int(pars[key])-crop)//binning, 0), max(m-3, 0))
+    value = np.nan if rec.dtype == 'float32' else np.iinfo(rec.dtype).max
+    return util.ortholines(rec, lines, value)
@@ -0,0 +1,76 @@
+'''
+    FBP filters
+
+    Filters are evaluated once for every combination of the projection width, padded size,
+    filter type and backend, and kept in the filter bank. Projections are padded to a fast FFT length
+    to avoid wrap-around artifacts, and a whole chunk is filtered with one batched FFT.
+'''
+
+import numpy as np
+
+# filter windows as functions of the frequency t in [0, 0.5]
+windows = {
+    'Parzen': lambda t: t * (1 - t * 2)**3,
+    'Ramp': lambda t: t,
+    'Shepp-logan': lambda t: np.sin(t),
+    'Butterworth': lambda t: t / (1+pow(2*t, 16)),  # as in tomopy
+    'Hann': lambda t: t * 0.5 * (1 + np.cos(2 * np.pi * t)),
+    'Hamming': lambda t: t * (0.54 + 0.46 * np.cos(2 * np.pi * t)),
+    'Cosine': lambda t: t * np.cos(np.pi * t),
+}
+
+
+def next_fast_len(n):
+    """Smallest length >= n of the form 2^a*3^b*5^c"""
+
+    best = 2 * n
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            p235 = p35
+            while p235 < n:
+                p235 *= 2
+            best = min(best, p235)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+class FilterBank():
+    """Cache of FBP filters for every (n, padded size, filter type, backend)"""
+
+    def __init__(self):
+        self.filters = {}
+
+    def padded_size(self, n):
+        """Fast FFT length for filtering projections of width n, at least 2n to avoid wrap-around"""
+
+        return next_fast_len(2 * n)
+
+    def get(self, n, ne, fbpfilter, bk):
+        """Filter for projections of width n padded to ne, evaluated on the backend device"""
+
+        key = (n, ne, fbpfilter, bk.name)
+        if key not in self.filters:
+            if fbpfilter not in windows:
+                raise ValueError(f'unknown filter {fbpfilter}, choose from {list(windows)}')
+            t = np.fft.rfftfreq(ne).astype('float32')
+            self.filters[key] = bk.to_device(windows[fbpfilter](t))
+        return self.filters[key]
+
+    def apply(self, data, fbpfilter, bk):
+        """Filter a chunk of projections [nproj, nz, n] in-place"""
+
+        n = data.shape[-1]
+        ne = self.padded_size(n)
+        wfilter = self.get(n, ne, fbpfilter, bk)
+        # pad with edge values, the projection is in the middle
+        pad = (ne - n) // 2
+        fdata = bk.xp.pad(data, ((0, 0), (0, 0), (pad, ne - n - pad)), mode='edge')
+        fdata = bk.rfft(fdata, axis=2)
+        fdata *= wfilter
+        data[:] = bk.irfft(fdata, n=ne, axis=2)[..., pad:pad + n]
+
+
+filter_bank = FilterBank()
@@ -0,0 +1,154 @@
+'''
+    Ingest of projections from the detector pv
+
+    Frames are written to the ring buffer either by the monitor callback in the reconstruction process,
+    or by a dedicated ingest process subscribed to the detector pv. In the latter case the ring is placed
+    in shared memory, and the ingest process has its own interpreter, so frames are not dropped
+    because the monitor callback waits for the GIL held by reconstruction, and the two processes
+    can be pinned to different cores.
+'''
+
+import os
+import multiprocessing as mp
+import numpy as np
+from tomostream import log
+from tomostream import util
+from tomostream.ringbuffer import SharedRingBuffer
+
+
+class FrameWriter():
+    """Writer of frames from the detector pv to the ring buffer, together with angles, ids in the solver buffer,
+    and unique ids
+
+    Parameters
+    ----------
+    ring : RingBuffer
+        Ring buffer for frames.
+    datatype : str
+        Detector data type.
+    theta : np.array
+        Angles of all projections in the scan.
+    first_projid : int
+        Unique id of the first projection.
+    buffer_size : int
+        Number of projections in the solver buffer.
+    scan_type : str
+        'continuous' or 'backforth'.
+    span_size : int
+        Number of projections in one direction for back-and-forth scans.
+    """
+
+    def __init__(self, ring, datatype, theta, first_projid, buffer_size, scan_type, span_size):
+        self.ring = ring
+        self.datatype = datatype
+        self.theta = theta
+        self.first_projid = first_projid
+        self.buffer_size = buffer_size
+        self.scan_type = scan_type
+        self.span_size = span_size
+        # frame sizes differ from the ring (e.g. after data binning by ROI1)
+        self.sizes_changed = False
+
+    def count(self, cur_id):
+        """Count the frame, and frames lost or coming out of order by the unique id"""
+
+        ring = self.ring
+        ring.received += 1
+        if ring.last_id == 0 or cur_id >= ring.last_id:
+            if ring.last_id > 0:
+                ring.lost += cur_id - ring.last_id
+            ring.last_id = cur_id + 1
+        else:
+            ring.out_of_order += 1
+
+    def write(self, pv):
+        """Write projection, theta, and id from the pv into the ring buffer"""
+
+        cur_id = np.uint32(pv['uniqueId'])-1 # unique projection id for determining angles and places in the buffers, it starts from 1?
+        self.count(int(cur_id))
+        projection = pv['value'][0][util.type_dict[self.datatype]]
+        if len(projection) != self.ring.size:
+            self.sizes_changed = True
+            return
+        theta = self.theta[min(cur_id-self.first_projid,len(self.theta)-1)]
+        id = cur_id%self.buffer_size
+        if self.scan_type == 'backforth' and (cur_id//self.span_size)%2 == 1:#filling the buffer array in the opposite direction
+            id = (self.span_size - cur_id%self.span_size - 1)%self.buffer_size
+
+        if not self.ring.put(projection, theta, id, cur_id+1):
+            log.warning('ring buffer is full, skip frame: %s dropped, %s overruns', self.ring.dropped, self.ring.overruns)
+        log.info('id: %s, id after sync: %s, id in buffer %s, first_projid %s, theta %s, ring size %s', cur_id, cur_id-self.first_projid, id, self.first_projid, theta, self.ring.pending())
+
+
+def run(writer, image_pv_name, frame_type_pv_name, active, stop, sizes_changed, cpus):
+    """Target of the ingest process: subscribe to the detector pv and write projections to the shared ring
+    while active is set, until stop is set"""
+
+    import pvaccess as pva
+    from epics import PV
+
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    # frame type followed by the callback
+    frame_type_pv = PV(frame_type_pv_name)
+    frame_type = [frame_type_pv.get(as_string=True)]
+    frame_type_pv.add_callback(lambda char_value=None, **kw: frame_type.__setitem__(0, char_value))
+
+    def add_data(pv):
+        if active.is_set() and frame_type[0] == 'Projection':
+            writer.write(pv)
+            if writer.sizes_changed:
+                sizes_changed.set()
+
+    channel = pva.Channel(image_pv_name)
+    channel.monitor(add_data, '')
+    stop.wait()
+    channel.stopMonitor()
+    writer.ring.close()
+
+
+class IngestProcess():
+    """Dedicated process writing frames from the detector pv to a ring buffer in shared memory.
+
+    Parameters
+    ----------
+    image_pv_name : str
+        Name of the pva channel with projections.
+    frame_type_pv_name : str
+        Name of the TomoScan FrameType PV.
+    slots : int
+        Number of frames in the ring.
+    size : int
+        Number of pixels in a frame.
+    cpus : list, optional
+        Cores the ingest process is pinned to.
+    kwargs :
+        Parameters of FrameWriter (datatype, theta, first_projid, buffer_size, scan_type, span_size).
+    """
+
+    def __init__(self, image_pv_name, frame_type_pv_name, slots, size, cpus=None, **kwargs):
+        # the parent process runs threads, so the child is spawned instead of forked
+        ctx = mp.get_context('spawn')
+        self.ring = SharedRingBuffer(slots, size, kwargs['datatype'], ctx=ctx)
+        self.active = ctx.Event()
+        self.stop_event = ctx.Event()
+        self.sizes_changed = ctx.Event()
+        writer = FrameWriter(self.ring, **kwargs)
+        self.process = ctx.Process(target=run, daemon=True,
+                                   args=(writer, image_pv_name, frame_type_pv_name,
+                                         self.active, self.stop_event, self.sizes_changed, cpus))
+
+    def start(self):
+        self.process.start()
+        log.info(f'ingest process {self.process.pid} started')
+
+    def stop(self):
+        """Stop the process, and release the shared memory"""
+
+        self.active.clear()
+        self.stop_event.set()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.unlink()
+        self.ring.close()
@@ -1,9 +1,10 @@
 """
-CUDA Raw kernels for computing back-projection to orthogonal slices
+CUDA Raw kernels for computing back-projection to orthogonal slices, and to stacks of arbitrary planes
 
 """
 
 import cupy as cp
+from cupyx.scipy import ndimage
 
 source = """
 extern "C" {    
@@ -90,6 +91,38 @@ extern "C" {
         }
         f[tx + ty * n] = f0*n;
     }
+
+    void __global__ planes(float *f, float *g, float *theta, float center, float *geometry, int h, int w, int n, int nz, int ntheta)
+    {
+        int tj = blockDim.x * blockIdx.x + threadIdx.x;
+        int ti = blockDim.y * blockIdx.y + threadIdx.y;
+        int p = blockIdx.z;
+        if (tj >= w || ti >= h)
+            return;
+        // origin and axes of the plane
+        float *gp = &geometry[9 * p];
+        float x = gp[0] + tj * gp[3] + ti * gp[6];
+        float y = gp[1] + tj * gp[4] + ti * gp[7];
+        float z = gp[2] + tj * gp[5] + ti * gp[8];
+        float sp = 0;
+        float f0 = 0;
+        int s0 = 0;
+        int ind = 0;
+        if ((z >= 0) && (z <= nz - 1))
+        {
+            int zr = int(roundf(z));
+            for (int k = 0; k < ntheta; k++)
+            {
+                sp = x * __cosf(theta[k]) - y * __sinf(theta[k]) + center; //polar coordinate
+                //linear interpolation
+                s0 = roundf(sp);
+                ind = k * n * nz + zr * n + s0;
+                if ((s0 >= 0) & (s0 < n - 1))
+                    f0 += g[ind] + (g[ind+1] - g[ind]) * (sp - s0) / n;
+            }
+        }
+        f[(p * h + ti) * w + tj] = f0*n;
+    }
 }
 """
 
@@ -97,6 +130,26 @@ module = cp.RawModule(code=source)
 orthox_kernel = module.get_function('orthox')
 orthoy_kernel = module.get_function('orthoy')
 orthoz_kernel = module.get_function('orthoz')
+planes_kernel = module.get_function('planes')
+
+# fused dark-flat field correction with optional negative logarithm, dark and rflat=1/(flat-dark) are broadcast over projections
+normalize_kernel = cp.ElementwiseKernel(
+    'float32 dark, float32 rflat', 'float32 x',
+    'x = (x - dark) * rflat', 'normalize')
+normalize_log_kernel = cp.ElementwiseKernel(
+    'float32 dark, float32 rflat', 'float32 x',
+    'x = -logf(fmaxf((x - dark) * rflat, 1e-6f))', 'normalize_log')
+minus_log_kernel = cp.ElementwiseKernel(
+    '', 'float32 x',
+    'x = -logf(fmaxf(x, 1e-6f))', 'minus_log')
+
+# outliers removal with the box sum over the (2r+1)x(2r+1) neighbourhood, k2=(2r+1)^2
+dezinger_kernel = cp.ElementwiseKernel(
+    'float32 box, float32 k2', 'float32 x',
+    'float m = (box * k2 - x) / (k2 - 1); if (fabsf(x - m) > 0.5f * fabsf(m)) x = m',
+    'dezinger')
+# maximal number of elements in one tile of projections for removing outliers
+dezinger_tile = 2**26
 
 def orthox(data, theta, center, ix, rot):
     """Reconstruct the ortho slice in x-direction on GPU"""
@@ -121,3 +174,34 @@ def orthoz(data, theta, center, iz, rot):
     orthoz_kernel((int(n/32+0.5), int(n/32+0.5)), (32, 32),
                   (objz, data, theta, center, rot, iz, n, nz, ntheta))
     return objz
+
+def planes(data, theta, center, geometry, h, w):
+    """Reconstruct planes [nplanes, h, w] given by origins and axes [nplanes, 3, 3] (see planes.py) on GPU,
+    all planes are computed by one kernel launch"""
+    [ntheta, nz, n] = data.shape
+    geometry = cp.asarray(geometry, dtype='float32')
+    obj = cp.zeros([len(geometry), h, w], dtype='float32')
+    planes_kernel(((w+31)//32, (h+31)//32, len(geometry)), (32, 32),
+                  (obj, data, theta, cp.float32(center), geometry, h, w, n, nz, ntheta))
+    return obj
+
+def normalize(data, dark, rflat, log=False):
+    """Dark-flat field correction of projections in-place on GPU, with taking negative logarithm if log is True"""
+    if log:
+        normalize_log_kernel(dark, rflat, data)
+    else:
+        normalize_kernel(dark, rflat, data)
+
+def minus_log(data):
+    """Taking negative logarithm in-place on GPU"""
+    minus_log_kernel(data)
+
+def dezinger(data, r):
+    """Remove outliers in-place on GPU. Pixels differing from the mean of their (2r+1)x(2r+1) neighbourhood,
+    without the pixel itself, by more than a half of the mean are replaced by the mean"""
+    step = max(1, dezinger_tile // data[0].size)
+    for k in range(0, data.shape[0], step):
+        d = data[k:k + step]
+        box = ndimage.uniform_filter1d(d, 2 * r + 1, axis=1, mode='mirror')
+        ndimage.uniform_filter1d(box, 2 * r + 1, axis=2, output=box, mode='mirror')
+        dezinger_kernel(box, cp.float32((2 * r + 1)**2), d)
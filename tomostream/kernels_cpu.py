@@ -0,0 +1,187 @@
+"""
+Vectorized NumPy versions of the CUDA raw kernels for computing back-projection to orthogonal slices,
+and to stacks of arbitrary planes. Angles are processed by blocks to bound the size of temporary arrays.
+
+"""
+
+import numpy as np
+from scipy import ndimage
+
+# maximal number of elements in temporary arrays for one block of angles
+block_size = 2**25
+# number of elements processed together by several in-place element-wise passes, fitting in cache
+cache_block_size = 2**20
+
+
+def _round(x):
+    """Round half away from zero as roundf in CUDA"""
+
+    return np.trunc(x + np.copysign(np.float32(0.5), x))
+
+
+def _weights(sp, n):
+    """Interpolation indices and weights for detector coordinates sp,
+    following the linear interpolation in the CUDA kernels"""
+
+    s0 = _round(sp)
+    mask = (s0 >= 0) & (s0 < n - 1)
+    w1 = np.where(mask, (sp - s0) / n, 0).astype('float32')
+    w0 = mask.astype('float32') - w1
+    s0 = np.where(mask, s0, 0).astype('int64')
+    return s0, w0, w1
+
+
+def _angle_blocks(ntheta, size):
+    """Split angles into blocks with temporary arrays of given size"""
+
+    step = max(1, block_size // max(size, 1))
+    for k in range(0, ntheta, step):
+        yield slice(k, min(k + step, ntheta))
+
+
+def _backproject_columns(obj, data, theta, center, xr, yr):
+    """Sum over angles of projection columns interpolated at sp = xr*cos(theta)-yr*sin(theta)+center,
+    the same for all rows"""
+
+    [ntheta, nz, n] = data.shape
+    for ks in _angle_blocks(ntheta, nz * n):
+        sp = np.outer(np.cos(theta[ks]), xr) - np.outer(np.sin(theta[ks]), yr) + np.float32(center)
+        s0, w0, w1 = _weights(sp.astype('float32'), n)
+        g = data[ks]
+        obj += np.einsum('kzs,ks->zs', np.take_along_axis(g, s0[:, None, :], axis=2), w0)
+        obj += np.einsum('kzs,ks->zs', np.take_along_axis(g, s0[:, None, :] + 1, axis=2), w1)
+
+
+def orthox(data, theta, center, ix, rot):
+    """Reconstruct the ortho slice in x-direction on CPU"""
+
+    [ntheta, nz, n] = data.shape
+    t = np.arange(n, dtype='float32') - n // 2
+    xr = (ix - n // 2) * np.cos(np.float32(rot)) + t * np.sin(np.float32(rot))
+    yr = -(ix - n // 2) * np.sin(np.float32(rot)) + t * np.cos(np.float32(rot))
+    objx = np.zeros([nz, n], dtype='float32')
+    _backproject_columns(objx, data, theta, center, xr, yr)
+    return objx * n
+
+
+def orthoy(data, theta, center, iy, rot):
+    """Reconstruct the ortho slice in y-direction on CPU"""
+
+    [ntheta, nz, n] = data.shape
+    t = np.arange(n, dtype='float32') - n // 2
+    xr = t * np.cos(np.float32(rot)) + (iy - n // 2) * np.sin(np.float32(rot))
+    yr = -t * np.sin(np.float32(rot)) + (iy - n // 2) * np.cos(np.float32(rot))
+    objy = np.zeros([nz, n], dtype='float32')
+    _backproject_columns(objy, data, theta, center, xr, yr)
+    return objy * n
+
+
+def orthoz(data, theta, center, iz, rot):
+    """Reconstruct the ortho slice in z-direction on CPU"""
+
+    [ntheta, nz, n] = data.shape
+    t = np.arange(n, dtype='float32') - n // 2
+    # rotate plane
+    xr = t * np.cos(np.float32(rot)) + (iz - nz // 2) * np.sin(np.float32(rot))
+    zr = -t * np.sin(np.float32(rot)) + (iz - nz // 2) * np.cos(np.float32(rot)) + nz // 2
+    zmask = (zr >= 0) & (zr <= nz - 1)
+    rows = np.where(zmask, _round(zr), 0).astype('int64')
+
+    objz = np.zeros([n, n], dtype='float32')  # [tx, ty], transposed at the end
+    for ks in _angle_blocks(ntheta, n * n):
+        # sp[k, tx, ty]
+        sp = (np.cos(theta[ks])[:, None, None] * xr[None, :, None]
+              - np.sin(theta[ks])[:, None, None] * t[None, None, :] + np.float32(center))
+        s0, w0, w1 = _weights(sp.astype('float32'), n)
+        g = data[ks][:, rows, :]  # detector rows for each tx
+        objz += np.sum(np.take_along_axis(g, s0, axis=2) * w0, axis=0)
+        objz += np.sum(np.take_along_axis(g, s0 + 1, axis=2) * w1, axis=0)
+    objz[~zmask] = 0
+    return objz.T * n
+
+
+def planes(data, theta, center, geometry, h, w):
+    """Reconstruct planes [nplanes, h, w] given by origins and axes [nplanes, 3, 3] (see planes.py) on CPU, 
+    every block of angles is read once for all planes. Points in a column of a vertical plane with rows 
+    along z (e.g. X-Y ortho-slices) share interpolation weights"""
+
+    [ntheta, nz, n] = data.shape
+    geometry = np.asarray(geometry, dtype='float32')
+    obj = np.zeros([len(geometry), h, w], dtype='float32')
+    i = np.arange(h, dtype='float32')
+    j = np.arange(w, dtype='float32')
+    columns = (np.all(geometry[:, 2] == [0, 0, 1], axis=1) & (geometry[:, 1, 2] == 0))
+    # vertical planes: coordinates of columns and detector rows of plane rows
+    vplanes = []
+    for p in np.flatnonzero(columns):
+        z = geometry[p, 0, 2] + i
+        valid = np.flatnonzero((z >= 0) & (z <= nz - 1))
+        if len(valid) == 0:
+            continue
+        valid = slice(valid[0], valid[-1] + 1)
+        vplanes.append((p, geometry[p, 0, 0] + j*geometry[p, 1, 0], geometry[p, 0, 1] + j*geometry[p, 1, 1],
+                        valid, _round(z[valid]).astype('int64')))
+    # other planes: coordinates of all points
+    gplanes = np.flatnonzero(~columns)
+    x, y, z = [geometry[gplanes, 0, a, None, None] + j[None, None, :]*geometry[gplanes, 1, a, None, None]
+               + i[None, :, None]*geometry[gplanes, 2, a, None, None] for a in range(3)]
+    zmask = (z >= 0) & (z <= nz - 1)
+    rows = np.where(zmask, _round(z), 0).astype('int64')*n
+    for ks in _angle_blocks(ntheta, max(len(gplanes)*h*w, nz*n)):
+        g = data[ks]
+        for p, xr, yr, valid, zr in vplanes:
+            _backproject_columns(obj[p, valid], g[:, zr], theta[ks], center, xr, yr)
+        if len(gplanes) > 0:
+            cost = np.cos(theta[ks])[:, None, None, None]
+            sint = np.sin(theta[ks])[:, None, None, None]
+            s0, w0, w1 = _weights((cost*x - sint*y + np.float32(center)).astype('float32'), n)
+            gflat = g.reshape(-1, nz*n)
+            ind = (rows[None] + s0).reshape(len(gflat), -1)
+            obj[gplanes] += np.sum(np.take_along_axis(gflat, ind, axis=1).reshape(w0.shape)*w0, axis=0)
+            obj[gplanes] += np.sum(np.take_along_axis(gflat, ind + 1, axis=1).reshape(w1.shape)*w1, axis=0)
+    obj[gplanes] *= zmask
+    return obj * n
+
+
+def normalize(data, dark, rflat, log=False):
+    """Dark-flat field correction of projections in-place on CPU, with taking negative logarithm if log is True.
+    Projections are processed by blocks without temporary arrays"""
+
+    step = max(1, cache_block_size // max(dark.size, 1))
+    for k in range(0, data.shape[0], step):
+        d = data[k:k + step]
+        np.subtract(d, dark, out=d)
+        np.multiply(d, rflat, out=d)
+        if log:
+            np.maximum(d, np.float32(1e-6), out=d)
+            np.log(d, out=d)
+            np.negative(d, out=d)
+
+
+def minus_log(data):
+    """Taking negative logarithm in-place on CPU"""
+
+    np.maximum(data, np.float32(1e-6), out=data)
+    np.log(data, out=data)
+    np.negative(data, out=data)
+
+
+def dezinger(data, r):
+    """Remove outliers in-place on CPU. Pixels differing from the mean of their (2r+1)x(2r+1) neighbourhood,
+    without the pixel itself, by more than a half of the mean are replaced by the mean.
+    Projections are processed by tiles bounding the size of temporary arrays"""
+
+    k2 = np.float32((2 * r + 1)**2)
+    step = max(1, cache_block_size // max(data[0].size, 1))
+    for k in range(0, data.shape[0], step):
+        d = data[k:k + step]
+        # separable box sum
+        box = ndimage.uniform_filter1d(d, 2 * r + 1, axis=1, mode='mirror')
+        ndimage.uniform_filter1d(box, 2 * r + 1, axis=2, output=box, mode='mirror')
+        # mean without the pixel itself
+        box *= k2
+        box -= d
+        box /= k2 - 1
+        diff = np.subtract(d, box)
+        np.abs(diff, out=diff)
+        np.copyto(d, box, where=diff > np.float32(0.5) * np.abs(box))
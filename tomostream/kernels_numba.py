@@ -0,0 +1,264 @@
+"""
+Multi-core Numba versions of the CUDA raw kernels for computing back-projection to orthogonal slices
+and to stacks of arbitrary planes.
+Loops are parallelized over blocks of slice rows (columns for orthoz), and angles are processed by
+blocks so that interpolation tables and detector rows stay in cache. Compiled functions
+are cached on disk, so only the first run pays for compilation.
+
+"""
+
+import math
+import numpy as np
+import numba
+
+from tomostream import kernels_cpu
+
+# number of angles and slice rows processed together by one thread
+kblock = 32
+zblock = 8
+xblock = 16
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def _backproject_columns(f, g, s0, w):
+    """Sum over angles of projection columns interpolated with precomputed indices s0 and weights w,
+    the same for all rows (s0<0 for points outside the detector)"""
+
+    [ntheta, nz, n] = g.shape
+    nzb = (nz + zblock - 1) // zblock
+    for bz in numba.prange(nzb):
+        for k0 in range(0, ntheta, kblock):
+            for tz in range(bz * zblock, min((bz + 1) * zblock, nz)):
+                for k in range(k0, min(k0 + kblock, ntheta)):
+                    for t in range(n):
+                        s = s0[k, t]
+                        if s >= 0:
+                            f[tz, t] += g[k, tz, s] + (g[k, tz, s + 1] - g[k, tz, s]) * w[k, t]
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def _orthoz(f, g, cost, sint, center, xr, rows):
+    """Back-projection to the z slice, rows[tx]<0 for points outside the detector"""
+
+    [ntheta, nz, n] = g.shape
+    nxb = (n + xblock - 1) // xblock
+    for bx in numba.prange(nxb):
+        x0 = bx * xblock
+        x1 = min(x0 + xblock, n)
+        acc = np.zeros((x1 - x0, n), dtype=np.float32)
+        for k in range(ntheta):
+            for tx in range(x0, x1):
+                z = rows[tx]
+                if z < 0:
+                    continue
+                for ty in range(n):
+                    sp = xr[tx] * cost[k] - np.float32(ty - n // 2) * sint[k] + center
+                    # round half away from zero as roundf in CUDA
+                    if sp >= 0:
+                        s = int(math.floor(sp + 0.5))
+                    else:
+                        s = -int(math.floor(-sp + 0.5))
+                    if s >= 0 and s < n - 1:
+                        acc[tx - x0, ty] += g[k, z, s] + (g[k, z, s + 1] - g[k, z, s]) * (sp - s) / n
+        for tx in range(x0, x1):
+            for ty in range(n):
+                f[ty, tx] = acc[tx - x0, ty]
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def _planes(f, g, cost, sint, center, geometry, groups):
+    """Back-projection to a stack of planes, parallel over blocks of plane rows. A thread processes
+    all planes for every block of angles, so projections are read once while they stay in cache.
+    Interpolation tables for a block of angles are shared by a group of planes with the same x, y coordinates
+    (e.g. a stack of z slices), and by all rows in a block for vertical planes (e.g. X-Y ortho-slices)"""
+
+    [nplanes, h, w] = f.shape
+    [ntheta, nz, n] = g.shape
+    nib = (h + zblock - 1) // zblock
+    for bi in numba.prange(nib):
+        xs = np.empty(w, dtype=np.float32)
+        ys = np.empty(w, dtype=np.float32)
+        # detector rows of points in a plane row (<0 outside the detector), interpolation indices and weights
+        rows = np.empty(w, dtype=np.int32)
+        s0 = np.empty((kblock, w), dtype=np.int32)
+        ws = np.empty((kblock, w), dtype=np.float32)
+        for k0 in range(0, ntheta, kblock):
+            k1 = min(k0 + kblock, ntheta)
+            for q in range(len(groups) - 1):
+                p0 = groups[q]
+                vertical = geometry[p0, 2, 0] == 0 and geometry[p0, 2, 1] == 0
+                for i in range(bi * zblock, min((bi + 1) * zblock, h)):
+                    if i == bi * zblock or not vertical:
+                        for j in range(w):
+                            xs[j] = geometry[p0, 0, 0] + j * geometry[p0, 1, 0] + i * geometry[p0, 2, 0]
+                            ys[j] = geometry[p0, 0, 1] + j * geometry[p0, 1, 1] + i * geometry[p0, 2, 1]
+                        for k in range(k0, k1):
+                            for j in range(w):
+                                sp = xs[j] * cost[k] - ys[j] * sint[k] + center
+                                # round half away from zero as roundf in CUDA
+                                if sp >= 0:
+                                    s = int(math.floor(sp + 0.5))
+                                else:
+                                    s = -int(math.floor(-sp + 0.5))
+                                s0[k - k0, j] = s if s >= 0 and s < n - 1 else -1
+                                ws[k - k0, j] = (sp - s) / n
+                    for p in range(p0, groups[q + 1]):
+                        frow = f[p, i]
+                        if geometry[p, 1, 2] == 0:
+                            # the same detector row for all points in the plane row
+                            z = geometry[p, 0, 2] + i * geometry[p, 2, 2]
+                            if z < 0 or z > nz - 1:
+                                continue
+                            z = int(math.floor(z + 0.5))
+                            for k in range(k0, k1):
+                                gk = g[k, z]
+                                for j in range(w):
+                                    s = s0[k - k0, j]
+                                    if s >= 0:
+                                        frow[j] += gk[s] + (gk[s + 1] - gk[s]) * ws[k - k0, j]
+                            continue
+                        for j in range(w):
+                            z = geometry[p, 0, 2] + j * geometry[p, 1, 2] + i * geometry[p, 2, 2]
+                            rows[j] = int(math.floor(z + 0.5)) if z >= 0 and z <= nz - 1 else -1
+                        for k in range(k0, k1):
+                            for j in range(w):
+                                z = rows[j]
+                                s = s0[k - k0, j]
+                                if z >= 0 and s >= 0:
+                                    frow[j] += g[k, z, s] + (g[k, z, s + 1] - g[k, z, s]) * ws[k - k0, j]
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def _normalize(data, dark, rflat, log):
+    """Dark-flat field correction with optional negative logarithm in one pass over the data"""
+
+    [nproj, nz, n] = data.shape
+    for k in numba.prange(nproj):
+        for tz in range(nz):
+            for t in range(n):
+                v = (data[k, tz, t] - dark[tz, t]) * rflat[tz, t]
+                if log:
+                    v = -math.log(max(v, np.float32(1e-6)))
+                data[k, tz, t] = v
+
+
+@numba.njit(cache=True)
+def _mirror(j, n):
+    """Index j reflected about the edge pixels of an axis of size n, as mode='mirror' in scipy.ndimage,
+    repeatedly for windows larger than the axis"""
+
+    if n == 1:
+        return 0
+    # reflections have the period 2(n-1)
+    j = abs(j) % (2 * (n - 1))
+    if j > n - 1:
+        return 2 * (n - 1) - j
+    return j
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True)
+def _dezinger(data, r):
+    """Outliers removal, projections are processed in parallel with sums over windows
+    kept for one projection per thread"""
+
+    [nproj, nz, n] = data.shape
+    k2 = np.float32((2 * r + 1)**2)
+    for k in numba.prange(nproj):
+        # sums over window rows
+        rsum = np.empty((nz, n), dtype=np.float32)
+        for tz in range(nz):
+            for t in range(n):
+                s = np.float32(0)
+                for j in range(tz - r, tz + r + 1):
+                    s += data[k, _mirror(j, nz), t]
+                rsum[tz, t] = s
+        for tz in range(nz):
+            for t in range(n):
+                s = np.float32(0)
+                for j in range(t - r, t + r + 1):
+                    s += rsum[tz, _mirror(j, n)]
+                v = data[k, tz, t]
+                m = (s - v) / (k2 - 1)
+                if abs(v - m) > np.float32(0.5) * abs(m):
+                    data[k, tz, t] = m
+
+
+def _tables(theta, center, xr, yr, n):
+    """Interpolation indices and weights for all angles and slice columns"""
+
+    sp = (np.outer(np.cos(theta), xr) - np.outer(np.sin(theta), yr) + np.float32(center)).astype('float32')
+    s0 = kernels_cpu._round(sp)
+    mask = (s0 >= 0) & (s0 < n - 1)
+    w = ((sp - s0) / n).astype('float32')
+    s0 = np.where(mask, s0, -1).astype('int32')
+    return s0, w
+
+
+def orthox(data, theta, center, ix, rot):
+    """Reconstruct the ortho slice in x-direction on CPU with Numba"""
+
+    [ntheta, nz, n] = data.shape
+    t = np.arange(n, dtype='float32') - n // 2
+    xr = (ix - n // 2) * np.cos(np.float32(rot)) + t * np.sin(np.float32(rot))
+    yr = -(ix - n // 2) * np.sin(np.float32(rot)) + t * np.cos(np.float32(rot))
+    objx = np.zeros([nz, n], dtype='float32')
+    _backproject_columns(objx, data, *_tables(theta, center, xr, yr, n))
+    return objx * n
+
+
+def orthoy(data, theta, center, iy, rot):
+    """Reconstruct the ortho slice in y-direction on CPU with Numba"""
+
+    [ntheta, nz, n] = data.shape
+    t = np.arange(n, dtype='float32') - n // 2
+    xr = t * np.cos(np.float32(rot)) + (iy - n // 2) * np.sin(np.float32(rot))
+    yr = -t * np.sin(np.float32(rot)) + (iy - n // 2) * np.cos(np.float32(rot))
+    objy = np.zeros([nz, n], dtype='float32')
+    _backproject_columns(objy, data, *_tables(theta, center, xr, yr, n))
+    return objy * n
+
+
+def orthoz(data, theta, center, iz, rot):
+    """Reconstruct the ortho slice in z-direction on CPU with Numba"""
+
+    [ntheta, nz, n] = data.shape
+    t = np.arange(n, dtype='float32') - n // 2
+    # rotate plane
+    xr = (t * np.cos(np.float32(rot)) + (iz - nz // 2) * np.sin(np.float32(rot))).astype('float32')
+    zr = -t * np.sin(np.float32(rot)) + (iz - nz // 2) * np.cos(np.float32(rot)) + nz // 2
+    rows = np.where((zr >= 0) & (zr <= nz - 1), kernels_cpu._round(zr), -1).astype('int32')
+    objz = np.zeros([n, n], dtype='float32')
+    _orthoz(objz, data, np.cos(theta).astype('float32'), np.sin(theta).astype('float32'),
+            np.float32(center), xr, rows)
+    return objz * n
+
+
+def planes(data, theta, center, geometry, h, w):
+    """Reconstruct planes [nplanes, h, w] given by origins and axes [nplanes, 3, 3] (see planes.py) 
+    on CPU with Numba"""
+
+    geometry = np.ascontiguousarray(geometry, dtype='float32')
+    # groups of consecutive planes with the same x, y coordinates of points
+    xy = geometry[:, :, :2].reshape(len(geometry), -1)
+    groups = np.flatnonzero(np.r_[True, np.any(xy[1:] != xy[:-1], axis=1), True]).astype('int32')
+    obj = np.zeros([len(geometry), h, w], dtype='float32')
+    _planes(obj, data, np.cos(theta).astype('float32'), np.sin(theta).astype('float32'),
+            np.float32(center), geometry, groups)
+    return obj * data.shape[2]
+
+
+def normalize(data, dark, rflat, log=False):
+    """Dark-flat field correction of projections in-place on CPU with Numba, 
+    with taking negative logarithm if log is True"""
+
+    _normalize(data, dark, rflat, log)
+
+
+minus_log = kernels_cpu.minus_log
+
+
+def dezinger(data, r):
+    """Remove outliers in-place on CPU with Numba. Pixels differing from the mean of their (2r+1)x(2r+1)
+    neighbourhood, without the pixel itself, by more than a half of the mean are replaced by the mean"""
+
+    _dezinger(data, int(r))
@@ -0,0 +1,171 @@
+'''
+    Performance counters of streaming
+
+    Counters of frames, gauges of queue depths, rates and memory, and histograms of stage times are kept
+    in one registry, updated by the reconstruction loop and the publishing stage. They are published as status PVs
+    every report interval, and written to a text file in the Prometheus exposition format, which can be scraped
+    e.g. by the node exporter textfile collector. Stage times on the device are measured after synchronizing it.
+'''
+
+import os
+import time
+import threading
+
+# buckets of stage time histograms in seconds
+time_buckets = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10]
+
+# metrics of streaming: name -> (type, help)
+streaming = {
+    'frames_received_total': ('counter', 'Frames received from the detector'),
+    'frames_dropped_total': ('counter', 'Frames dropped because the ring buffer was full'),
+    'frames_lost_total': ('counter', 'Frames missing in the sequence of unique ids'),
+    'frames_out_of_order_total': ('counter', 'Frames received after frames with larger unique ids'),
+    'queue_depth': ('gauge', 'Frames waiting in the ring buffer'),
+    'ingest_bytes_per_second': ('gauge', 'Rate of frames received from the detector'),
+    'stage_seconds': ('histogram', 'Time of processing stages for one batch'),
+    'recon_total': ('counter', 'Reconstructions by kind of recomputation, incremental or full'),
+    'memory_bytes': ('gauge', 'Memory in use on the device and the host'),
+    'record_frames_total': ('counter', 'Frames written to recording files'),
+    'record_skipped_total': ('counter', 'Frames not recorded because the recording queue was full'),
+}
+
+
+class Timer():
+    """Laps of stages on the device, the device is synchronized before reading the clock
+
+    Parameters
+    ----------
+    bk : backend
+        Array backend of the device.
+    """
+
+    def __init__(self, bk):
+        self.bk = bk
+        self.t = time.perf_counter()
+
+    def lap(self):
+        """Time since the previous lap in seconds"""
+
+        self.bk.synchronize()
+        t = time.perf_counter()
+        lap, self.t = t - self.t, t
+        return lap
+
+
+class Histogram():
+    """Counts of observations in cumulative buckets, their number and sum"""
+
+    def __init__(self, buckets=time_buckets):
+        self.buckets = buckets
+        self.counts = [0]*len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for k, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[k] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics():
+    """Registry of counters, gauges and histograms with labels
+
+    Parameters
+    ----------
+    metrics : dict
+        Types and help strings of metrics by names.
+    prefix : str
+        Prefix of metric names in the text file.
+    """
+
+    def __init__(self, metrics=streaming, prefix='tomostream'):
+        self.metrics = metrics
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        # values and histograms by (name, sorted labels)
+        self.values = {}
+        # sums and counts of histograms at the previous interval_mean call
+        self.marks = {}
+
+    @staticmethod
+    def key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        """Increase the counter"""
+
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set the gauge"""
+
+        with self.lock:
+            self.values[self.key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Add the observation to the histogram"""
+
+        key = self.key(name, labels)
+        with self.lock:
+            if key not in self.values:
+                self.values[key] = Histogram()
+            self.values[key].observe(value)
+
+    def get(self, name, **labels):
+        """Value of the counter or gauge, 0 if it was not set"""
+
+        return self.values.get(self.key(name, labels), 0)
+
+    def interval_mean(self, name, **labels):
+        """Mean of histogram observations since the previous call, 0 without observations"""
+
+        key = self.key(name, labels)
+        with self.lock:
+            hist = self.values.get(key)
+            if hist is None:
+                return 0
+            count, total = self.marks.get(key, (0, 0))
+            self.marks[key] = (hist.count, hist.sum)
+        return (hist.sum - total)/(hist.count - count) if hist.count > count else 0
+
+    def text(self):
+        """Metrics in the Prometheus text exposition format"""
+
+        lines = []
+        with self.lock:
+            items = sorted(self.values.items(), key=lambda item: item[0])
+            for name, (kind, help) in self.metrics.items():
+                full = f'{self.prefix}_{name}'
+                lines += [f'# HELP {full} {help}', f'# TYPE {full} {kind}']
+                for (key, labels), value in items:
+                    if key != name:
+                        continue
+                    if kind == 'histogram':
+                        for bound, count in zip(value.buckets, value.counts):
+                            lines.append(f'{full}_bucket{format_labels(labels + (("le", str(bound)),))} {count}')
+                        lines.append(f'{full}_bucket{format_labels(labels + (("le", "+Inf"),))} {value.count}')
+                        lines.append(f'{full}_sum{format_labels(labels)} {value.sum:g}')
+                        lines.append(f'{full}_count{format_labels(labels)} {value.count}')
+                    else:
+                        lines.append(f'{full}{format_labels(labels)} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, file_name):
+        """Write metrics to the text file, replaced at once so readers do not see a partial file"""
+
+        tmp = f'{file_name}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.text())
+        os.replace(tmp, file_name)
+
+
+def format_labels(labels):
+    """Labels of a metric line, e.g. {stage="publish"}"""
+
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
@@ -0,0 +1,108 @@
+'''
+    Reconstruction parameters taken from EPICS PVs
+
+    PVs are read once and then followed by monitor callbacks, every change creates a new immutable
+    snapshot of all parameters with an increased version number. The reconstruction loop takes the current
+    snapshot without Channel Access round trips, and the solver compares versions instead of dictionaries.
+'''
+
+import threading
+import numpy as np
+from tomostream import util
+
+# reconstruction parameters: name -> (PV, read as string, conversion of the PV value)
+pars_pvs = {
+    'center': ('Center', False, np.float32),
+    'idx': ('OrthoX', False, np.int32),
+    'idy': ('OrthoY', False, np.int32),
+    'idz': ('OrthoZ', False, np.int32),
+    'rotx': ('RotX', False, lambda v: np.float32(v/180*np.pi)),
+    'roty': ('RotY', False, lambda v: np.float32(v/180*np.pi)),
+    'rotz': ('RotZ', False, lambda v: np.float32(v/180*np.pi)),
+    'fbpfilter': ('FilterType', True, str),
+    'dezinger': ('Dezinger', True, util.radius),
+    'ringremoval': ('RingRemoval', False, int),
+    # phase retrieval
+    'energy': ('Energy', False, np.float32),
+    'dist': ('Distance', False, np.float32),
+    'alpha': ('Alpha', False, np.float32),
+    'pixelsize': ('PixelSize', False, np.float32),
+    # slices and rows for reconstruction
+    'slices': ('OrthoSlices', True, lambda v: v.lower()),
+    'zstart': ('ZStart', False, np.int32),
+    'zend': ('ZEnd', False, np.int32),
+    'slab': ('SlabThickness', False, int),
+    # reducing published reconstructions
+    'publishtype': ('PublishType', True, str),
+    'binning': ('PublishBinning', True, lambda v: int(v.rstrip('x'))),
+    'crop': ('PublishCrop', False, int),
+    'percentile': ('PublishPercentile', False, float),
+    # decimated volume
+    'volume': ('VolumeMode', True, lambda v: v.lower()),
+    'volbinning': ('VolumeBinning', True, lambda v: int(v.rstrip('x'))),
+    'volmemory': ('VolumeMemory', False, float),
+}
+
+# scheduling of reconstructions, not passed to the solver
+scheduler_pvs = {
+    'mode': ('SchedulerMode', True, str),
+    'minbatch': ('MinBatch', False, int),
+    'maxwait': ('MaxWait', False, lambda v: float(v)/1000),  # ms to s
+}
+
+# applying the rotation center estimated from opposing projections, not passed to the solver
+center_pvs = {
+    'autoapply': ('CenterAutoApply', False, int),
+    'minconfidence': ('CenterMinConfidence', False, float),
+}
+
+
+class Snapshot(dict):
+    """Immutable dictionary of parameters with the version number"""
+
+    def __init__(self, pars, version):
+        super().__init__(pars)
+        self.version = version
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('parameter snapshot is immutable, use copy()')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+class Parameters():
+    """Reconstruction parameters followed by callbacks on EPICS PVs.
+
+    Parameters
+    ----------
+    epics_pvs : dict
+        PV objects by names, as in TomoStream.epics_pvs.
+    pvs : dict, optional
+        Parameters with their PVs and conversions, pars_pvs by default.
+    """
+
+    def __init__(self, epics_pvs, pvs=pars_pvs):
+        self.pvs = pvs
+        self.lock = threading.Lock()
+        pars = {}
+        for key, (name, as_string, convert) in pvs.items():
+            pars[key] = convert(epics_pvs[name].get(as_string=as_string))
+        self.snapshot = Snapshot(pars, 0)
+        for key, (name, _, _) in pvs.items():
+            epics_pvs[name].add_callback(self.callback, key=key)
+
+    def callback(self, value=None, char_value=None, key=None, **kw):
+        """Replace the snapshot with a new one containing the changed parameter"""
+
+        _, as_string, convert = self.pvs[key]
+        value = convert(char_value if as_string else value)
+        with self.lock:
+            pars = self.snapshot.copy()
+            pars[key] = value
+            # assigning the reference is atomic, readers see either the old or the new snapshot
+            self.snapshot = Snapshot(pars, self.snapshot.version+1)
+
+    def get(self):
+        """Current snapshot of parameters"""
+
+        return self.snapshot
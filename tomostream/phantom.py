@@ -0,0 +1,71 @@
+'''
+    Synthetic projections of the 3-D Shepp-Logan phantom
+
+    Projections of ellipsoids are computed analytically from lengths of chords of rays, so data for benchmarks
+    and replay is deterministic and does not need files. Geometry matches the backprojection kernels:
+    the detector column of the point (x, y) at the angle theta is x*cos(theta) - y*sin(theta) + center,
+    and the rotation axis is along detector columns.
+'''
+
+import numpy as np
+
+# ellipsoids of the 3-D Shepp-Logan phantom (Kak and Slaney) in units of the phantom radius:
+# density, semi-axes a, b, c, center x0, y0, z0, rotation about z in degrees
+shepp_logan = np.array([
+    [1.0, 0.69, 0.92, 0.81, 0, 0, 0, 0],
+    [-0.8, 0.6624, 0.874, 0.78, 0, -0.0184, 0, 0],
+    [-0.2, 0.11, 0.31, 0.22, 0.22, 0, 0, -18],
+    [-0.2, 0.16, 0.41, 0.28, -0.22, 0, 0, 18],
+    [0.1, 0.21, 0.25, 0.41, 0, 0.35, -0.15, 0],
+    [0.1, 0.046, 0.046, 0.05, 0, 0.1, 0.25, 0],
+    [0.1, 0.046, 0.046, 0.05, 0, -0.1, 0.25, 0],
+    [0.1, 0.046, 0.023, 0.05, -0.08, -0.605, 0, 0],
+    [0.1, 0.023, 0.023, 0.02, 0, -0.606, 0, 0],
+    [0.1, 0.023, 0.046, 0.02, 0.06, -0.605, 0, 0],
+], dtype='float32')
+
+
+def line_integrals(theta, n, nz, center=None, ellipsoids=shepp_logan):
+    """Line integrals [ntheta, nz, n] of the phantom for angles theta in degrees, in units of the phantom radius.
+    The phantom fills 0.9 of the detector width and height, center is n/2 by default"""
+
+    center = n/2 if center is None else center
+    radius = 0.45*n
+    # detector coordinates in units of the phantom radius
+    s = (np.arange(n, dtype='float32') - np.float32(center))/np.float32(radius)
+    z = (np.arange(nz, dtype='float32') - np.float32(nz/2))/np.float32(0.45*nz)
+    res = np.zeros([len(theta), nz, n], dtype='float32')
+    for k, t in enumerate(np.deg2rad(np.asarray(theta, dtype='float32'))):
+        c, sn = np.cos(t), np.sin(t)
+        for rho, a, b, cz, x0, y0, z0, phi in ellipsoids:
+            # ray through the point s*(cos, -sin) along (sin, cos) in coordinates of the ellipsoid
+            cp, sp = np.cos(np.deg2rad(phi)), np.sin(np.deg2rad(phi))
+            px, py = s*c - x0, -s*sn - y0
+            ux = (px*cp + py*sp)/a
+            uy = (-px*sp + py*cp)/b
+            wx = (sn*cp + c*sp)/a
+            wy = (-sn*sp + c*cp)/b
+            uz = ((z - z0)/cz)[:, None]
+            w2 = wx**2 + wy**2
+            uw = ux*wx + uy*wy
+            # chord length of the line u + t*w through the unit sphere
+            disc = uw**2 - w2*(ux**2 + uy**2 + uz**2 - 1)
+            res[k] += rho*2*np.sqrt(np.maximum(disc, 0))/w2
+    return res
+
+
+def projections(theta, n, nz, dtype='uint16', center=None, absorption=1, noise=0, seed=0):
+    """Detector frames [ntheta, nz, n] of the given type with the phantom, and dark and flat fields [nz, n].
+    Counts of flat fields are 0.8 of the range of integer types, Gaussian noise with the standard deviation
+    noise relative to counts is added with the seeded generator"""
+
+    dtype = np.dtype(dtype)
+    level = 0.8*np.iinfo(dtype).max if dtype.kind in 'iu' else 1
+    dark = np.full([nz, n], 0.01*level, dtype='float32')
+    flat = np.full([nz, n], level, dtype='float32')
+    data = dark + (flat - dark)*np.exp(-np.float32(absorption)*line_integrals(theta, n, nz, center))
+    if noise > 0:
+        data += np.random.default_rng(seed).normal(0, noise*level, data.shape).astype('float32')
+    if dtype.kind in 'iu':
+        data = np.clip(np.round(data), 0, np.iinfo(dtype).max)
+    return data.astype(dtype), dark, flat
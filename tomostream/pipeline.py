@@ -0,0 +1,140 @@
+'''
+    Pipeline of streaming stages
+
+    Stages run in separate threads and hand items over through bounded queues, so e.g. publishing
+    the reconstruction of one batch overlaps computing the next one. Output arrays are taken from
+    a pool of preallocated buffers and returned to the pool by the last stage using them, so a buffer
+    is never overwritten while it is published. Every stage accumulates its busy time
+    (occupancy = busy time / elapsed time) and stall time spent waiting for a full next stage or a free buffer.
+    An item failing in a stage is logged, counted and dropped, so the stage goes on with the next items;
+    stage functions return buffers of items to the pool also when they fail.
+'''
+
+import queue
+import threading
+import time
+import numpy as np
+from tomostream import log
+
+
+class StageStats():
+    """Busy and stall times of a pipeline stage, and the number of failed items"""
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.start = time.perf_counter()
+        self.busy = 0
+        self.stall = 0
+        self.items = 0
+        self.errors = 0
+
+    def occupancy(self):
+        """Part of the elapsed time the stage was busy"""
+
+        return self.busy/max(time.perf_counter()-self.start, 1e-9)
+
+    def __str__(self):
+        errors = f' errors {self.errors}' if self.errors else ''
+        return f'{self.name} {100*self.occupancy():.0f}% stall {self.stall:.2f}s{errors}'
+
+
+class BufferPool():
+    """Pool of preallocated arrays, nbuffers=2 gives double buffering
+
+    Parameters
+    ----------
+    nbuffers : int
+        Number of arrays.
+    shape : tuple
+        Shape of arrays.
+    dtype : str
+        Data type of arrays.
+    """
+
+    def __init__(self, nbuffers, shape, dtype='float32'):
+        self.free = queue.Queue()
+        for _ in range(nbuffers):
+            self.free.put(np.zeros(shape, dtype=dtype))
+
+    def get(self, stats=None):
+        """Take a free array, waiting for it is accounted as the stall time of the stage"""
+
+        t = time.perf_counter()
+        buffer = self.free.get()
+        if stats is not None:
+            stats.stall += time.perf_counter()-t
+        return buffer
+
+    def release(self, buffer):
+        """Return the array to the pool"""
+
+        self.free.put(buffer)
+
+
+class Stage():
+    """Pipeline stage running func(item) in a thread for items from the bounded input queue.
+    The result is handed over to the next stage if given
+
+    Parameters
+    ----------
+    name : str
+        Stage name for reporting.
+    func : callable
+        Function processing one item.
+    maxsize : int, optional
+        Size of the input queue.
+    next_stage : Stage, optional
+        Stage receiving results.
+    """
+
+    def __init__(self, name, func, maxsize=1, next_stage=None):
+        self.func = func
+        self.queue = queue.Queue(maxsize)
+        self.next_stage = next_stage
+        self.stats = StageStats(name)
+        self.thread = None
+
+    def start(self):
+        """Start the stage thread"""
+
+        self.stats.reset()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, item, stats=None):
+        """Hand over an item to the stage, waiting for the full queue is accounted
+        as the stall time of the previous stage"""
+
+        t = time.perf_counter()
+        self.queue.put(item)
+        if stats is not None:
+            stats.stall += time.perf_counter()-t
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            t = time.perf_counter()
+            try:
+                result = self.func(item)
+            except Exception as e:
+                log.error(f'{self.stats.name} stage: {e!r}')
+                self.stats.errors += 1
+                continue
+            finally:
+                self.stats.busy += time.perf_counter()-t
+            self.stats.items += 1
+            if self.next_stage is not None:
+                self.next_stage.put(result, self.stats)
+
+    def stop(self):
+        """Process items left in the queue and stop the thread"""
+
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,63 @@
+'''
+    Geometry of planes for the fused backprojection kernel
+
+    A plane is given by its origin and two axes [3, 3] (rows: origin, u, v), the point in row i and column j
+    of the reconstructed plane is origin + j*u + i*v. Coordinates are (x, y, z) with x, y in pixels relative
+    to the center n//2 of the reconstruction grid, and z in detector rows. The kernel planes(data, theta, center,
+    geometry, h, w) of every backend reconstructs a stack of planes [nplanes, h, w] in one pass over projections,
+    so ortho-slices, oblique planes and slabs of several consecutive planes are computed together.
+'''
+
+import numpy as np
+
+
+def ortho(name, n, nz, index, rot, z0=0):
+    """Plane of the ortho-slice 'orthoz', 'orthoy' or 'orthox' as in the ortho kernels,
+    rows of X-Y slices start from the detector row z0"""
+
+    c = np.cos(np.float32(rot))
+    s = np.sin(np.float32(rot))
+    h = n//2
+    if name == 'orthoz':
+        d = index - nz//2
+        plane = [[-h*c + d*s, -h, h*s + d*c + nz//2], [c, 0, -s], [0, 1, 0]]
+    elif name == 'orthoy':
+        d = index - h
+        plane = [[-h*c + d*s, h*s + d*c, z0], [c, -s, 0], [0, 0, 1]]
+    elif name == 'orthox':
+        d = index - h
+        plane = [[d*c - h*s, -d*s - h*c, z0], [s, c, 0], [0, 0, 1]]
+    else:
+        raise ValueError(f'unknown ortho-slice {name}')
+    return np.array(plane, dtype='float32')
+
+
+def normal(plane):
+    """Unit normal of the plane"""
+
+    nrm = np.cross(plane[1], plane[2])
+    return (nrm/np.linalg.norm(nrm)).astype('float32')
+
+
+def oblique(nrm, offset, nz, h, w):
+    """Plane of size [h, w] with the normal (x, y, z) at the distance offset (in pixels)
+    from the center of the volume"""
+
+    nrm = np.array(nrm, dtype='float64')
+    nrm /= np.linalg.norm(nrm)
+    # in-plane axes with u x v = normal, u is horizontal unless the plane is horizontal
+    e = np.array([0, 1, 0]) if abs(nrm[2]) > 0.999 else np.array([0, 0, 1])
+    u = np.cross(e, nrm)
+    u /= np.linalg.norm(u)
+    v = np.cross(nrm, u)
+    center = np.array([0, 0, nz//2]) + offset*nrm
+    return np.array([center - w/2*u - h/2*v, u, v], dtype='float32')
+
+
+def slab(plane, k, step=1):
+    """Stack of k parallel planes at the distance step along the normal, centered at the plane"""
+
+    shifts = (np.arange(k) - (k-1)/2)*step
+    planes = np.repeat(plane[None], k, axis=0)
+    planes[:, 0] += shifts[:, None]*normal(plane)[None]
+    return planes
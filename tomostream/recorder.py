@@ -0,0 +1,272 @@
+'''
+    Recording of the incoming stream for replaying and profiling sessions offline
+
+    Projections taken by the reconstruction loop from the ring buffer are copied, with their angles and unique ids,
+    to a preallocated queue (a ring buffer of its own) before the ring slots are released, and a writer thread
+    spools them to a file. Queuing never blocks: when the disk falls behind and the queue is full, frames are
+    skipped and counted, as are episodes of the full queue, and the largest queue depth is kept. The file is
+    preallocated for the maximum number of frames, either as a chunked dxchange HDF5 file (/exchange/data,
+    data_dark, data_white, theta, and unique ids in /exchange/uniqueId) or as a directory of memory-mapped
+    .npy arrays. Every dark and flat field is kept with the index of the first frame it is active for
+    (/exchange/data_dark_start and data_white_start, or the index in names of dark_*.npy and flat_*.npy),
+    so frames recorded before and after acquiring new fields are normalized with their own fields.
+    Both formats are read by load(), e.g. for the replay server.
+'''
+
+import os
+import glob
+import time
+import threading
+import numpy as np
+from tomostream import log
+from tomostream.ringbuffer import RingBuffer
+
+formats = ['HDF5', 'Memmap']
+
+
+class Hdf5File():
+    """Chunked HDF5 file in the dxchange layout, one frame per chunk, trimmed to recorded frames on closing"""
+
+    def __init__(self, file_name, nframes, nz, n, dtype):
+        import h5py
+
+        self.fid = h5py.File(file_name, 'w')
+        self.data = self.fid.create_dataset('/exchange/data', [nframes, nz, n], dtype=dtype,
+                                            chunks=(1, nz, n), maxshape=(None, nz, n))
+        self.theta = self.fid.create_dataset('/exchange/theta', [nframes], dtype='float32', maxshape=(None,))
+        self.uids = self.fid.create_dataset('/exchange/uniqueId', [nframes], dtype='int64', maxshape=(None,))
+        self.fields = {}
+        for name, path in [('dark', '/exchange/data_dark'), ('flat', '/exchange/data_white')]:
+            fields = self.fid.create_dataset(path, [0, nz, n], dtype='float32', chunks=(1, nz, n), maxshape=(None, nz, n))
+            starts = self.fid.create_dataset(path + '_start', [0], dtype='int64', maxshape=(None,))
+            self.fields[name] = (fields, starts)
+        self.add_field('dark', 0, np.zeros([nz, n], dtype='float32'))
+        self.add_field('flat', 0, np.ones([nz, n], dtype='float32'))
+
+    def add_field(self, name, start, data):
+        """Dark or flat field active from the frame start, it replaces a field from the same frame"""
+
+        fields, starts = self.fields[name]
+        m = len(starts)
+        if m == 0 or starts[m-1] != start:
+            fields.resize(m+1, axis=0)
+            starts.resize(m+1, axis=0)
+            m += 1
+        fields[m-1] = data
+        starts[m-1] = start
+
+    def write(self, k, frames, theta, uids):
+        self.data[k:k+len(frames)] = frames
+        self.theta[k:k+len(frames)] = theta
+        self.uids[k:k+len(frames)] = uids
+
+    def close(self, count):
+        for dset in [self.data, self.theta, self.uids]:
+            dset.resize(count, axis=0)
+        self.fid.close()
+
+
+class MemmapFile():
+    """Directory of memory-mapped .npy arrays: data, theta, uniqueId, dark, flat.
+    Arrays keep the preallocated size, frames that were not recorded have the unique id 0"""
+
+    def __init__(self, file_name, nframes, nz, n, dtype):
+        os.makedirs(file_name, exist_ok=True)
+        path = lambda name: os.path.join(file_name, f'{name}.npy')
+        self.data = np.lib.format.open_memmap(path('data'), 'w+', dtype, (nframes, nz, n))
+        self.theta = np.lib.format.open_memmap(path('theta'), 'w+', 'float32', (nframes,))
+        self.uids = np.lib.format.open_memmap(path('uniqueId'), 'w+', 'int64', (nframes,))
+        self.path = path
+        self.add_field('dark', 0, np.zeros([nz, n], dtype='float32'))
+        self.add_field('flat', 0, np.ones([nz, n], dtype='float32'))
+
+    def add_field(self, name, start, data):
+        """Dark or flat field active from the frame start, it replaces a field from the same frame"""
+
+        np.save(self.path(f'{name}_{start:012d}'), data)
+
+    def write(self, k, frames, theta, uids):
+        self.data[k:k+len(frames)] = frames
+        self.theta[k:k+len(frames)] = theta
+        self.uids[k:k+len(frames)] = uids
+
+    def close(self, count):
+        for array in [self.data, self.theta, self.uids]:
+            array.flush()
+        self.data = self.theta = self.uids = None
+
+
+def load(file_name):
+    """Recorded projections, dark and flat fields [nfields, nz, n] with indices of the first frames
+    they are active for, angles in degrees, and unique ids, from the HDF5 file or the directory of .npy arrays.
+    Returns proj, dark, dark_start, flat, flat_start, theta, uids"""
+
+    if os.path.isdir(file_name):
+        path = lambda name: os.path.join(file_name, f'{name}.npy')
+        uids = np.load(path('uniqueId'))
+        count = int(np.count_nonzero(uids))
+        proj = np.load(path('data'), mmap_mode='r')[:count]
+        fields = []
+        for name in ['dark', 'flat']:
+            names = sorted(glob.glob(path(f'{name}_*')))
+            fields.append(np.array([np.load(f) for f in names]))
+            fields.append(np.array([int(os.path.basename(f)[len(name)+1:-4]) for f in names]))
+        return (proj, *fields, np.load(path('theta'))[:count], uids[:count])
+
+    import h5py
+
+    with h5py.File(file_name, 'r') as fid:
+        return (fid['/exchange/data'][:], fid['/exchange/data_dark'][:], fid['/exchange/data_dark_start'][:],
+                fid['/exchange/data_white'][:], fid['/exchange/data_white_start'][:],
+                fid['/exchange/theta'][:], fid['/exchange/uniqueId'][:])
+
+
+def is_recording(file_name):
+    """Check if the file or directory was written by Recorder"""
+
+    if os.path.isdir(file_name):
+        return True
+    import h5py
+
+    with h5py.File(file_name, 'r') as fid:
+        return '/exchange/uniqueId' in fid
+
+
+def to_first_fields(proj, dark, dark_start, flat, flat_start):
+    """Frames converted from the dark and flat fields active for them to the fields of the first frame,
+    so the recording is normalized with one pair of fields as in the replay server"""
+
+    frame = np.arange(len(proj))
+    kd = np.searchsorted(dark_start, frame, side='right') - 1
+    kf = np.searchsorted(flat_start, frame, side='right') - 1
+    res = np.array(proj)
+    for i, j in set(zip(kd.tolist(), kf.tolist())) - {(kd[0], kf[0])}:
+        ids = np.flatnonzero((kd == i) & (kf == j))
+        norm = (proj[ids] - dark[i])/np.maximum(flat[j] - dark[i], 1e-6)
+        data = dark[kd[0]] + norm*(flat[kf[0]] - dark[kd[0]])
+        if res.dtype.kind in 'iu':
+            data = np.clip(np.round(data), np.iinfo(res.dtype).min, np.iinfo(res.dtype).max)
+        res[ids] = data
+    return res
+
+
+class Recorder():
+    """Spooler of frames to a preallocated file, frames are queued without blocking and written by a thread
+
+    Parameters
+    ----------
+    file_name : str
+        Name of the HDF5 file, or of the directory for memory-mapped arrays.
+    nframes : int
+        Maximum number of recorded frames, the file is preallocated for them.
+    nz, n : int
+        The pixel height and width of frames.
+    dtype : str
+        Detector data type.
+    format : str
+        'HDF5' or 'Memmap'.
+    slots : int
+        Number of frames in the queue to the writer thread.
+    """
+
+    def __init__(self, file_name, nframes, nz, n, dtype, format='HDF5', slots=256):
+        self.file_name = file_name
+        self.nframes = nframes
+        self.nz = nz
+        self.n = n
+        self.file = {'HDF5': Hdf5File, 'Memmap': MemmapFile}[format](file_name, nframes, nz, n, dtype)
+        self.queue = RingBuffer(slots, nz*n, dtype)
+        # frames not queued because the file is full, the largest queue depth, time and bytes of writing
+        self.truncated = 0
+        self.max_depth = 0
+        self.write_time = 0.0
+        self.write_bytes = 0
+        # dark and flat fields with indices of the first frames they are active for, waiting to be written by the thread
+        self.fields = []
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        log.info(f'recording to {file_name}, {format}, at most {nframes} frames')
+
+    @property
+    def recorded(self):
+        """Frames written to the file"""
+
+        return self.queue.tail
+
+    @property
+    def skipped(self):
+        """Frames skipped because the queue was full"""
+
+        return self.queue.dropped
+
+    @property
+    def full(self):
+        """All frames the file is allocated for were queued"""
+
+        return self.queue.head >= self.nframes
+
+    def put(self, frames, theta, uids):
+        """Copy frames [nproj, nz*n] with angles and unique ids to the queue without blocking,
+        returns the number of queued frames"""
+
+        count = 0
+        for k in range(len(theta)):
+            if self.full or self.stopping.is_set():
+                self.truncated += len(theta) - k
+                break
+            count += self.queue.put(frames[k], theta[k], 0, uids[k])
+        self.max_depth = max(self.max_depth, self.queue.pending())
+        return count
+
+    def set_dark(self, data):
+        """Dark field [nz, n] (already averaged) active for the following frames"""
+
+        with self.lock:
+            self.fields.append(('dark', self.queue.head, np.array(data, dtype='float32').reshape(self.nz, self.n)))
+
+    def set_flat(self, data):
+        """Flat field [nz, n] (already averaged) active for the following frames"""
+
+        with self.lock:
+            self.fields.append(('flat', self.queue.head, np.array(data, dtype='float32').reshape(self.nz, self.n)))
+
+    def write_fields(self):
+        """Write dark and flat fields acquired since the last call"""
+
+        with self.lock:
+            fields, self.fields = self.fields, []
+        for name, start, data in fields:
+            self.file.add_field(name, start, data)
+
+    def run(self):
+        """Writer thread: write queued frames and changed dark and flat fields until stopped and the queue is empty"""
+
+        while True:
+            self.write_fields()
+            if self.queue.wait(1, 0.1) == 0:
+                if self.stopping.is_set():
+                    break
+                continue
+            frames, theta, _ = self.queue.get()
+            uids = self.queue.unique_ids(len(theta))
+            t = time.perf_counter()
+            self.file.write(self.queue.tail, frames.reshape(-1, self.nz, self.n), theta, uids)
+            self.write_time += time.perf_counter() - t
+            self.write_bytes += frames.nbytes
+            self.queue.release(len(theta))
+
+    def stop(self):
+        """Write queued frames and close the file"""
+
+        self.stopping.set()
+        self.thread.join()
+        self.write_fields()
+        self.file.close(self.recorded)
+        log.info(f'recorded {self}')
+
+    def __str__(self):
+        rate = self.write_bytes/self.write_time/1e6 if self.write_time > 0 else 0
+        return (f'{self.recorded}/{self.nframes} frames, {self.skipped} skipped in {self.queue.overruns} overruns, '
+                f'max queue {self.max_depth}/{self.queue.slots}, {rate:.0f} MB/s')
@@ -0,0 +1,340 @@
+'''
+    Local stand-in for the detector and the dark/flat/theta server
+
+    A pvAccess server replaying projections from a dxchange HDF5 file (/exchange/data, data_dark, data_white, theta)
+    or from the synthetic phantom at the given rate in GB/s. It serves the areaDetector channels used by TomoStream,
+    PREFIX:Image (NTNDArray with uniqueId) and PREFIX:DataType_RBV (NTEnum), and the averaged dark and flat fields and
+    angles of the scan as broadcast by tomoscan_stream. Frames are sent in the continuous order, with odd half turns
+    mirrored about the rotation center, or back and forth, and the scan is repeated. Binning can be switched
+    periodically to exercise reinitialization after ROI changes. The client mode writes frames from the server through
+    FrameWriter to a ring buffer, and reports the ingest throughput and dropped frames, so both run on an isolated
+    machine.
+    Channel Access PVs of TomoScan (FrameType, FirstProjid) are not served.
+
+    EXAMPLE
+        python -m tomostream.replay server --file scan.h5 --rate 2 --order backforth
+        python -m tomostream.replay server --synthetic 1024,1024,720 --rate 1 --binning 1,2 --switch 30
+        python -m tomostream.replay client --duration 10
+'''
+
+import time
+import argparse
+import threading
+import numpy as np
+from tomostream import log
+from tomostream import util
+from tomostream import phantom
+from tomostream import recorder
+from tomostream.ringbuffer import RingBuffer
+from tomostream.ingest import FrameWriter
+
+# choices of DataType_RBV as in areaDetector
+data_types = ['Int8', 'UInt8', 'Int16', 'UInt16', 'Int32', 'UInt32', 'Float32', 'Float64']
+
+
+def load_hdf5(file_name):
+    """Projections, averaged dark and flat fields, and angles in degrees from the file in the dxchange layout"""
+
+    import h5py
+
+    with h5py.File(file_name, 'r') as fid:
+        proj = fid['/exchange/data'][:]
+        dark = np.mean(fid['/exchange/data_dark'][:], axis=0, dtype='float32')
+        flat = np.mean(fid['/exchange/data_white'][:], axis=0, dtype='float32')
+        theta = fid['/exchange/theta'][:].astype('float32')
+    return proj, dark, flat, theta
+
+
+def synthetic(n, nz, ntheta, dtype='uint16'):
+    """Projections of the phantom over 180 degrees, dark and flat fields, and angles in degrees"""
+
+    theta = np.linspace(0, 180, ntheta, endpoint=False).astype('float32')
+    proj, dark, flat = phantom.projections(theta, n, nz, dtype, noise=0.01)
+    return proj, dark, flat, theta
+
+
+def bin_frames(data, b):
+    """Average of b x b pixel blocks in the last two dimensions, in the data type of frames"""
+
+    if b == 1:
+        return data
+    [nz, n] = data.shape[-2:]
+    binned = data[..., :nz//b*b, :n//b*b].reshape(*data.shape[:-2], nz//b, b, n//b, b).mean(axis=(-3, -1))
+    return binned.astype(data.dtype)
+
+
+def mirror(frame, center):
+    """Frame mirrored about the rotation center, frame[..., 2*center-s], as the projection at the opposite angle.
+    Positions between pixels are interpolated linearly, pixels beyond the edges are repeated"""
+
+    n = frame.shape[-1]
+    s = np.clip(2*center - np.arange(n), 0, n-1)
+    k = np.minimum(np.floor(s).astype('int64'), max(n-2, 0))
+    w = (s - k).astype('float32')
+    if not w.any():
+        return frame[..., k]
+    res = frame[..., k]*(1-w) + frame[..., np.minimum(k+1, n-1)]*w
+    if frame.dtype.kind in 'iu':
+        res = np.round(res)
+    return res.astype(frame.dtype)
+
+
+def first_sweep(proj, theta):
+    """Projections and angles of the first contiguous run of increasing angles below theta[0]+180,
+    e.g. the first half turn or the forward sweep of a back-and-forth recording"""
+
+    end = (theta >= theta[0] + 180) | np.append(False, np.diff(theta) <= 0)
+    count = int(np.argmax(end)) if end.any() else len(theta)
+    return proj[:count], theta[:count]
+
+
+def scan_order(ntheta, theta, order, nturns=100):
+    """Indices of projections, angles and mirroring flags of frames of the scan with nturns half turns.
+    Continuous scans go on with angles increased by 180 and mirrored projections every half turn,
+    back-and-forth scans go through projections forward and backward"""
+
+    k = np.arange(nturns*ntheta)
+    turn = k//ntheta
+    if order == 'backforth':
+        ids = np.where(turn % 2 == 0, k % ntheta, ntheta-1-k % ntheta)
+        return ids, theta[ids], np.zeros(len(k), dtype='bool')
+    return k % ntheta, theta[k % ntheta] + 180*turn, turn % 2 == 1
+
+
+class ReplayServer():
+    """Server of detector frames, dark and flat fields, and angles over pvAccess
+
+    Parameters
+    ----------
+    prefix : str
+        Prefix of the areaDetector channels, e.g. '2bmbSP2:Pva1:'.
+    proj : np.array
+        Projections [ntheta, nz, n] of the detector type.
+    dark, flat : np.array
+        Averaged dark and flat fields [nz, n].
+    theta : np.array
+        Angles of projections in degrees.
+    rate : float
+        Data rate in GB/s (0 for sending frames as fast as possible).
+    order : str
+        'continuous' or 'backforth'.
+    binnings : list
+        Binnings of frames, switched every switch_period seconds (0 for keeping the first one).
+    dark_name, flat_name, theta_name : str
+        Names of channels with dark and flat fields and angles.
+    nturns : int
+        Number of half turns of the scan with angles on the theta channel, frames of the scan are repeated
+        with increasing uniqueIds after the last one.
+    first_id : int
+        uniqueId of the first frame.
+    center : float, optional
+        Rotation center of projections in pixels, frames of odd half turns of continuous scans are mirrored about it,
+        n/2 by default as for the phantom.
+    """
+
+    def __init__(self, prefix, proj, dark, flat, theta, rate=1, order='continuous', binnings=(1,), switch_period=0,
+                 dark_name='2bmb:TomoScan:PvaDark', flat_name='2bmb:TomoScan:PvaFlat',
+                 theta_name='2bmb:TomoScan:PvaTheta', nturns=100, first_id=1, center=None):
+        import pvaccess as pva
+
+        self.proj = proj
+        self.dark = dark
+        self.flat = flat
+        self.theta = theta
+        self.rate = rate
+        self.order = order
+        self.binnings = list(binnings)
+        self.switch_period = switch_period
+        self.first_id = first_id
+        self.center = proj.shape[-1]/2 if center is None else center
+        self.ids, self.scan_theta, self.mirrored = scan_order(len(theta), theta, order, nturns)
+        self.names = {'image': prefix + 'Image', 'datatype': prefix + 'DataType_RBV',
+                      'dark': dark_name, 'flat': flat_name, 'theta': theta_name}
+
+        datatype = pva.NtEnum()
+        datatype['value'] = {'index': data_types.index(self.type_name()), 'choices': data_types}
+        # dark and flat fields and angles as arrays broadcast by tomoscan_stream
+        records = [pva.NtNdArray(), datatype] + [pva.PvObject({'value': [pva.FLOAT]}) for _ in range(3)]
+        self.server = pva.PvaServer()
+        for key, pv in zip(self.names, records):
+            self.server.addRecord(self.names[key], pv)
+        # changing fields of records posts updates, so frames are composed in another object and posted at once
+        self.pv_image = pva.NtNdArray()
+        self.binning = None
+        self.set_binning(self.binnings[0])
+
+        # frames sent and the time of sending them
+        self.sent = 0
+        self.sent_bytes = 0
+        self.start_time = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def type_name(self):
+        """Detector data type as a DataType_RBV choice"""
+
+        return {'int8': 'Int8', 'uint8': 'UInt8', 'int16': 'Int16', 'uint16': 'UInt16', 'int32': 'Int32',
+                'uint32': 'UInt32', 'float32': 'Float32', 'float64': 'Float64'}[str(self.proj.dtype)]
+
+    def set_binning(self, b):
+        """Bin frames by b, and publish binned dark and flat fields and the scan angles"""
+
+        self.binning = b
+        self.frames = bin_frames(self.proj, b)
+        # binned pixel j averages pixels j*b..j*b+b-1
+        self.frames_center = (self.center - (b-1)/2)/b
+        [nz, n] = self.frames.shape[1:]
+        self.pv_image['dimension'] = [{'size': n, 'fullSize': n*b, 'binning': b},
+                                      {'size': nz, 'fullSize': nz*b, 'binning': b}]
+        self.server.update(self.names['dark'], self.scalar_array(bin_frames(self.dark, b)))
+        self.server.update(self.names['flat'], self.scalar_array(bin_frames(self.flat, b)))
+        self.server.update(self.names['theta'], self.scalar_array(self.scan_theta))
+        log.info(f'frames [{nz}, {n}], binning {b}')
+
+    @staticmethod
+    def scalar_array(data):
+        import pvaccess as pva
+
+        pv = pva.PvObject({'value': [pva.FLOAT]})
+        pv['value'] = np.ascontiguousarray(data, dtype='float32').ravel()
+        return pv
+
+    def frame(self, k):
+        """The k-th frame of the scan"""
+
+        m = k % len(self.ids)
+        frame = self.frames[self.ids[m]]
+        return mirror(frame, self.frames_center) if self.mirrored[m] else frame
+
+    def run(self):
+        """Send frames at the given rate until stopped, the rate is kept by sending every frame
+        at its time in the schedule, so delays are caught up"""
+
+        field = util.type_dict[str(self.proj.dtype)]
+        self.start_time = time.perf_counter()
+        switch_time = self.start_time
+        deadline = self.start_time
+        k = 0
+        while not self.stop_event.is_set():
+            if self.switch_period > 0 and time.perf_counter()-switch_time > self.switch_period:
+                self.set_binning(self.binnings[(self.binnings.index(self.binning)+1) % len(self.binnings)])
+                switch_time = time.perf_counter()
+            frame = self.frame(k)
+            self.pv_image['uniqueId'] = self.first_id + k
+            self.pv_image['value'] = ({field: np.ascontiguousarray(frame).ravel()},)
+            self.server.update(self.names['image'], self.pv_image)
+            self.sent += 1
+            self.sent_bytes += frame.nbytes
+            k += 1
+            if self.rate > 0:
+                deadline += frame.nbytes/(self.rate*1e9)
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    self.stop_event.wait(delay)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.server.stop()
+
+    def achieved_rate(self):
+        """Frames/s and GB/s sent since the start"""
+
+        t = time.perf_counter() - self.start_time
+        return self.sent/t, self.sent_bytes/t/1e9
+
+
+def measure(prefix, duration, theta_name='2bmb:TomoScan:PvaTheta', slots=None):
+    """Receive frames from the server for duration seconds and write them through FrameWriter to a ring buffer
+    emptied by a consumer thread (frames of other sizes after switching binning are counted, but not written).
+    Returns frames/s, GB/s, the number of frames lost in transport (gaps of uniqueId)
+    and the number of frames dropped because the ring was full"""
+
+    import pvaccess as pva
+
+    channel = pva.Channel(prefix + 'Image')
+    image = channel.get('')
+    n, nz = image['dimension'][0]['size'], image['dimension'][1]['size']
+    datatype = pva.Channel(prefix + 'DataType_RBV').get('')['value']
+    datatype = datatype['choices'][datatype['index']].lower()
+    theta = pva.Channel(theta_name).get('')['value']
+    ring = RingBuffer(slots or len(theta), n*nz, datatype)
+    field = util.type_dict[datatype]
+    nbytes = [0]
+    writer = FrameWriter(ring, datatype, theta, first_projid=image['uniqueId']-1, buffer_size=len(theta),
+                         scan_type='continuous', span_size=0)
+
+    def add_data(pv):
+        nbytes[0] += pv['value'][0][field].nbytes
+        writer.write(pv)
+
+    stop = threading.Event()
+
+    def consume():
+        while not stop.is_set():
+            if ring.wait(1, 0.1):
+                ring.release(len(ring.get()[2]))
+
+    consumer = threading.Thread(target=consume, daemon=True)
+    consumer.start()
+    channel.monitor(add_data, '')
+    time.sleep(duration)
+    channel.stopMonitor()
+    stop.set()
+    consumer.join()
+    return ring.received/duration, nbytes[0]/duration/1e9, ring.lost, ring.dropped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay of projections over pvAccess')
+    parser.add_argument('mode', choices=['server', 'client'])
+    parser.add_argument('--prefix', default='2bmbSP2:Pva1:', help='prefix of the areaDetector channels')
+    parser.add_argument('--file', help='dxchange HDF5 file, or a recording of TomoStream (HDF5 file or Memmap directory)')
+    parser.add_argument('--synthetic', default='512,512,720', help='n,nz,ntheta of the phantom without --file')
+    parser.add_argument('--dtype', default='uint16', help='data type of the phantom')
+    parser.add_argument('--center', type=float, help='rotation center in pixels, n/2 by default')
+    parser.add_argument('--rate', type=float, default=1, help='GB/s, 0 for the maximum rate')
+    parser.add_argument('--order', choices=['continuous', 'backforth'], default='continuous')
+    parser.add_argument('--binning', default='1', help='binnings switched every --switch seconds, e.g. 1,2')
+    parser.add_argument('--turns', type=int, default=100, help='half turns of the scan')
+    parser.add_argument('--switch', type=float, default=0, help='period of switching binning in s')
+    parser.add_argument('--theta-name', default='2bmb:TomoScan:PvaTheta')
+    parser.add_argument('--dark-name', default='2bmb:TomoScan:PvaDark')
+    parser.add_argument('--flat-name', default='2bmb:TomoScan:PvaFlat')
+    parser.add_argument('--duration', type=float, default=10, help='time of measuring in the client mode in s')
+    args = parser.parse_args()
+
+    if args.mode == 'client':
+        fps, gbps, lost, dropped = measure(args.prefix, args.duration, args.theta_name)
+        print(f'{fps:.1f} frames/s, {gbps:.3f} GB/s, {lost} lost, {dropped} dropped by the ring')
+    else:
+        if args.file and recorder.is_recording(args.file):
+            proj, dark, dark_start, flat, flat_start, theta, _ = recorder.load(args.file)
+            proj, theta = first_sweep(proj, theta)
+            # frames recorded with later dark and flat fields are served with the first ones
+            proj = recorder.to_first_fields(proj, dark, dark_start, flat, flat_start)
+            dark, flat = dark[0], flat[0]
+        elif args.file:
+            proj, dark, flat, theta = load_hdf5(args.file)
+        else:
+            n, nz, ntheta = [int(v) for v in args.synthetic.split(',')]
+            proj, dark, flat, theta = synthetic(n, nz, ntheta, args.dtype)
+        # recordings of streaming go on over many half turns or sweeps back and forth,
+        # the scan is made of the first frames within 180 degrees from the first angle
+        proj, theta = first_sweep(proj, theta)
+        server = ReplayServer(args.prefix, proj, dark, flat, theta, args.rate, args.order,
+                              [int(v) for v in args.binning.split(',')], args.switch,
+                              args.dark_name, args.flat_name, args.theta_name, args.turns, center=args.center)
+        server.start()
+        try:
+            while True:
+                time.sleep(5)
+                fps, gbps = server.achieved_rate()
+                print(f'{server.sent} frames, {fps:.1f} frames/s, {gbps:.3f} GB/s')
+        except KeyboardInterrupt:
+            server.stop()
@@ -3,8 +3,7 @@ copied from tomopy
 '''
 
 import numpy as np
-import cupy as cp
-from cupy.fft import fft2, ifft2
+from tomostream import backend as backends
 
 BOLTZMANN_CONSTANT = 1.3806488e-16  # [erg/k]
 SPEED_OF_LIGHT = 299792458e+2  # [cm/s]
@@ -16,8 +15,88 @@ def _wavelength(energy):
     return 2 * PI * PLANCK_CONSTANT * SPEED_OF_LIGHT / energy
 
 
+# maximal size in bytes of padded projections processed in one batch
+batch_bytes = 2**30
+# number of phase retrieval plans kept in the cache
+plan_cache_size = 4
+_plans = {}
+
+
+class PaganinPlan():
+    """
+    Phase retrieval plan for projections of the given shape: pad widths and the
+    normalized filter are computed once and kept on the device, projections are padded
+    with edge values and filtered by batches with one FFT per batch.
+
+    Parameters
+    ----------
+    shape : tuple
+        Projection shape (rows, columns).
+    pixel_size : float
+        Detector pixel size in cm.
+    dist : float
+        Propagation distance of the wavefront in cm.
+    energy : float
+        Energy of incident wave in keV.
+    alpha : float
+        Regularization parameter.
+    backend : object
+        Array backend (CuPy or NumPy).
+    pad : bool, optional
+        If True, extend the size of the projections by padding with edge values.
+    """
+
+    def __init__(self, shape, pixel_size, dist, energy, alpha, backend, pad=True):
+        xp = backend.xp
+        dy, dz = shape
+        py, pz = 0, 0
+        if pad:
+            wavelength = _wavelength(energy)
+            py = _calc_pad_width(dy, pixel_size, wavelength, dist)
+            pz = _calc_pad_width(dz, pixel_size, wavelength, dist)
+
+        # Compute the reciprocal grid and the filter in Fourier space.
+        w2 = _reciprocal_grid(pixel_size, dy + 2 * py, dz + 2 * pz, xp)
+        phase_filter = xp.fft.fftshift(
+            _paganin_filter_factor(energy, dist, alpha, w2))
+        self.phase_filter = (phase_filter / phase_filter.max()).astype('float32')
+
+        self.shape = shape
+        self.py, self.pz = py, pz
+        self.backend = backend
+        # complex64 padded projections, with space for temporary arrays in FFT
+        self.batch = max(1, batch_bytes // (8 * 2 * (dy + 2 * py) * (dz + 2 * pz)))
+
+    def apply(self, data):
+        """Retrieve phase for projections [nproj, rows, columns] in-place"""
+
+        xp = self.backend.xp
+        dy, dz = self.shape
+        py, pz = self.py, self.pz
+        for k in range(0, data.shape[0], self.batch):
+            prj = xp.pad(data[k:k + self.batch], ((0, 0), (py, py), (pz, pz)), mode='edge')
+            fproj = self.backend.fft2(prj, axes=(1, 2))
+            fproj *= self.phase_filter
+            data[k:k + self.batch] = self.backend.ifft2(fproj, axes=(1, 2)).real[:, py:dy + py, pz:dz + pz]
+
+
+def get_plan(shape, pixel_size, dist, energy, alpha, backend, pad=True):
+    """Phase retrieval plan from the cache, a new plan is created for new parameters,
+    and the least recently used plan is evicted from the full cache"""
+
+    key = (tuple(shape), float(pixel_size), float(dist), float(energy), float(alpha), backend.name, pad)
+    # dicts keep the insertion order, a used plan is reinserted as the most recent one
+    plan = _plans.pop(key, None)
+    if plan is None:
+        if len(_plans) >= plan_cache_size:
+            _plans.pop(next(iter(_plans)))
+        plan = PaganinPlan(shape, pixel_size, dist, energy, alpha, backend, pad)
+    _plans[key] = plan
+    return plan
+
+
 def paganin_filter(
-        data, pixel_size=1e-4, dist=50, energy=20, alpha=1e-3, pad=True):
+        data, pixel_size=1e-4, dist=50, energy=20, alpha=1e-3, pad=True, backend=None):
     """
     Perform single-step phase retrieval from phase-contrast measurements
     :cite:`Paganin:02`.
@@ -35,7 +114,9 @@ def paganin_filter(
     alpha : float, optional
         Regularization parameter.
     pad : bool, optional
-        If True, extend the size of the projections by padding with zeros.
+        If True, extend the size of the projections by padding with edge values.
+    backend : object, optional
+        Array backend (CuPy or NumPy), chosen by the data type if not given.
 
     Returns
     -------
@@ -43,78 +124,33 @@ def paganin_filter(
         Approximated 3D tomographic phase data.
     """
     
-    # New dimensions and pad value after padding.
-    py, pz, val = _calc_pad(data, pixel_size, dist, energy, pad)
-
-    # Compute the reciprocal grid.
-    dx, dy, dz = data.shape
-    w2 = _reciprocal_grid(pixel_size, dy + 2 * py, dz + 2 * pz)
-
-    # Filter in Fourier space.
-    phase_filter = cp.fft.fftshift(
-        _paganin_filter_factor(energy, dist, alpha, w2))
-
-    prj = cp.full((dy + 2 * py, dz + 2 * pz), val, dtype='float32')
-
-    _retrieve_phase(data, phase_filter, py, pz, prj, pad)
-    # data=data[:,npad:-npad]
+    if backend is None:
+        backend = backends.from_array(data)
+    plan = get_plan(data.shape[1:], pixel_size, dist, energy, alpha, backend, pad)
+    plan.apply(data)
     return data
 
 
-def _retrieve_phase(data, phase_filter, px, py, prj, pad):
-    dx, dy, dz = data.shape
-    num_jobs = data.shape[0]
-    normalized_phase_filter = phase_filter / phase_filter.max()
-
-    for m in range(num_jobs):
-        prj[px:dy + px, py:dz + py] = data[m]
-        prj[:px] = prj[px]
-        prj[-px:] = prj[-px-1]
-        prj[:, :py] = prj[:, py][:, cp.newaxis]
-        prj[:, -py:] = prj[:, -py-1][:, cp.newaxis]
-        fproj = fft2(prj)
-        fproj *= normalized_phase_filter
-        proj = cp.real(ifft2(fproj))
-        if pad:
-            proj = proj[px:dy + px, py:dz + py]
-        data[m] = proj
-
-
-def _calc_pad(data, pixel_size, dist, energy, pad):
+def support_width(pixel_size=1e-4, dist=50, energy=20):
     """
-    Calculate new dimensions and pad value after padding.
+    Number of pixels the filter mixes in each direction, used for padding
+    projections processed by parts.
 
     Parameters
     ----------
-    data : ndarray
-        3D tomographic data.
-    pixel_size : float
+    pixel_size : float, optional
         Detector pixel size in cm.
-    dist : float
+    dist : float, optional
         Propagation distance of the wavefront in cm.
-    energy : float
+    energy : float, optional
         Energy of incident wave in keV.
-    pad : bool
-        If True, extend the size of the projections by padding with zeros.
 
     Returns
     -------
     int
-        Pad amount in projection axis.
-    int
-        Pad amount in sinogram axis.
-    float
-        Pad value.
+        Support width in pixels.
     """
-    dx, dy, dz = data.shape
-    wavelength = _wavelength(energy)
-    py, pz, val = 0, 0, 0
-    if pad:
-        val = _calc_pad_val(data)
-        py = _calc_pad_width(dy, pixel_size, wavelength, dist)
-        pz = _calc_pad_width(dz, pixel_size, wavelength, dist)
-
-    return py, pz, val
+    return int(np.ceil(PI * _wavelength(energy) * dist / pixel_size ** 2))
 
 
 def _paganin_filter_factor(energy, dist, alpha, w2):
@@ -122,15 +158,11 @@ def _paganin_filter_factor(energy, dist, alpha, w2):
 
 
 def _calc_pad_width(dim, pixel_size, wavelength, dist):
-    pad_pix = cp.ceil(PI * wavelength * dist / pixel_size ** 2)
-    return int((pow(2, cp.ceil(cp.log2(dim + pad_pix))) - dim) * 0.5)
-
-
-def _calc_pad_val(data):
-    return cp.mean((data[..., 0] + data[..., -1]) * 0.5)
+    pad_pix = np.ceil(PI * wavelength * dist / pixel_size ** 2)
+    return int((pow(2, np.ceil(np.log2(dim + pad_pix))) - dim) * 0.5)
 
 
-def _reciprocal_grid(pixel_size, nx, ny):
+def _reciprocal_grid(pixel_size, nx, ny, xp=np):
     """
     Calculate reciprocal grid.
 
@@ -140,6 +172,8 @@ def _reciprocal_grid(pixel_size, nx, ny):
         Detector pixel size in cm.
     nx, ny : int
         Size of the reciprocal grid along x and y axes.
+    xp : module, optional
+        Array module (CuPy or NumPy) for the grid.
 
     Returns
     -------
@@ -152,8 +186,8 @@ def _reciprocal_grid(pixel_size, nx, ny):
     np.square(indx, out=indx)
     np.square(indy, out=indy)
 
-    # there is no substitute for np.add.outer using cupy.
-    return cp.array(np.add.outer(indx, indy))
+    # outer sum by broadcasting on the device
+    return xp.asarray(indx)[:, None] + xp.asarray(indy)[None, :]
 
 
 def _reciprocal_coord(pixel_size, num_grid):
@@ -174,6 +208,6 @@ def _reciprocal_coord(pixel_size, num_grid):
         Grid coordinates.
     """
     n = num_grid - 1
-    rc = np.arange(-n, num_grid, 2, dtype=cp.float32)
+    rc = np.arange(-n, num_grid, 2, dtype=np.float32)
     rc *= 0.5 / (n * pixel_size)
     return rc
@@ -0,0 +1,182 @@
+'''
+    Preallocated ring buffer for incoming frames
+
+    The monitor callback copies every frame once into the next slot and advances the write counter.
+    The reconstruction loop takes views of contiguous slots, and releases them once the data is consumed.
+    There is one writer (the monitor callback) and one reader (the reconstruction loop), each of them
+    advances only its own counter, so no locks are needed for the data. The reader can block on a condition
+    variable signalled by the writer instead of polling.
+
+    The ring can be placed in shared memory for the writer running in a separate process (see ingest.py),
+    counters are then kept in the shared memory too, and the condition variable is shared between processes.
+'''
+
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class RingBuffer():
+    """Ring buffer of frames with corresponding angles, ids in the circular buffer of the solver,
+    and unique ids from the detector.
+
+    Parameters
+    ----------
+    slots : int
+        Number of frames in the ring.
+    size : int
+        Number of pixels in a frame.
+    dtype : str
+        Detector data type.
+    """
+
+    def __init__(self, slots, size, dtype):
+        self.slots = slots
+        self.size = size
+        self.data = np.zeros([slots, size], dtype=dtype)
+        self.theta = np.zeros(slots, dtype='float32')
+        self.ids = np.zeros(slots, dtype='int32')
+        self.uids = np.zeros(slots, dtype='int64')
+        # total numbers of written and released frames, slot = counter % slots
+        self.head = 0
+        self.tail = 0
+        # number of frames skipped because the ring was full, and number of times it got full
+        self.dropped = 0
+        self.overruns = 0
+        self.full = False
+        # frames from the detector, frames missing in the sequence of unique ids, frames coming after later ones,
+        # and the last unique id + 1 (0 before the first frame), counted by the writer
+        self.received = 0
+        self.lost = 0
+        self.out_of_order = 0
+        self.last_id = 0
+        self.cond = threading.Condition()
+
+    def pending(self):
+        """Number of written frames that are not released yet"""
+
+        return self.head - self.tail
+
+    def put(self, frame, theta, id, uid=0):
+        """Copy a frame to the next slot, return False if the ring is full and the frame is skipped"""
+
+        if self.head - self.tail >= self.slots:
+            if not self.full:
+                self.overruns += 1
+            self.full = True
+            self.dropped += 1
+            return False
+        self.full = False
+        slot = self.head % self.slots
+        self.data[slot] = frame
+        self.theta[slot] = theta
+        self.ids[slot] = id
+        self.uids[slot] = uid
+        # the slot becomes visible to the reader only after it is written
+        self.head += 1
+        with self.cond:
+            self.cond.notify()
+        return True
+
+    def wait(self, count, timeout=None):
+        """Block until at least count frames are pending or timeout (in seconds) expires,
+        returns the number of pending frames"""
+
+        with self.cond:
+            self.cond.wait_for(lambda: self.head - self.tail >= count, timeout)
+            return self.head - self.tail
+
+    def get(self, nmax=None):
+        """Views of at most nmax contiguous written slots (frames, angles, ids),
+        frames after the end of the ring are returned by the next call"""
+
+        start = self.tail % self.slots
+        count = min(self.head - self.tail, self.slots - start)
+        if nmax is not None:
+            count = min(count, nmax)
+        return self.data[start:start+count], self.theta[start:start+count], self.ids[start:start+count]
+
+    def unique_ids(self, count):
+        """Unique ids of the count slots returned by get"""
+
+        start = self.tail % self.slots
+        return self.uids[start:start+count]
+
+    def release(self, count):
+        """Make count slots returned by get available for writing"""
+
+        self.tail += count
+
+
+class SharedRingBuffer(RingBuffer):
+    """Ring buffer in shared memory, for the writer and the reader in different processes.
+    The ring is attached to the same memory when passed to another process.
+
+    Parameters
+    ----------
+    slots : int
+        Number of frames in the ring.
+    size : int
+        Number of pixels in a frame.
+    dtype : str
+        Detector data type.
+    ctx : multiprocessing context, optional
+        Context for creating the condition variable shared with the writer process.
+    """
+
+    # counters in the shared memory
+    counters = ['head', 'tail', 'dropped', 'overruns', 'full', 'received', 'lost', 'out_of_order', 'last_id']
+
+    def __init__(self, slots, size, dtype, ctx=None, name=None, cond=None):
+        self.slots = slots
+        self.size = size
+        self.dtype = np.dtype(dtype)
+        # 64-byte aligned blocks: counters, theta, ids, unique ids, data
+        self.offsets = np.cumsum([0, -(-len(self.counters)*8//64)*64, -(-slots*4//64)*64, -(-slots*4//64)*64,
+                                  -(-slots*8//64)*64])
+        nbytes = int(self.offsets[-1]) + slots*size*self.dtype.itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.cond = ctx.Condition() if ctx is not None else threading.Condition()
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.cond = cond
+        buf = self.shm.buf
+        self.shared = np.ndarray(len(self.counters), dtype='int64', buffer=buf)
+        self.theta = np.ndarray(slots, dtype='float32', buffer=buf, offset=self.offsets[1])
+        self.ids = np.ndarray(slots, dtype='int32', buffer=buf, offset=self.offsets[2])
+        self.uids = np.ndarray(slots, dtype='int64', buffer=buf, offset=self.offsets[3])
+        self.data = np.ndarray([slots, size], dtype=self.dtype, buffer=buf, offset=self.offsets[4])
+        if name is None:
+            self.shared[:] = 0
+
+    def __getstate__(self):
+        return {'slots': self.slots, 'size': self.size, 'dtype': self.dtype.str,
+                'name': self.shm.name, 'cond': self.cond}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def close(self):
+        """Detach from the shared memory"""
+
+        self.shared = self.theta = self.ids = self.uids = self.data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # views from get() are still used by the reader, memory is unmapped when they are released
+            pass
+
+    def unlink(self):
+        """Release the shared memory, called by the process that created the ring"""
+
+        self.shm.unlink()
+
+
+def _counter(k):
+    return property(lambda self: int(self.shared[k]),
+                    lambda self, value: self.shared.__setitem__(k, value))
+
+
+for k, name in enumerate(SharedRingBuffer.counters):
+    setattr(SharedRingBuffer, name, _counter(k))
@@ -0,0 +1,59 @@
+'''
+    Ring removal in the sinogram domain
+
+    Detector pixels with a response different from their neighbours give vertical stripes in sinograms
+    and rings in reconstructions. The stripe of every detector pixel is estimated as the mean of its values
+    over all projections in the buffer minus the median of these means over neighbouring detector columns.
+    Means are kept as running sums over buffer slots, so replacing projections in the buffer updates them
+    by subtracting the outgoing projections and adding the incoming ones.
+'''
+
+# width of the median filter along detector columns for smoothing column means
+width = 11
+
+
+class ColumnStats():
+    """Running sums of normalized projections over slots of the circular buffer, for a band of detector rows
+
+    Parameters
+    ----------
+    bk : object
+        Array backend (CuPy or NumPy).
+    """
+
+    def __init__(self, bk):
+        self.bk = bk
+        self.sums = None
+        self.count = 0
+        self._stripes = None
+
+    def reset(self, nrows, n):
+        """Empty statistics for projections with nrows detector rows and n columns"""
+
+        # float64 to avoid accumulating round-off errors in running sums
+        self.sums = self.bk.xp.zeros([nrows, n], dtype='float64')
+        self.count = 0
+        self._stripes = None
+
+    def add(self, data):
+        """Add projections [nproj, nrows, n] to the statistics"""
+
+        self.sums += data.sum(axis=0, dtype='float64')
+        self.count += data.shape[0]
+        self._stripes = None
+
+    def remove(self, data):
+        """Remove projections [nproj, nrows, n] from the statistics"""
+
+        self.sums -= data.sum(axis=0, dtype='float64')
+        self.count -= data.shape[0]
+        self._stripes = None
+
+    def stripes(self):
+        """Stripes [nrows, n]: column means minus their median over neighbouring columns,
+        evaluated once after every update of the statistics"""
+
+        if self._stripes is None:
+            mean = (self.sums / max(self.count, 1)).astype('float32')
+            self._stripes = mean - self.bk.ndimage.median_filter(mean, size=(1, width), mode='nearest')
+        return self._stripes
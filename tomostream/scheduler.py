@@ -0,0 +1,48 @@
+'''
+    Scheduling reconstructions of incoming frames
+
+    The reconstruction loop blocks on the ring buffer until frames arrive, and frames are coalesced
+    into batches. In the latency mode a batch is reconstructed as soon as the first frame arrives.
+    In the throughput mode frames are collected until there are at least min_batch of them, or max_wait
+    seconds passed after the first frame, so every call of the solver processes a larger batch.
+'''
+
+import time
+
+modes = ['Latency', 'Throughput']
+
+
+class Scheduler():
+    """Scheduler of reconstructions for frames in the ring buffer.
+
+    Parameters
+    ----------
+    ring : RingBuffer
+        Ring buffer filled by the monitor callback.
+    poll : float, optional
+        Maximal time in seconds the scheduler is blocked without frames,
+        so that the reconstruction loop can check the streaming state.
+    """
+
+    def __init__(self, ring, poll=0.1):
+        self.ring = ring
+        self.poll = poll
+        # size of the last batch and time spent waiting for it
+        self.batch = 0
+        self.wait_time = 0
+
+    def wait(self, mode='Latency', min_batch=1, max_wait=0):
+        """Block until a batch of frames is ready, returns the number of frames in the batch
+        (0 if no frames came in the poll interval)"""
+
+        t = time.perf_counter()
+        if self.ring.wait(1, self.poll) == 0:
+            return 0
+        if mode not in modes:
+            raise ValueError(f'unknown scheduling mode {mode}, choose from {modes}')
+        if mode == 'Throughput':
+            # the ring can not hold more than slots frames
+            self.ring.wait(min(max(min_batch, 1), self.ring.slots), max_wait)
+        self.batch = self.ring.pending()
+        self.wait_time = time.perf_counter() - t
+        return self.batch
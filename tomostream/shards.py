@@ -0,0 +1,179 @@
+'''
+    Angle-sharded backprojection in worker processes
+
+    Backprojection is a sum over projections, so it is split between worker processes owning disjoint
+    ranges of slots of the circular buffer. Filtered projections and angles are kept in shared memory,
+    where the solver writes them after preprocessing. Every worker accumulates ortho-slices of its projections
+    to its own partial [n, 3n] array in shared memory, and the reconstruction is the sum of partial arrays.
+    Incremental updates of a few slots are sent only to workers owning them. Workers are pinned to disjoint
+    sets of cores, or use different GPUs with the cupy backend.
+'''
+
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from tomostream import log
+from tomostream.backend import get_backend
+
+
+def shard_ranges(ntheta, nshards):
+    """Ranges of buffer slots [start, end) owned by shards"""
+
+    bounds = np.linspace(0, ntheta, nshards+1).astype('int')
+    return [(int(bounds[k]), int(bounds[k+1])) for k in range(nshards)]
+
+
+class SharedArrays():
+    """Arrays in one block of shared memory, attached by name in other processes
+
+    Parameters
+    ----------
+    arrays : dict
+        Shapes and data types of arrays by names.
+    name : str, optional
+        Name of the existing shared memory block.
+    """
+
+    def __init__(self, arrays, name=None):
+        self.arrays = arrays
+        offsets = [0]
+        for shape, dtype in arrays.values():
+            # 64-byte aligned arrays
+            offsets.append(offsets[-1] + -(-int(np.prod(shape))*np.dtype(dtype).itemsize//64)*64)
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(offsets[-1], 1))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        for (key, (shape, dtype)), offset in zip(arrays.items(), offsets):
+            setattr(self, key, np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset))
+        if self.owner:
+            for key in arrays:
+                getattr(self, key)[:] = 0
+
+    def __getstate__(self):
+        return {'arrays': self.arrays, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def close(self):
+        """Detach from the shared memory, and release it in the process that created it"""
+
+        for key in self.arrays:
+            setattr(self, key, None)
+        if self.owner:
+            self.shm.unlink()
+        try:
+            self.shm.close()
+        except BufferError:
+            # views are still used, memory is unmapped when they are released
+            pass
+
+
+def run(shard, conn, shared, backend, cpus, device):
+    """Target of the worker process: backproject filtered projections of the owned slots
+    to the partial array on requests from the solver"""
+
+    from tomostream.solver import ShardSolver
+
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    bk = get_backend(backend) if backend == 'cupy' else get_backend(backend, workers=len(cpus or []) or None)
+    if device is not None:
+        bk.xp.cuda.Device(device).use()
+    slv = ShardSolver(shared, bk)
+    partial = shared.partials[shard]
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        kind, ids, slices, pars, band = task
+        slv.pars = pars
+        slv.band = band
+        obj = bk.to_host(slv.backprojection_by_chunks(ids, slices))
+        for name in slices:
+            region = slv.regions[name]
+            if kind == 'full':
+                partial[region] = obj[region]
+            elif kind == 'add':
+                partial[region] += obj[region]
+            else:
+                partial[region] -= obj[region]
+        conn.send(kind)
+    conn.close()
+    slv = partial = None
+    shared.close()
+
+
+class ShardPool():
+    """Pool of worker processes backprojecting disjoint ranges of buffer slots
+
+    Parameters
+    ----------
+    nshards : int
+        Number of worker processes.
+    ntheta : int
+        Number of projections in the buffer.
+    n, nz : int
+        The pixel width and height of projections.
+    backend : str
+        Array backend of workers, for cupy workers use GPUs in turn.
+    """
+
+    def __init__(self, nshards, ntheta, n, nz, backend='numpy'):
+        self.ranges = shard_ranges(ntheta, nshards)
+        self.shared = SharedArrays({
+            'fdata': ([ntheta, nz, n], 'float32'),
+            'theta': ([ntheta], 'float32'),
+            'partials': ([nshards, n, 3*n], 'float32'),
+        })
+        # the solver runs threads, so workers are spawned instead of forked
+        ctx = mp.get_context('spawn')
+        cpus = sorted(os.sched_getaffinity(0))
+        ndevices = 0
+        if backend == 'cupy':
+            ndevices = get_backend('cupy').xp.cuda.runtime.getDeviceCount()
+        self.conns = []
+        self.processes = []
+        for k in range(nshards):
+            conn, child_conn = ctx.Pipe()
+            shard_cpus = cpus[k*len(cpus)//nshards:(k+1)*len(cpus)//nshards] or None
+            process = ctx.Process(target=run, daemon=True,
+                                  args=(k, child_conn, self.shared, backend, shard_cpus,
+                                        k % ndevices if ndevices else None))
+            process.start()
+            self.conns.append(conn)
+            self.processes.append(process)
+        log.info(f'{nshards} backprojection workers for slots {self.ranges}')
+
+    def run(self, kind, ids, slices, pars, band):
+        """Backproject ids by workers owning them, and wait for the result in partial arrays"""
+
+        ids = np.asarray(ids)
+        waiting = []
+        for (start, end), conn in zip(self.ranges, self.conns):
+            own = ids[(ids >= start) & (ids < end)]
+            if len(own) > 0 or kind == 'full':
+                conn.send((kind, own, slices, dict(pars), band))
+                waiting.append(conn)
+        for conn in waiting:
+            conn.recv()
+
+    def reduce(self, out):
+        """Sum partial arrays of all workers to out on the host"""
+
+        np.sum(self.shared.partials, axis=0, out=out)
+        return out
+
+    def close(self):
+        """Stop workers and release the shared memory"""
+
+        for conn in self.conns:
+            conn.send(None)
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+        self.shared.close()
@@ -1,11 +1,32 @@
-import cupy as cp
 import numpy as np
-from cupyx.scipy.fft import rfft, irfft
-from cupyx.scipy import ndimage
-from tomostream import kernels
 from tomostream import retrieve_phase
+from tomostream import filters
+from tomostream import rings
+from tomostream import util
+from tomostream import display
+from tomostream import shards
+from tomostream import volume
+from tomostream import planes
+from tomostream import metrics
+from tomostream.backend import get_backend
 from tomostream import log
 
+# ortho-slices in the order they are concatenated in the reconstruction array
+ortho_slices = ['orthoz', 'orthoy', 'orthox']
+
+# Invalidation graph: parameters invalidating each stage of the processing pipeline,
+# backprojection stages are separate for every ortho-slice. 
+# Invalidating preprocessing also invalidates backprojection of all slices.
+# Publishing options only change reducing the result, which is done for every update.
+stage_pars = {
+    'preprocessing': ['fbpfilter', 'dezinger', 'energy', 'dist', 'alpha', 'pixelsize', 'ringremoval'],
+    'orthoz': ['idz', 'rotz', 'center', 'slices', 'slab'],
+    'orthoy': ['idy', 'roty', 'center', 'slices', 'zstart', 'zend', 'slab'],
+    'orthox': ['idx', 'rotx', 'center', 'slices', 'zstart', 'zend', 'slab'],
+    'volume': ['center', 'volbinning', 'volmemory'],
+    'publish': ['publishtype', 'binning', 'crop', 'percentile', 'volume'],
+}
+
 class Solver():
     """Class for tomography reconstruction of ortho-slices through direct 
     discreatization of circular integrals in the Radon transform.
@@ -25,8 +46,8 @@ class Solver():
             Rotation angles for X-Y-Z slices
         fbpfilter: str
             Reconstruction filter
-        dezinger: str
-            None or radius for removing outliers
+        dezinger: int
+            0 or radius for removing outliers
         energy: float32
             Beam energy
         dist: float32
@@ -35,104 +56,253 @@ class Solver():
             Tuning parameter for phase retrieval
         pixelsize: float32
             Detector pixel size
+        ringremoval: int, optional
+            0 (default) or 1 for removing rings with running column statistics
+        slices: str, optional
+            Axes of ortho-slices to reconstruct, e.g. 'xyz' (default) or 'z'
+        zstart, zend: int, optional
+            Range of rows for X-Y slices (default: all rows)
+        slab: int, optional
+            Number of consecutive planes averaged for every slice (default: 1)
+        publishtype, binning, crop, percentile: optional
+            Options for reducing the result on the device, see display.reduce
+        volume, volbinning, volmemory: optional
+            'off' (default), 'volume' or 'mip' for reconstructing the decimated volume, 
+            its binning and the memory budget in MB, see volume.py
     datatype: str
         Detector data type.
+    backend: str
+        Array backend: 'cupy' (GPU), 'numpy' (CPU), 'numba' (multi-core CPU kernels), 
+        or 'auto' for using GPU when available
+    workers: int, optional
+        Number of processes sharing backprojection by ranges of buffer slots (1 for backprojection in this process)
     """
 
-    def __init__(self, ntheta, n, nz, pars, datatype):
+    def __init__(self, ntheta, n, nz, pars, datatype, backend='auto', workers=1):
         
-        self.n = n
-        self.nz = nz
-        self.ntheta = ntheta        
+        self.bk = get_backend(backend)
+        self.xp = self.bk.xp
+        log.info(f'{self.bk.name} backend')
+        self.init_state(ntheta, n, nz, pars)
         
         #CPU storage for the buffer
         self.data = np.zeros([ntheta, nz, n], dtype=datatype)
         self.theta = np.zeros([ntheta], dtype='float32')
         # GPU storage for dark and flat fields
-        self.dark = cp.array(cp.zeros([nz, n]), dtype='float32')
-        self.flat = cp.array(cp.ones([nz, n]), dtype='float32')
+        self.dark = self.xp.zeros([nz, n], dtype='float32')
+        self.flat = self.xp.ones([nz, n], dtype='float32')
+        self.rflat = self.xp.ones([nz, n], dtype='float32') # 1/(flat-dark)
         # GPU storages for ortho-slices, and angles        
-        self.obj = cp.zeros([n, 3*n], dtype='float32')# ortho-slices are concatenated to one 2D array
-        
-        # reconstruction parameters 
+        self.obj = self.xp.zeros([n, 3*n], dtype='float32')# ortho-slices are concatenated to one 2D array
+
+        # workers backprojecting ranges of buffer slots, with filtered projections and angles in shared memory
+        self.shards = None
+        if workers > 1:
+            self.shards = shards.ShardPool(workers, ntheta, n, nz, self.bk.name)
+            self.theta = self.shards.shared.theta
+            # sum of partial reconstructions of workers
+            self.obj_host = self.obj if self.xp is np else np.zeros([n, 3*n], dtype='float32')
+
+        # cache of filtered projections for every buffer slot, kept on GPU if it takes less than 1/4 of the memory
+        self.fdata_on_device = self.shards is None and ntheta*nz*n*4 < self.bk.mem_total()/4
+        if self.shards is not None:
+            self.fdata = self.shards.shared.fdata
+        elif self.fdata_on_device:
+            self.fdata = self.xp.zeros([ntheta, nz, n], dtype='float32')
+        else:
+            self.fdata = np.zeros([ntheta, nz, n], dtype='float32')
+        log.info(f'cache of filtered projections on {"device" if self.fdata_on_device else "host"}')
+
+        # running statistics of normalized projections in the buffer for ring removal, 
+        # for rows processed with the band
+        self.column_stats = rings.ColumnStats(self.bk)
+
+        # decimated volume updated together with ortho-slices, allocated when the volume mode is on
+        self.rec_vol = None
+        self.vol_binning = None
+
+        # flag controlling appearance of new dark and flat fields   
+        self.new_dark_flat = False
+
+    def init_state(self, ntheta, n, nz, pars):
+        """Sizes, regions of ortho-slices, chunk size, parameters and the band of rows,
+        shared by the solver and backprojection workers (see ShardSolver)"""
+
+        self.n = n
+        self.nz = nz
+        self.ntheta = ntheta
+        # regions of ortho-slices in the concatenated array, each region is an accumulator updated independently
+        self.regions = {'orthoz': np.s_[:n, :n], 'orthoy': np.s_[:nz, n:2*n], 'orthox': np.s_[:nz, 2*n:3*n]}
+
+        # reconstruction parameters, and the version of the snapshot they were taken from
         self.pars = pars
+        self.pars_version = None
 
         # calculate chunk size fo gpu
-        mem = cp.cuda.Device().mem_info[1]
-        self.chunk = min(self.ntheta,int(np.ceil(mem/self.n/self.nz/32)))#cuda raw kernels do not work with huge sizes (issue in cupy?)
+        self.chunk = min(self.ntheta,int(np.ceil(self.bk.mem_total()/self.n/self.nz/32)))#cuda raw kernels do not work with huge sizes (issue in cupy?)
         log.warning(f'chunk size {self.chunk}')
 
-        # flag controlling appearance of new dark and flat fields   
-        self.new_dark_flat = False
+        # band of detector rows [start, end) with valid filtered projections in the cache
+        self.band = (0, 0)
+
+        # times of stages of the last reconstruction in seconds, and its kind ('incremental' or 'full')
+        self.timings = {}
+        self.update_kind = None
     
     def free(self):
         """Free GPU memory"""
 
-        cp.get_default_memory_pool().free_all_blocks()
+        self.bk.free()
+
+    def close(self):
+        """Stop backprojection workers"""
+
+        if self.shards is not None:
+            self.fdata = self.theta = self.obj_host = None
+            self.shards.close()
+            self.shards = None
 
     def set_dark(self, data):
         """Copy dark field (already averaged) to GPU"""
 
-        self.dark = cp.array(data.astype('float32'))        
+        self.dark = self.bk.to_device(data)        
+        self.rflat = self.reciprocal_flat()
         self.new_dark_flat = True
     
     def set_flat(self, data):
         """Copy flat field (already averaged) to GPU"""
 
-        self.flat = cp.array(data.astype('float32'))
+        self.flat = self.bk.to_device(data)
+        self.rflat = self.reciprocal_flat()
         self.new_dark_flat = True
+
+    def reciprocal_flat(self):
+        """Reciprocal of the flat field with subtracted dark field, computed once for new dark or flat fields"""
+
+        return 1/self.xp.maximum(self.flat-self.dark, 1e-6)
     
-    def backprojection(self, data, theta):
-        """Compute backprojection to orthogonal slices"""
+    def slice_rows(self, name, pars):
+        """Band of detector rows [start, end) used for reconstructing the ortho-slice"""
+
+        if name == 'orthoz':
+            # rows of the rotated plane as in the orthoz kernel
+            t = np.arange(self.n, dtype='float32') - self.n//2
+            zr = -t*np.sin(np.float32(pars['rotz'])) + (pars['idz']-self.nz//2)*np.cos(np.float32(pars['rotz'])) + self.nz//2
+            # planes of the slab are shifted by up to (k-1)/2 along the normal (sin, 0, cos) of the slice
+            dz = (max(int(pars.get('slab', 1)), 1)-1)/2*abs(np.cos(np.float32(pars['rotz'])))
+            inside = (zr + dz >= 0) & (zr - dz <= self.nz-1)
+            if not inside.any():
+                return (0, 0)
+            zmin = max(zr[inside].min() - dz, 0)
+            zmax = min(zr[inside].max() + dz, self.nz-1)
+            return (int(np.floor(zmin+0.5)), int(np.floor(zmax+0.5))+1)
+        zstart = min(max(int(pars.get('zstart', 0)), 0), self.nz)
+        zend = min(int(pars.get('zend', self.nz)), self.nz)
+        return (zstart, max(zstart, zend))
+
+    def rows_band(self, pars, slices):
+        """Band of detector rows [start, end) used by all slices"""
+
+        bands = [self.slice_rows(name, pars) for name in slices]
+        bands = [band for band in bands if band[1] > band[0]]
+        if len(bands) == 0:
+            return (0, 0)
+        return (min(band[0] for band in bands), max(band[1] for band in bands))
+
+    def band_padding(self):
+        """Number of additional rows on each side of the band needed for filters mixing rows"""
+
+        pad = 0
+        if(int(self.pars['dezinger'])>0):
+            pad += int(self.pars['dezinger'])
+        if(self.pars['alpha']>0):
+            pad += retrieve_phase.support_width(self.pars['pixelsize']*1e-4, self.pars['dist']/10, self.pars['energy'])
+        return pad
+
+    def processed_rows(self):
+        """Detector rows processed for the band, with padding rows for filters mixing rows"""
+
+        pad = self.band_padding()
+        return np.s_[max(self.band[0]-pad, 0):min(self.band[1]+pad, self.nz)]
+
+    def ring_removal(self):
+        """Check if rings are removed"""
+
+        return int(self.pars.get('ringremoval', 0)) > 0
+
+    def slice_planes(self, slices):
+        """Planes of ortho-slices for the fused kernel, with their places in the concatenated array.
+        X-Y slices have rows in the [zstart, zend) range, with the slab thickness k every slice is 
+        given by k consecutive parallel planes"""
+
+        k = max(int(self.pars.get('slab', 1)), 1)
+        geometry = []
+        places = []
+        for name in slices:
+            axis = name[-1]
+            region = self.regions[name]
+            zstart = 0
+            if name != 'orthoz':
+                zstart, zend = self.slice_rows(name, self.pars)
+                if zend <= zstart:
+                    continue
+                region = np.s_[zstart:zend, region[1]]
+            plane = planes.ortho(name, self.n, self.nz, self.pars['id'+axis], self.pars['rot'+axis], zstart)
+            geometry.append(planes.slab(plane, k))
+            places.append(region)
+        return geometry, places
+
+    def backprojection(self, data, theta, slices=ortho_slices):
+        """Compute backprojection to orthogonal slices, regions of other slices are left zero.
+        All slices are computed by the fused kernel reading projections once, 
+        slices of a slab are averaged"""
 
-        obj = cp.zeros([self.n, 3*self.n], dtype='float32') # ortho-slices are concatenated to one 2D array        
-        obj[:self.n,         :self.n  ] = kernels.orthoz(data, theta, self.pars['center'], self.pars['idz'], self.pars['rotz'])
-        obj[:self.nz, self.n  :2*self.n] = kernels.orthoy(data, theta, self.pars['center'], self.pars['idy'], self.pars['roty'])
-        obj[:self.nz , 2*self.n:3*self.n] = kernels.orthox(data, theta, self.pars['center'], self.pars['idx'], self.pars['rotx'])
+        obj = self.xp.zeros([self.n, 3*self.n], dtype='float32') # ortho-slices are concatenated to one 2D array        
+        geometry, places = self.slice_planes(slices)
+        if len(geometry) == 0:
+            return obj
+        k = len(geometry[0])
+        h = max(region[0].stop-(region[0].start or 0) for region in places)
+        res = self.bk.kernels.planes(data, theta, self.pars['center'], np.concatenate(geometry), h, self.n)
+        for m, region in enumerate(places):
+            rows = region[0].stop-(region[0].start or 0)
+            obj[region] = res[m*k:(m+1)*k, :rows].mean(axis=0)
         obj /= self.ntheta
         return obj
 
+    def planes_by_chunks(self, geometry, h, w):
+        """Backprojection of all filtered projections from the cache by chunks on GPU to arbitrary planes 
+        [nplanes, h, w] given by origins and axes [nplanes, 3, 3], see planes.py. Rows of planes outside 
+        the band of processed detector rows are zero"""
+
+        res = self.xp.zeros([len(geometry), h, w], dtype='float32')
+        for cids in self.slot_chunks(np.arange(self.ntheta)):
+            theta_gpu = self.bk.to_device(self.theta[cids])
+            res += self.bk.kernels.planes(self.cached_chunk(cids), theta_gpu*np.pi/180, self.pars['center'], geometry, h, w)
+        res /= self.ntheta
+        return res
+
     def fbp_filter(self, data):
-        """FBP filtering of projections"""
-
-        t = cp.fft.rfftfreq(self.n)
-        if (self.pars['fbpfilter']=='Parzen'):
-            wfilter = t * (1 - t * 2)**3    
-        elif (self.pars['fbpfilter']=='Ramp'):
-            wfilter = t
-        elif (self.pars['fbpfilter']=='Shepp-logan'):
-            wfilter = np.sin(t)
-        elif (self.pars['fbpfilter']=='Butterworth'):# todo: replace by other
-            wfilter = t / (1+pow(2*t,16)) # as in tomopy
-
-        wfilter = cp.tile(wfilter, [self.nz, 1])    
-        #data[:] = irfft(
-           #wfilter*rfft(data,overwrite_x=True, axis=2), overwrite_x=True, axis=2)
-        for k in range(data.shape[0]):# work with 2D arrays to save GPU memory
-            data[k] = irfft(
-                wfilter*rfft(data[k], overwrite_x=True, axis=1), overwrite_x=True, axis=1)
-
-    def darkflat_correction(self, data):
-        """Dark-flat field correction"""
+        """FBP filtering of projections, a whole chunk is filtered at once with a cached filter"""
+
+        filters.filter_bank.apply(data, self.pars['fbpfilter'], self.bk)
+
+    def darkflat_correction(self, data, rows=np.s_[:]):
+        """Dark-flat field correction in-place, data contains the given detector rows"""
         
-        tmp = cp.maximum(self.flat-self.dark, 1e-6)
-        for k in range(data.shape[0]):# work with 2D arrays to save GPU memory
-            data[k] = (data[k]-self.dark)/tmp
+        self.bk.kernels.normalize(data, self.dark[rows], self.rflat[rows])
 
     def minus_log(self, data):
-        """Taking negative logarithm"""
+        """Taking negative logarithm in-place"""
         
-        for k in range(data.shape[0]):# work with 2D arrays to save GPU memory
-            data[k] = -cp.log(cp.maximum(data[k], 1e-6))
+        self.bk.kernels.minus_log(data)
     
     def remove_outliers(self, data):
-        """Remove outliers"""
+        """Remove outliers in-place, pixels differing from the local mean over 
+        the (2r+1)x(2r+1) neighbourhood by more than a half of the mean"""
         
         if(int(self.pars['dezinger'])>0):
-            r = int(self.pars['dezinger'])            
-            fdata = ndimage.median_filter(data,[1,r,r])
-            ids = cp.where(cp.abs(fdata-data)>0.5*cp.abs(fdata))
-            data[ids] = fdata[ids]        
+            self.bk.kernels.dezinger(data, int(self.pars['dezinger']))
 
     def phase(self, data):
         """Retrieve phase"""
@@ -140,38 +310,159 @@ class Solver():
         if(self.pars['alpha']>0):
             #print('retrieve phase')
             data = retrieve_phase.paganin_filter(
-                data,  self.pars['pixelsize']*1e-4, self.pars['dist']/10, self.pars['energy'], self.pars['alpha'])
+                data,  self.pars['pixelsize']*1e-4, self.pars['dist']/10, self.pars['energy'], self.pars['alpha'], backend=self.bk)
   
-    def recon(self, data, theta):
-        """Reconstruction with the standard processing pipeline on GPU"""
+    def remove_rings(self, data):
+        """Remove stripes estimated from the running column statistics"""
+
+        if self.ring_removal():
+            data -= self.column_stats.stripes()
+
+    def normalize(self, data, rows=np.s_[:]):
+        """Dark-flat field correction, removing outliers, phase retrieval and taking negative logarithm.
+        Data contains the given detector rows"""
+
+        if(int(self.pars['dezinger'])==0 and self.pars['alpha']==0):
+            # dark-flat field correction and taking negative logarithm in one pass over the data
+            self.bk.kernels.normalize(data, self.dark[rows], self.rflat[rows], log=True)
+        else:
+            self.darkflat_correction(data, rows)
+            self.remove_outliers(data)
+            self.phase(data)
+            self.minus_log(data)
+
+    def preprocess(self, data, rows=np.s_[:]):
+        """Standard processing pipeline before backprojection: dark-flat field correction, 
+        removing outliers, phase retrieval, taking negative logarithm, ring removal and FBP filtering.
+        Data contains the given detector rows"""
         
-        self.darkflat_correction(data)
-        self.remove_outliers(data)
-        self.phase(data)
-        self.minus_log(data)
+        self.normalize(data, rows)
+        self.remove_rings(data)
         self.fbp_filter(data)
-        obj = self.backprojection(data, theta*np.pi/180)
-        return obj
 
-    def recon_by_chunks(self, data, theta):
-        """Reconstruction with splitting data by chunks processed on GPU"""
+    def update_column_stats(self, ids, sign=1):
+        """Add (sign=1) or remove (sign=-1) normalized projections from the buffer to the statistics
+        for ring removal, by chunks on GPU"""
+
+        rows = self.processed_rows()
+        for cids in self.slot_chunks(ids):
+            data_gpu = self.bk.to_device(self.data[cids, rows])
+            self.normalize(data_gpu, rows)
+            if sign > 0:
+                self.column_stats.add(data_gpu)
+            else:
+                self.column_stats.remove(data_gpu)
+
+    def preprocess_by_chunks(self, ids):
+        """Preprocess projections from the buffer by chunks on GPU, 
+        and store them in the cache of filtered projections. Only rows of the band are processed, 
+        together with padding rows for filters mixing rows"""
+    
+        if self.band[1] <= self.band[0]:
+            return
+        rows = self.processed_rows()
+        band = np.s_[self.band[0]-rows.start:self.band[1]-rows.start]
+        for cids in self.slot_chunks(ids):
+            data_gpu = self.bk.to_device(self.data[cids, rows])
+            self.preprocess(data_gpu, rows)
+            if self.fdata_on_device:
+                self.fdata[cids, self.band[0]:self.band[1]] = data_gpu[:, band]
+            else:
+                self.fdata[cids, self.band[0]:self.band[1]] = self.bk.to_host(data_gpu[:, band])
+
+    def backprojection_by_chunks(self, ids, slices=ortho_slices):
+        """Backprojection of filtered projections from the cache by chunks on GPU"""
     
-        obj = cp.zeros([self.n, 3*self.n], dtype='float32')# ortho-slices are concatenated to one 2D array                
-        nchunks = int(np.ceil(data.shape[0]/self.chunk))
-        for ichunk in range(nchunks):
-            data_gpu = cp.array(data[ichunk*self.chunk:min((ichunk+1)*self.chunk,data.shape[0])]).astype('float32')            
-            theta_gpu = cp.array(theta[ichunk*self.chunk:min((ichunk+1)*self.chunk,data.shape[0])]).astype('float32')
-            obj += self.recon(data_gpu,theta_gpu)
-            
+        obj = self.xp.zeros([self.n, 3*self.n], dtype='float32')# ortho-slices are concatenated to one 2D array                
+        for cids in self.slot_chunks(ids):
+            theta_gpu = self.bk.to_device(self.theta[cids])
+            obj += self.backprojection(self.cached_chunk(cids), theta_gpu*np.pi/180, slices)
         return obj
+
+    def cached_chunk(self, cids):
+        """Filtered projections of a chunk of slots from the cache on GPU"""
+
+        if self.band == (0, self.nz):
+            return self.xp.asarray(self.fdata[cids])
+        # copy only the band, rows outside are not used by kernels
+        data_gpu = self.xp.zeros([cids.stop-cids.start, self.nz, self.n], dtype='float32')
+        data_gpu[:, self.band[0]:self.band[1]] = self.xp.asarray(self.fdata[cids, self.band[0]:self.band[1]])
+        return data_gpu
+
+    def backproject(self, ids, slices, kind):
+        """Update ortho-slices with backprojection of filtered projections in the slots with the given ids,
+        kind is 'full' for replacing slices, 'add' or 'sub' for adding or subtracting backprojection.
+        With several workers, slots are backprojected by workers owning them to their partial reconstructions"""
+
+        if self.shards is not None:
+            self.shards.run(kind, ids, slices, self.pars, self.band)
+            return
+        obj = self.backprojection_by_chunks(ids, slices)
+        if kind == 'full':
+            for name in slices:
+                self.obj[self.regions[name]] = obj[self.regions[name]]
+        elif kind == 'add':
+            self.obj += obj
+        else:
+            self.obj -= obj
+
+    def volume_by_chunks(self, ids):
+        """Backprojection of filtered projections from the cache to the decimated volume by chunks on GPU"""
+
+        vol = self.xp.zeros(volume.shape(self.n, self.nz, self.vol_binning), dtype='float32')
+        for cids in self.slot_chunks(ids):
+            data_gpu = self.xp.asarray(self.fdata[cids])
+            theta_gpu = self.bk.to_device(self.theta[cids])
+            vol += volume.backprojection(data_gpu, theta_gpu*np.pi/180, self.pars['center'], self.vol_binning, self.bk)
+        vol /= self.ntheta
+        return vol
+
+    def volume_output(self):
+        """Decimated volume, or its maximum intensity projections, on the host for publishing"""
+
+        return self.bk.to_host(volume.output(self.rec_vol, self.pars.get('volume'), self.xp))
+
+    def slot_chunks(self, ids):
+        """Ranges of consecutive buffer slots with the given ids, split into chunks for processing on GPU.
+        Data of a chunk is taken from the buffer as a view"""
+
+        for slots, _ in util.contiguous_runs(ids):
+            for k in range(slots.start, slots.stop, self.chunk):
+                yield np.s_[k:min(k+self.chunk, slots.stop)]
+
+    def invalidated_stages(self, pars):
+        """Stages of the processing pipeline invalidated by changing parameters from self.pars to pars,
+        parameters missing in the invalidation graph invalidate preprocessing. 
+        Snapshots of parameters with the same version are not compared"""
+
+        stages = set()
+        version = getattr(pars, 'version', None)
+        if version is not None and version == self.pars_version:
+            return stages
+        for key in pars:
+            if key not in self.pars or np.any(pars[key] != self.pars[key]):
+                stages.update([stage for stage in stage_pars if key in stage_pars[stage]] or ['preprocessing'])
+        return stages
         
-    def recon_optimized(self, data, theta, ids, pars):
+    def recon_optimized(self, data, theta, ids, pars, out=None):
         """Optimized reconstruction of the object
         from the whole set of projections in the interval of size pi.
+        Filtered projections are kept in a cache for every buffer slot, so changes of parameters 
+        for backprojection (idx/idy/idz, rotx/roty/rotz, center) only recompute backprojection. 
         Resulting reconstruction is obtained by replacing the reconstruction part corresponding to incoming projections, 
-        objnew = objold + recon(datanew) - recon(dataold) whenever the number of incoming projections is less than half of the buffer size.
-        Reconstruction is done with using the whole buffer only when: the number of incoming projections is greater than half of the buffer size,
-        idx/idy/idz, center, fbpfilter are changed, or new dark/flat fields are acquired.
+        objnew = objold + backprojection(filter(datanew)) - backprojection(cached filter(dataold)) 
+        whenever the number of incoming projections is less than half of the buffer size and parameters are not changed.
+        Otherwise, backprojection is done by using the whole buffer. Ortho-slices are accumulated separately, 
+        and changing parameters of one slice (e.g. idx or rotx) recomputes only this slice. All projections in the buffer are filtered again
+        only when parameters of preprocessing (fbpfilter, dezinger, energy, dist, alpha, pixelsize) are changed, 
+        or new dark/flat fields are acquired. Only the band of detector rows used by the requested slices is processed,
+        e.g. for the Z slice or X-Y slices with a cropped range of rows; the whole buffer is filtered again when the band grows,
+        or when it changes with ring removal.
+        With ring removal, sums of normalized projections over the buffer are updated with the incoming and outgoing projections,
+        and incoming projections are corrected with the current estimate of stripes.
+        In the volume mode, the decimated volume rec_vol is updated in the same way as ortho-slices.
+        Times of preprocessing, backprojection and copying the result to the host are kept in timings,
+        and the kind of the update ('incremental' or 'full') in update_kind.
 
         Parameters
         ----------
@@ -180,8 +471,9 @@ class Solver():
         theta : np.array(nproj)
             Angles corresponding to the projection data
         ids : np.array(nproj)
-            Ids of the data in the circular buffer array
-        pars: dictionary contatining:
+            Ids of the data in the circular buffer array, runs of consecutive ids 
+            (e.g. from slots of the ring buffer, wrapping around the end of the buffer) are copied with one copy per run
+        pars: dictionary (or params.Snapshot with the version number) contatining:
             center : float32
                 Rotation center for reconstruction            
             idx, idy, idz: int32
@@ -190,8 +482,8 @@ class Solver():
                 Rotation angles for X-Y-Z slices
             fbpfilter: str
                 Reconstruction filter
-            dezinger: str
-                None or radius for removing outliers
+            dezinger: int
+                0 or radius for removing outliers
             energy: float32
                 Beam energy
             dist: float32
@@ -200,29 +492,117 @@ class Solver():
                 Tuning parameter for phase retrieval
             pixelsize: float32
                 Detector pixel size
+            ringremoval: int, optional
+                0 or 1 for removing rings
+        out : np.array, optional
+            Preallocated array for the result
 
         Return
         ----------
         obj: np.array(n,3*n) 
-            Concatenated reconstructions for X-Y-Z orthoslices
+            Concatenated reconstructions for X-Y-Z orthoslices, cropped, binned and quantized
+            on the device if publishing options are given in pars
         """
  
-        # recompute only by replacing a part of the data in the buffer, or by using the whole buffer
-        
-        recompute_part = not (pars!=self.pars or self.new_dark_flat or len(ids) > self.ntheta//2)        
-        if(recompute_part):            
-            # subtract old part
-            self.obj -= self.recon_by_chunks(self.data[ids], self.theta[ids])    
-        # update data in the buffer
-        self.data[ids] = data.reshape(data.shape[0], self.nz, self.n)
-        self.theta[ids] = theta
+        stages = self.invalidated_stages(pars)
+        slices = [name for name in ortho_slices if name[-1] in pars.get('slices', 'xyz')]
+        band = self.rows_band(pars, slices)
+        if volume.enabled(pars):
+            # the volume uses all rows
+            band = (0, self.nz)
+            vol_binning = volume.binning(self.n, self.nz, pars)
+            if self.rec_vol is None or vol_binning != self.vol_binning:
+                stages.add('volume')
+                self.vol_binning = vol_binning
+        else:
+            self.rec_vol = None
+        if self.new_dark_flat or band[0] < self.band[0] or band[1] > self.band[1]:
+            stages.add('preprocessing')
+        if int(pars.get('ringremoval', 0)) > 0 and band != self.band:
+            # statistics for ring removal are kept over the processed rows of the old band
+            stages.add('preprocessing')
+        if 'preprocessing' in stages or len(ids) > self.ntheta//2:
+            stages.update(ortho_slices+['volume'])
         self.pars = pars.copy()
+        self.pars_version = getattr(pars, 'version', None)
         self.new_dark_flat = False
+        self.band = band
+        
+        # recompute slices only by replacing a part of the data in the buffer, or by using the whole buffer
+        slices_part = [name for name in slices if name not in stages]
+        slices_full = [name for name in slices if name in stages]
+        volume_part = self.rec_vol is not None and 'volume' not in stages
+        self.update_kind = 'full' if slices_full else 'incremental'
+        timer = metrics.Timer(self.bk)
+        self.timings = {}
+        if(slices_part):            
+            # subtract old part
+            self.backproject(ids, slices_part, 'sub')
+        if volume_part:
+            self.rec_vol -= self.volume_by_chunks(ids)
+        self.timings['backprojection'] = timer.lap()
+        if self.ring_removal() and 'preprocessing' not in stages:
+            self.update_column_stats(ids, -1)
+        # update data in the buffer, one copy for every run of consecutive ids
+        data = data.reshape(data.shape[0], self.nz, self.n)
+        for slots, index in util.contiguous_runs(ids):
+            self.data[slots] = data[index]
+            self.theta[slots] = theta[index]
 
-        if(recompute_part):
+        # filter new data, or the whole buffer if preprocessing was invalidated
+        if 'preprocessing' in stages:
+            if self.ring_removal():
+                rows = self.processed_rows()
+                self.column_stats.reset(rows.stop-rows.start, self.n)
+                self.update_column_stats(np.arange(self.ntheta))
+            self.preprocess_by_chunks(np.arange(self.ntheta))
+        else:
+            if self.ring_removal():
+                self.update_column_stats(ids)
+            self.preprocess_by_chunks(ids)
+        self.timings['preprocessing'] = timer.lap()
+
+        if(slices_part):
             # add new part
-            self.obj += self.recon_by_chunks(self.data[ids], self.theta[ids])    
-        else:        
-            self.obj = self.recon_by_chunks(self.data, self.theta)    
+            self.backproject(ids, slices_part, 'add')
+        if(slices_full):
+            self.backproject(np.arange(self.ntheta), slices_full, 'full')
+        if volume_part:
+            self.rec_vol += self.volume_by_chunks(ids)
+        elif volume.enabled(pars):
+            self.rec_vol = self.volume_by_chunks(np.arange(self.ntheta))
+        if self.shards is not None:
+            # reduction of partial reconstructions in shared memory
+            self.shards.reduce(self.obj_host)
+            if self.obj_host is not self.obj:
+                self.obj[:] = self.bk.to_device(self.obj_host)
+        for name in ortho_slices:
+            if name not in slices:
+                self.obj[self.regions[name]] = 0
+        self.timings['backprojection'] += timer.lap()
+
+        obj = self.bk.to_host(display.reduce(self.obj, self.pars, self.bk), out)
+        self.timings['copy'] = timer.lap()
+        return obj
+
+
+class ShardSolver(Solver):
+    """Solver of a backprojection worker, filtered projections and angles of the whole buffer
+    are taken from shared memory, see shards.py
+
+    Parameters
+    ----------
+    shared : shards.SharedArrays
+        Arrays fdata and theta shared with the solver preprocessing projections.
+    bk : backend
+        Array backend of the worker.
+    """
 
-        return self.obj.get()
+    def __init__(self, shared, bk):
+        self.bk = bk
+        self.xp = bk.xp
+        [ntheta, nz, n] = shared.fdata.shape
+        self.init_state(ntheta, n, nz, None)
+        self.fdata = shared.fdata
+        self.fdata_on_device = False
+        self.theta = shared.theta
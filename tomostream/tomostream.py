@@ -1,30 +1,64 @@
 from tomostream import util
 from tomostream import log
 from tomostream import solver
+from tomostream import params
+from tomostream import display
+from tomostream import volume
+from tomostream import metrics
+from tomostream.backend import host_mem_used
+from tomostream.center import CenterEstimator
+from tomostream.recorder import Recorder
+from tomostream.ringbuffer import RingBuffer
+from tomostream.ingest import FrameWriter, IngestProcess
+from tomostream.scheduler import Scheduler
+from tomostream.pipeline import BufferPool, Stage, StageStats
 from epics import PV
 import pvaccess as pva
 import numpy as np
-import queue
 import time
 import threading
 import signal
 import os
+# counters of the ring buffer: metrics and PVs
+ring_metrics = {
+    'received': ('frames_received_total', 'FramesReceived'),
+    'dropped': ('frames_dropped_total', 'FramesDropped'),
+    'lost': ('frames_lost_total', 'FramesLost'),
+    'out_of_order': ('frames_out_of_order_total', 'FramesOutOfOrder'),
+}
+# counters of the recorder: metrics and PVs
+record_metrics = {
+    'recorded': ('record_frames_total', 'RecordedFrames'),
+    'skipped': ('record_skipped_total', 'RecordSkipped'),
+}
+# PVs of mean stage times
+stage_pvs = {'preprocessing': 'PreprocessTime', 'backprojection': 'BackprojectionTime', 'copy': 'CopyTime',
+             'publish': 'PublishTime'}
+
 class TomoStream():
     """ Class for streaming reconstuction of ortho-slices on a machine with GPU.
         The class creates and broadcasts a pva type pv for concatenated reconstructions 
         of (x,y,z) ortho-slices. Reconstructons are done by the FBP formula 
         with direct discretization of the circular integral.
         Projection data is taken from the detector pv (pva type channel) 
-        and stored in a queue, dark and flat fields are taken from the pv broadcasted 
+        and stored in a preallocated ring buffer, dark and flat fields are taken from the pv broadcasted 
         by the server on the detector machine (see tomoscan_stream.py from Tomoscan package).
         
         Parameters
         ----------
         args : dict
             Dictionary of pv variables.
+        backend : str
+            Array backend for reconstruction: 'cupy' (GPU), 'numpy' or 'numba' (CPU), or 'auto'
+        ingest_process : bool
+            Subscribe to the detector pv in a dedicated process writing frames to a ring buffer in shared memory
+        ingest_cpus : list
+            Cores the ingest process is pinned to, the reconstruction process is pinned to the other cores
+        workers : int
+            Number of processes sharing backprojection by angles (1 for backprojection in the reconstruction process)
     """
 
-    def __init__(self, pv_files, macros):
+    def __init__(self, pv_files, macros, backend='auto', ingest_process=False, ingest_cpus=None, workers=1):
 
         log.setup_custom_logger("./tomostream.log")
 
@@ -58,7 +92,9 @@ class TomoStream():
         
         # pva type channel that contains projection and metadata
         image_pv_name = PV(self.epics_pvs['ImagePVAPName'].get()).get()
-        self.epics_pvs['PvaPImage']          = pva.Channel(image_pv_name + 'Image')
+        self.image_pv_name = image_pv_name + 'Image'
+        self.frame_type_pv_name = prefix + 'FrameType'
+        self.epics_pvs['PvaPImage']          = pva.Channel(self.image_pv_name)
         self.epics_pvs['PvaPDataType_RBV']   = PV(image_pv_name + 'DataType_RBV')
         self.pva_plugin_image = self.epics_pvs['PvaPImage']
         
@@ -71,14 +107,53 @@ class TomoStream():
         # run server for reconstruction pv
         recon_pva_name = self.epics_pvs['ReconPVAName'].get()
         self.server_rec = pva.PvaServer(recon_pva_name, self.pv_rec)
+        # pv for the decimated volume or its maximum intensity projections, served by the same server
+        self.pv_vol = pva.PvObject(pva_image_dict)
+        self.server_rec.addRecord(self.epics_pvs['VolumePVAName'].get(), self.pv_vol)
 
         self.epics_pvs['StartRecon'].put('Done')
         self.epics_pvs['AbortRecon'].put('Yes')
         
         self.epics_pvs['StartRecon'].add_callback(self.pv_callback)
         self.epics_pvs['AbortRecon'].add_callback(self.pv_callback)
+        self.epics_pvs['Record'].put('Stop')
+        self.epics_pvs['Record'].add_callback(self.pv_callback)
+
+        # reconstruction parameters and frame type followed by callbacks instead of reading PVs in loops
+        self.pars = params.Parameters(self.epics_pvs)
+        self.scheduler_pars = params.Parameters(self.epics_pvs, params.scheduler_pvs)
+        self.center_pars = params.Parameters(self.epics_pvs, params.center_pvs)
+        self.frame_type = self.epics_pvs['FrameType'].get(as_string=True)
+        self.epics_pvs['FrameType'].add_callback(self.frame_type_callback)
         
         self.slv = None
+        self.center = None
+        # estimates differing from Center by less than this (in pixels) are not applied
+        self.center_deadband = 0.25
+        self.backend = backend
+        self.workers = workers
+        # frames are written to the ring buffer by the monitor callback or by the ingest process
+        self.writer = None
+        self.ingest = None
+        self.ingest_process = ingest_process
+        self.ingest_cpus = ingest_cpus
+        if ingest_process and ingest_cpus is not None:
+            os.sched_setaffinity(0, set(range(os.cpu_count()))-set(ingest_cpus))
+        # publishing reconstructions overlaps reconstructing the next batch
+        self.publisher = Stage('publish', self.publish)
+        self.compute_stats = StageStats('compute')
+        # performance counters published as PVs and written to the metrics file every report interval
+        self.metrics = metrics.Metrics()
+        self.ring_counts = {}
+        self.metrics_file = self.epics_pvs['MetricsFile'].get(as_string=True)
+        self.epics_pvs['MetricsFile'].add_callback(self.metrics_file_callback)
+        # recording of incoming projections with the active dark and flat fields, started and stopped by Record
+        self.recorder = None
+        self.record_counts = {}
+        self.dark = None
+        self.flat = None
+        # time between reports of the pipeline status in seconds
+        self.report_interval = 1
         self.first_projid = 0
         self.last_id = 0 # control the 65535 issue
         
@@ -96,6 +171,7 @@ class TomoStream():
         
                 
         self.stream_is_running = False # stream is running or stopped
+        self.stream_resumed = threading.Event() # set when streaming is not paused
         self.stream_pause = False # pause streaming 
         
 
@@ -141,6 +217,29 @@ class TomoStream():
         elif (pvname.find('AbortRecon') != -1) and (value == 0):
             thread = threading.Thread(target=self.abort_stream, args=())
             thread.start()          
+        elif (pvname.find('Record') != -1):
+            thread = threading.Thread(target=self.start_recording if value == 1 else self.stop_recording, args=())
+            thread.start()
+
+    @property
+    def stream_pause(self):
+        """Pause streaming, the reconstruction loop waits for resuming without polling"""
+
+        return not self.stream_resumed.is_set()
+
+    @stream_pause.setter
+    def stream_pause(self, value):
+        if value:
+            self.stream_resumed.clear()
+        else:
+            self.stream_resumed.set()
+        if hasattr(self, 'ingest'):
+            self.set_ingest_active()
+
+    def frame_type_callback(self, char_value=None, **kw):
+        """Keep the current frame type for checking incoming frames"""
+
+        self.frame_type = char_value
 
     def signal_handler(self, sig, frame):
         """Calls abort_scan when ^C or ^Z is typed"""
@@ -157,7 +256,12 @@ class TomoStream():
         """Reinit pv monitoring functions with updating data sizes"""
 
         log.warning('reinit monitors with updating data sizes')
+        # the recording file is allocated for old sizes
+        self.stop_recording()
+        # publish reconstructions with old sizes left in the pipeline
+        self.publisher.stop()
         # stop monitors
+        self.stop_ingest()
         self.pva_dark.stopMonitor()
         self.pva_flat.stopMonitor()
         self.pva_plugin_image.stopMonitor()                
@@ -203,29 +307,12 @@ class TomoStream():
             self.scan_type = 'backforth'        
             buffer_size = min(span_size,np.argmax(self.theta-self.theta[0]>180-(self.theta[1]-self.theta[0])))
         log.info(f'{buffer_size=},{span_size=}')
-        ## create a queue to store projections            
-        self.data_queue = queue.Queue(maxsize=buffer_size)
-        
         # take datatype        
         # datatype_list = self.epics_pvs['PvaPDataType_RBV'].get()['value']   
         # self.datatype = datatype_list['choices'][datatype_list['index']].lower()                
         self.datatype=self.epics_pvs['PvaPDataType_RBV'].get(as_string=True).lower()
 
-        pars = {}
-        pars['center'] = np.float32(self.epics_pvs['Center'].get())
-        pars['idx'] = np.int32(self.epics_pvs['OrthoX'].get())
-        pars['idy'] = np.int32(self.epics_pvs['OrthoY'].get())
-        pars['idz'] = np.int32(self.epics_pvs['OrthoZ'].get())
-        pars['rotx'] = np.float32(self.epics_pvs['RotX'].get()/180*np.pi)
-        pars['roty'] = np.float32(self.epics_pvs['RotY'].get()/180*np.pi)
-        pars['rotz'] = np.float32(self.epics_pvs['RotZ'].get()/180*np.pi)
-        pars['fbpfilter'] = self.epics_pvs['FilterType'].get(as_string=True)
-        pars['dezinger'] = self.epics_pvs['Dezinger'].get(as_string=False)
-        # phase retrieval
-        pars['energy'] = np.float32(self.epics_pvs['Energy'].get())
-        pars['dist'] = np.float32(self.epics_pvs['Distance'].get())
-        pars['alpha'] = np.float32(self.epics_pvs['Alpha'].get())
-        pars['pixelsize'] = np.float32(self.epics_pvs['PixelSize'].get())
+        pars = self.pars.get()
         # update parameters from in the GUI        
         if hasattr(self,'width'): # update parameters for new sizes 
             self.epics_pvs['Center'].put(pars['center']*width/self.width)
@@ -234,16 +321,34 @@ class TomoStream():
             self.epics_pvs['OrthoZ'].put(int(pars['idz']*width/self.width))
 
         ## create solver class on GPU        
-        self.slv = solver.Solver(buffer_size, width, height, pars, self.datatype)
+        if self.slv is not None:
+            self.slv.close()
+        self.slv = solver.Solver(buffer_size, width, height, pars, self.datatype, self.backend, self.workers)
+        self.center = CenterEstimator(buffer_size, width, height)
         
-        # temp buffers for storing data taken from the queue
-        self.proj_buffer = np.zeros([buffer_size, width*height], dtype=self.datatype)
-        self.theta_buffer = np.zeros(buffer_size, dtype='float32')
-        self.ids_buffer = np.zeros(buffer_size, dtype='int32')
+        # ring buffer for incoming projections, angles, and ids in the solver buffer
+        frames = dict(datatype=self.datatype, theta=self.theta, first_projid=self.first_projid,
+                      buffer_size=buffer_size, scan_type=self.scan_type, span_size=span_size)
+        if self.ingest_process:
+            self.ingest = IngestProcess(self.image_pv_name, self.frame_type_pv_name,
+                                        buffer_size, width*height, self.ingest_cpus, **frames)
+            self.ring = self.ingest.ring
+        else:
+            self.ring = RingBuffer(buffer_size, width*height, self.datatype)
+            self.writer = FrameWriter(self.ring, **frames)
+        self.scheduler = Scheduler(self.ring)
+        # counters of the new ring start from zero
+        self.ring_counts = dict.fromkeys(ring_metrics, 0)
+        self.frame_bytes = width*height*np.dtype(self.datatype).itemsize
+        # double buffered reconstructions, one is published while the other one is computed,
+        # buffers are allocated for float32 data and viewed with the shape and type of published data
+        self.outputs = BufferPool(2, [width*3*width*4], 'uint8')
 
         self.width = width
         self.height = height
         self.buffer_size = buffer_size
+        self.dark = None
+        self.flat = None
         self.span_size = span_size
         
         ## start PV monitoring
@@ -251,39 +356,57 @@ class TomoStream():
         self.pva_dark.monitor(self.add_dark,'')
         self.pva_flat.monitor(self.add_flat,'')        
         # start monitoring projection data        
-        self.pva_plugin_image.monitor(self.add_data,'')
+        if self.ingest is not None:
+            self.ingest.start()
+            self.set_ingest_active()
+        else:
+            self.pva_plugin_image.monitor(self.add_data,'')
         # start monitoring theta
         self.pva_theta.monitor(self.add_theta,'')
         self.update_theta = False
+        self.publisher.start()
+        self.compute_stats.reset()
 
     def add_data(self, pv):
-        """PV monitoring function for adding projection data and corresponding angle to the queue"""
+        """PV monitoring function for adding projection data and corresponding angle to the ring buffer,
+        data is copied once to the next slot of the ring"""
 
-        frame_type = self.epics_pvs['FrameType'].get(as_string=True)
         if(self.stream_is_running and 
             not self.stream_pause and
-            self.epics_pvs['FrameType'].get(as_string=True) == 'Projection'):
-            cur_id = np.uint32(pv['uniqueId'])-1 # unique projection id for determining angles and places in the buffers        , it starts from 1?
+            self.frame_type == 'Projection'):
             #cur_id+=65535*self.mul
             #if self.last_id>cur_id:
                 #print('change id')
                 #self.mul+=1       
                 #cur_id +=65535
                 #self.last_id = cur_id     
-            # write projection, theta, and id into the queue
-            data_item = {'projection': pv['value'][0][util.type_dict[self.datatype]],
-                        'theta': self.theta[min(cur_id-self.first_projid,len(self.theta)-1)],
-                        'id': cur_id%self.buffer_size
-            }
-            if self.scan_type == 'backforth' and (cur_id//self.span_size)%2 == 1:#filling the buffer array in the opposite direction
-                data_item['id'] = (self.span_size - cur_id%self.span_size - 1)%self.buffer_size
-
-            if(not self.data_queue.full()):
-                self.data_queue.put(data_item)
-            else:
-                log.warning("queue is full, skip frame")
-            log.info('id: %s, id after sync: %s, id in queue %s, first_projid %s, theta %s, type %s queue size %s', cur_id, cur_id-self.first_projid, data_item['id'], self.first_projid, self.theta[min(cur_id-self.first_projid,len(self.theta)-1)], frame_type, self.data_queue.qsize())
-            
+            # write projection, theta, and id into the ring buffer
+            self.writer.write(pv)
+
+    def sizes_changed(self):
+        """Data sizes were updated (e.g. after data binning by ROI1)"""
+
+        if self.ingest is not None:
+            return self.ingest.sizes_changed.is_set()
+        return self.writer.sizes_changed
+
+    def set_ingest_active(self):
+        """Let the ingest process write frames while streaming is running and not paused"""
+
+        if self.ingest is None:
+            return
+        if self.stream_is_running and not self.stream_pause:
+            self.ingest.active.set()
+        else:
+            self.ingest.active.clear()
+
+    def stop_ingest(self):
+        """Stop the ingest process and release its ring buffer"""
+
+        if self.ingest is not None:
+            self.ingest.stop()
+            self.ingest = None
+
     def add_dark(self, pv):
         """PV monitoring function for reading new dark fields from manually running pv server 
         on the detector machine"""
@@ -291,6 +414,10 @@ class TomoStream():
         if(self.stream_is_running and len(pv['value'])==self.width*self.height):  # if pv with dark field has cocrrect sizes
             data = pv['value'].reshape(self.height, self.width)
             self.slv.set_dark(data)
+            self.center.set_dark(data)
+            self.dark = data
+            if self.recorder is not None:
+                self.recorder.set_dark(data)
             log.warning('new dark fields acquired')
 
     
@@ -301,6 +428,10 @@ class TomoStream():
         if(self.stream_is_running and len(pv['value'])==self.width*self.height):  # if pv with flat has correct sizes
             data = pv['value'].reshape(self.height, self.width)
             self.slv.set_flat(data)
+            self.center.set_flat(data)
+            self.flat = data
+            if self.recorder is not None:
+                self.recorder.set_flat(data)
             log.warning('new flat fields acquired')
     
     def add_theta(self,pv):
@@ -309,7 +440,7 @@ class TomoStream():
         self.update_theta = True
 
     def begin_stream(self):
-        """Run streaming reconstruction by sending new incoming projections from the queue to the solver class,
+        """Run streaming reconstruction by sending new incoming projections from the ring buffer to the solver class,
         and broadcasting the reconstruction result to a pv variable
         """
 
@@ -320,63 +451,211 @@ class TomoStream():
 
         self.epics_pvs['ReconStatus'].put('Running')
         self.stream_is_running = True
-        pars = {}
+        self.set_ingest_active()
         while(self.stream_is_running):
-            if(self.stream_pause):
+            if(not self.stream_resumed.wait(self.scheduler.poll)):
                 continue
-            # take parameters from the GUI                
-            pars['center'] = np.float32(self.epics_pvs['Center'].get())
-            pars['idx'] = np.int32(self.epics_pvs['OrthoX'].get())
-            pars['idy'] = np.int32(self.epics_pvs['OrthoY'].get())
-            pars['idz'] = np.int32(self.epics_pvs['OrthoZ'].get())
-            pars['rotx'] = np.float32(self.epics_pvs['RotX'].get()/180*np.pi)
-            pars['roty'] = np.float32(self.epics_pvs['RotY'].get()/180*np.pi)
-            pars['rotz'] = np.float32(self.epics_pvs['RotZ'].get()/180*np.pi)
-            pars['fbpfilter'] = self.epics_pvs['FilterType'].get(as_string=True)
-            pars['dezinger'] = self.epics_pvs['Dezinger'].get(as_string=False)
-            # phase retrieval
-            pars['energy'] = np.float32(self.epics_pvs['Energy'].get())
-            pars['dist'] = np.float32(self.epics_pvs['Distance'].get())
-            pars['alpha'] = np.float32(self.epics_pvs['Alpha'].get())
-            pars['pixelsize'] = np.float32(self.epics_pvs['PixelSize'].get())
-            # take items from the queue
-            nitem = 0
-            while ((not self.data_queue.empty()) and (nitem < self.buffer_size)):
-                item = self.data_queue.get()
-                # reinit if data sizes were updated (e.g. after data binning by ROI1)
-                if(len(item['projection'])!=self.width*self.height) or (self.update_theta):
-                    #time.sleep(2)
-                    self.reinit_monitors()
-                    #time.sleep(2)
-                    nitem = 0
-                    break
-
-                self.proj_buffer[nitem] = item['projection']
-                self.theta_buffer[nitem] = item['theta']
-                self.ids_buffer[nitem] = item['id']                    
-               # log.warning(f'{nitem}, {self.theta_buffer[nitem]}, {self.ids_buffer[nitem]}')
-                nitem += 1
-            if(nitem == 0):
+            # reinit if data sizes or angles were updated (e.g. after data binning by ROI1)
+            if self.sizes_changed() or self.update_theta:
+                self.reinit_monitors()
                 continue
-        
-           # log.info(pars)
+            # wait for frames and coalesce them to a batch as set by the scheduling mode
+            spars = self.scheduler_pars.get()
+            if(self.scheduler.wait(spars['mode'], spars['minbatch'], spars['maxwait']) == 0):
+                continue
+            # take parameters from the GUI, the snapshot is updated by PV callbacks
+            pars = self.pars.get()
+            # take views of contiguous projections from the ring buffer
+            proj, theta, ids = self.ring.get(self.buffer_size)
+            nitem = len(ids)
+            # pair incoming projections with opposing ones before they are released
+            if self.center.update(proj, theta, ids) > 0:
+                pars = self.update_center(pars)
+            # queue projections for recording without waiting for the disk
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.put(proj, theta, self.ring.unique_ids(nitem))
+                if recorder.full and self.recorder is recorder:
+                    self.recorder = None
+                    threading.Thread(target=self.finish_recording, args=(recorder,)).start()
             
-            # reconstruct on GPU
+            # reconstruct on GPU to a free output buffer
+            buffer = self.outputs.get(self.compute_stats)
+            shape = display.shape(self.width, pars)
+            dtype = display.dtype(pars)
+            out = buffer[:np.prod(shape)*np.dtype(dtype).itemsize].view(dtype).reshape(shape)
+            t = time.perf_counter()
             util.tic()
-            rec = self.slv.recon_optimized(
-                self.proj_buffer[:nitem], self.theta_buffer[:nitem], self.ids_buffer[:nitem], pars)
+            rec = self.slv.recon_optimized(proj, theta, ids, pars, out)
+            self.ring.release(nitem)
             self.epics_pvs['ReconTime'].put(util.toc())
             self.epics_pvs['BufferSize'].put(f'{nitem}/{self.buffer_size}')                
-            
-            # orthogonal slices on
-            rec = util.ortholines(rec, pars)  
-
-            # write result to pv
-            self.pv_rec['value'] = ({'floatValue': rec.flatten()},)     
-
+            vol = self.slv.volume_output() if volume.enabled(pars) else None
+            self.compute_stats.busy += time.perf_counter()-t
+            self.compute_stats.items += 1
+            for stage, stage_time in self.slv.timings.items():
+                self.metrics.observe('stage_seconds', stage_time, stage=stage)
+            self.metrics.inc('recon_total', kind=self.slv.update_kind)
+
+            # hand over to the publishing thread
+            self.publisher.put((rec, buffer, pars, self.outputs, vol), self.compute_stats)
+            self.report_pipeline()
+
+        self.stop_recording()
+        self.stop_ingest()
+        self.publisher.stop()
+        self.slv.close()
         self.epics_pvs['StartRecon'].put('Done')           
         self.epics_pvs['ReconStatus'].put('Stopped')
         
+    def publish(self, item):
+        """Publishing stage: draw ortho-slice lines and write the reconstruction to the pv 
+        with the codec for its data type, then return the output buffer to the pool (also on errors). 
+        The volume (or its maximum intensity projections) is written to the volume pv"""
+
+        rec, buffer, pars, outputs, vol = item
+        t = time.perf_counter()
+        try:
+            # orthogonal slices on
+            rec = display.ortholines(rec, pars, self.width)  
+            # write result to pv
+            if rec.shape[0] != self.pv_rec['dimension'][1]['size']:
+                self.pv_rec['dimension'] = [{'size': rec.shape[1], 'fullSize': rec.shape[1], 'binning': 1},
+                                            {'size': rec.shape[0], 'fullSize': rec.shape[0], 'binning': 1}]
+            self.pv_rec['value'] = ({util.type_dict[str(rec.dtype)]: rec.ravel()},)     
+        finally:
+            # the buffer is returned also when publishing fails, so the compute loop does not wait for it
+            outputs.release(buffer)
+        if vol is not None:
+            self.pv_vol['dimension'] = [{'size': size, 'fullSize': size, 'binning': 1} for size in vol.shape[::-1]]
+            self.pv_vol['value'] = ({util.type_dict[str(vol.dtype)]: vol.ravel()},)
+        self.metrics.observe('stage_seconds', time.perf_counter()-t, stage='publish')
+
+    def update_center(self, pars):
+        """Publish the rotation center estimated from opposing projections, and apply it to Center
+        in the auto-apply mode if it is confident and differs from the current center.
+        Returns parameters for reconstructing the current batch"""
+
+        estimate = self.center.estimate
+        confidence = self.center.confidence
+        self.epics_pvs['CenterEstimate'].put(estimate)
+        self.epics_pvs['CenterConfidence'].put(confidence)
+        cpars = self.center_pars.get()
+        if (cpars['autoapply'] and confidence >= cpars['minconfidence'] 
+                and abs(estimate - pars['center']) > self.center_deadband):
+            log.info(f'apply estimated center {estimate:.2f}, confidence {confidence:.2f}')
+            self.epics_pvs['Center'].put(estimate)
+            # the Center callback makes a new snapshot for the next batches
+            pars = pars.copy()
+            pars['center'] = np.float32(estimate)
+        return pars
+
+    def report_pipeline(self):
+        """Report occupancy and stall times of pipeline stages, and start new measurements"""
+
+        if time.perf_counter()-self.compute_stats.start < self.report_interval:
+            return
+        status = f'{self.compute_stats}, {self.publisher.stats}'
+        self.epics_pvs['PipelineStatus'].put(status)
+        log.info(status)
+        self.report_metrics(time.perf_counter()-self.compute_stats.start)
+        self.compute_stats.reset()
+        self.publisher.stats.reset()
+
+    def report_metrics(self, elapsed):
+        """Update counters of frames from the ring buffer, publish performance counters as PVs,
+        and write them to the metrics file"""
+
+        m = self.metrics
+        received = self.ring.received - self.ring_counts['received']
+        for counter, (name, _) in ring_metrics.items():
+            value = getattr(self.ring, counter)
+            m.inc(name, value - self.ring_counts[counter])
+            self.ring_counts[counter] = value
+        m.set('ingest_bytes_per_second', received*self.frame_bytes/elapsed)
+        m.set('queue_depth', self.ring.pending(), queue='ring')
+        m.set('queue_depth', self.publisher.queue.qsize(), queue='publish')
+        if self.slv.bk.name == 'cupy':
+            m.set('memory_bytes', self.slv.bk.mem_used(), location='device')
+        m.set('memory_bytes', host_mem_used(), location='host')
+
+        for name, pv in ring_metrics.values():
+            self.epics_pvs[pv].put(m.get(name))
+        self.epics_pvs['QueueDepth'].put(m.get('queue_depth', queue='ring'))
+        self.epics_pvs['IngestRate'].put(m.get('ingest_bytes_per_second')/1e6)
+        for stage, name in stage_pvs.items():
+            self.epics_pvs[name].put(m.interval_mean('stage_seconds', stage=stage))
+        incremental = m.get('recon_total', kind='incremental')
+        self.epics_pvs['IncrementalRatio'].put(incremental/max(incremental + m.get('recon_total', kind='full'), 1))
+        self.epics_pvs['DeviceMemory'].put(m.get('memory_bytes', location='device')/1e6)
+        self.epics_pvs['HostMemory'].put(m.get('memory_bytes', location='host')/1e6)
+        recorder = self.recorder
+        if recorder is not None:
+            self.report_recording(recorder)
+            m.set('queue_depth', recorder.queue.pending(), queue='record')
+        if self.metrics_file:
+            try:
+                m.write(self.metrics_file)
+            except OSError as e:
+                log.error(f'metrics file: {e}')
+
+    def start_recording(self):
+        """Start recording incoming projections to RecordFile, the file is allocated for RecordMaxFrames"""
+
+        if self.recorder is not None:
+            return
+        if not self.stream_is_running:
+            self.epics_pvs['RecordStatus'].put('Streaming is not running')
+            self.epics_pvs['Record'].put('Stop')
+            return
+        file_name = self.epics_pvs['RecordFile'].get(as_string=True)
+        try:
+            recorder = Recorder(file_name, self.epics_pvs['RecordMaxFrames'].get(), self.height, self.width,
+                                self.datatype, self.epics_pvs['RecordFormat'].get(as_string=True),
+                                self.epics_pvs['RecordQueue'].get())
+        except (OSError, ImportError) as e:
+            log.error(f'recording: {e}')
+            self.epics_pvs['RecordStatus'].put(f'Error: {e}'[:255])
+            self.epics_pvs['Record'].put('Stop')
+            return
+        if self.dark is not None:
+            recorder.set_dark(self.dark)
+        if self.flat is not None:
+            recorder.set_flat(self.flat)
+        self.record_counts = dict.fromkeys(record_metrics, 0)
+        self.recorder = recorder
+        self.epics_pvs['RecordStatus'].put(f'Recording to {file_name}'[:255])
+
+    def stop_recording(self):
+        """Stop recording, frames in the queue are written before closing the file"""
+
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            self.finish_recording(recorder)
+
+    def finish_recording(self, recorder):
+        """Close the file of the recorder taken out of the reconstruction loop and report the recording"""
+
+        recorder.stop()
+        self.report_recording(recorder)
+        self.epics_pvs['RecordStatus'].put(f'Done: {recorder}'[:255])
+        self.epics_pvs['Record'].put('Stop')
+
+    def report_recording(self, recorder):
+        """Update counters of recorded and skipped frames"""
+
+        for counter, (name, pv) in record_metrics.items():
+            value = getattr(recorder, counter)
+            self.metrics.inc(name, value - self.record_counts[counter])
+            self.record_counts[counter] = value
+            self.epics_pvs[pv].put(value)
+        self.epics_pvs['RecordStatus'].put(f'Recording: {recorder}'[:255])
+
+    def metrics_file_callback(self, char_value=None, **kw):
+        """Keep the name of the metrics file"""
+
+        self.metrics_file = char_value
+
     def abort_stream(self):
         """Aborts streaming that is running.
         """
@@ -385,6 +664,7 @@ class TomoStream():
         if(self.slv is not None):
             self.slv.free()
         self.stream_is_running = False
+        self.set_ingest_active()
 
 
     def read_pv_file(self, pv_file_name, macros):
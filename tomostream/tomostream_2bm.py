@@ -8,9 +8,9 @@ class TomoStream_2BM(TomoStream):
     """ 2BM specific class for reconstruction 
     """
 
-    def __init__(self, pv_files, macros):
+    def __init__(self, pv_files, macros, backend='auto', ingest_process=False, ingest_cpus=None, workers=1):
 
-        super().__init__(pv_files, macros)
+        super().__init__(pv_files, macros, backend, ingest_process, ingest_cpus, workers)
 
         # # Define PVs we will need from the sample tomo0deg, tomo90deg, y motors, which is on another IOC
         self.epics_pvs['SampleTomo0degPosition']  = PV(self.epics_pvs['SampleTomo0degPVName'].get())
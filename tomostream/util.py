@@ -17,14 +17,41 @@ type_dict = {
 # add others
 }
 
-def ortholines(rec, pars):
+def radius(label):
+    """Radius from the label of a mbbo choice, e.g. 'Radius 2', 0 for 'None'"""
+    if label == 'None':
+        return 0
+    return int(label.split()[-1])
+
+def contiguous_runs(ids):
+    """Split ids into runs of consecutive values, ascending or descending (e.g. for back-and-forth scans).
+    Returns a list of (slots, index) slices, such that ids[index] is equal to range(slots.start, slots.stop),
+    so data for a run is moved with views instead of fancy indexing"""
+    ids = np.asarray(ids)
+    runs = []
+    start = 0
+    while start < len(ids):
+        end = start + 1
+        step = 1
+        if end < len(ids) and ids[end]-ids[start] == -1:
+            step = -1
+        while end < len(ids) and ids[end]-ids[end-1] == step:
+            end += 1
+        if step == 1:
+            runs.append((slice(int(ids[start]), int(ids[end-1])+1), slice(start, end)))
+        else:
+            runs.append((slice(int(ids[end-1]), int(ids[start])+1), slice(end-1, start-1 if start > 0 else None, -1)))
+        start = end
+    return runs
+
+def ortholines(rec, pars, value=np.nan):
     width = rec.shape[0]
-    rec[0:width,pars['idx']:pars['idx']+3] = np.nan
-    rec[pars['idy']:pars['idy']+3,0:width] = np.nan
+    rec[0:width,pars['idx']:pars['idx']+3] = value
+    rec[pars['idy']:pars['idy']+3,0:width] = value
 
-    rec[0:width,width+pars['idx']:width+pars['idx']+3] = np.nan
-    rec[pars['idz']:pars['idz']+3,width:2*width] = np.nan
+    rec[0:width,width+pars['idx']:width+pars['idx']+3] = value
+    rec[pars['idz']:pars['idz']+3,width:2*width] = value
 
-    rec[0:width,2*width+pars['idy']:2*width+pars['idy']+3] = np.nan
-    rec[pars['idz']:pars['idz']+3,2*width:3*width] = np.nan
+    rec[0:width,2*width+pars['idy']:2*width+pars['idy']+3] = value
+    rec[pars['idz']:pars['idz']+3,2*width:3*width] = value
     return rec
\ No newline at end of file
@@ -0,0 +1,69 @@
+'''
+    Streaming reconstruction of a decimated 3-D volume
+
+    Filtered projections are binned by the volume binning in both detector directions, and backprojected
+    to the stack of z slices of the volume by the fused planes kernel of the backend.
+    The binning is increased until the volume fits the memory budget. The volume is updated incrementally
+    together with ortho-slices, and published either as it is, or as maximum intensity projections
+    along z, y, x concatenated to one 2D array as ortho-slices.
+'''
+
+import numpy as np
+from tomostream import planes
+
+# publishing modes, as lowercased labels of the VolumeMode PV
+modes = ['off', 'volume', 'mip']
+
+
+def enabled(pars):
+    """Check if the volume is reconstructed"""
+
+    return pars.get('volume', 'off') != 'off'
+
+
+def binning(n, nz, pars):
+    """Binning of the volume: the requested binning, doubled until the volume fits the memory budget in MB"""
+
+    b = max(int(pars.get('volbinning', 4)), 1)
+    budget = float(pars.get('volmemory', 256))*1024**2
+    while b < min(n, nz) and shape(n, nz, b)[0]*shape(n, nz, b)[1]**2*4 > budget:
+        b *= 2
+    return b
+
+
+def shape(n, nz, b):
+    """Shape [nz, n, n] of the volume for binning b"""
+
+    return (max(nz//b, 1), max(n//b, 1), max(n//b, 1))
+
+
+def backprojection(data, theta, center, b, bk):
+    """Backprojection of filtered projections [ntheta, nz, n] to the volume binned by b,
+    values are scaled to match ortho-slices"""
+
+    xp = bk.xp
+    [ntheta, nz, n] = data.shape
+    [nzv, nv, _] = shape(n, nz, b)
+    data = data[:, :nzv*b, :nv*b].reshape(ntheta, nzv, b, nv, b).mean(axis=(2, 4))
+    # rotation center in binned detector pixels
+    center = np.float32((center-(b-1)/2)/b)
+    geometry = planes.slab(planes.ortho('orthoz', nv, nzv, 0, 0), nzv)
+    # z slices at rows 0, 1, .. of binned projections
+    geometry[:, 0, 2] -= geometry[0, 0, 2]
+    vol = bk.kernels.planes(xp.ascontiguousarray(data), theta, center, geometry, nv, nv)
+    vol *= np.float32(b)
+    return vol
+
+
+def output(vol, mode, xp):
+    """Volume for publishing: the volume itself, or maximum intensity projections along z, y, x
+    concatenated to [max(nz, n), 3n] for the 'mip' mode"""
+
+    if mode != 'mip':
+        return vol
+    [nzv, nv, _] = vol.shape
+    mip = xp.zeros([max(nzv, nv), 3*nv], dtype='float32')
+    mip[:nv, :nv] = vol.max(axis=0)
+    mip[:nzv, nv:2*nv] = vol.max(axis=1)
+    mip[:nzv, 2*nv:] = vol.max(axis=2)
+    return mip